@@ -6,12 +6,13 @@ import base64
 import os
 from pathlib import Path
 import json
-from typing import Union
+from typing import Optional, Union
 import asyncio
-from finzup_api.services import process_invoice, ProcessInvoiceResponse
-from finzup_api.models import InvoiceData
+from finzup_api.services import process_invoice, ProcessInvoiceResponse, settings
+from finzup_api.models import InvoiceData, ValidationReport
+from finzup_api.validation import validate_invoice
 
-def display_results(invoice_data: InvoiceData):
+def display_results(invoice_data: InvoiceData, validation: Optional[ValidationReport] = None):
     # Display total amount
     st.write(f"Total Amount: {invoice_data.totalAmountNis} NIS")
 
@@ -55,16 +56,22 @@ def display_results(invoice_data: InvoiceData):
     calculated_total = sum(item.totalPriceNis for item in invoice_data.items)
     st.write(f"Calculated Total: {calculated_total} NIS")
 
-    # Check if totals match or rounded match
-    tax_price = 1.18
-    if invoice_data.totalAmountNis:
-        exact_match = -1 >= (calculated_total - invoice_data.totalAmountNis) <= 1
-        tax_match = -1 >= (calculated_total * tax_price - invoice_data.totalAmountNis) <= 1
-
-        if exact_match or tax_match:
-            st.info("Invoice scanner are succeeded!")
-        else:
-            st.warning('Invoice scanner are failed, Total amount does not match calculated sum. Please verify manually.', icon="⚠️")
+    # Check item totals and the invoice total (net or with VAT)
+    if validation is None:
+        validation = validate_invoice(
+            invoice_data,
+            settings.VAT_RATES,
+            settings.VALIDATION_ITEM_TOLERANCE_NIS,
+            settings.VALIDATION_TOTAL_TOLERANCE_NIS
+        )
+    if validation.corrected_fields:
+        st.info(f"Re-read after a mismatch: {', '.join(validation.corrected_fields)}")
+    if validation.valid:
+        st.info("Invoice scanner are succeeded!")
+    else:
+        st.warning('Invoice scanner are failed, Total amount does not match calculated sum. Please verify manually.', icon="⚠️")
+        for issue in validation.issues:
+            st.write(f"- {issue.message}")
 
 
 def main():
@@ -112,7 +119,7 @@ def main():
                         st.error(f"Error processing invoice: {result.error}")
                     else:
                         st.success("Invoice processed successfully!")
-                        display_results(result.invoice_data)
+                        display_results(result.invoice_data, result.validation)
                         
                         # Save results to JSON
                         output_dir = Path('outputs')
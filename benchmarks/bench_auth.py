@@ -0,0 +1,82 @@
+"""Per-request auth overhead: JWT verification and bcrypt on or off the event loop.
+
+Times ``auth.verify_token`` with the verified-token cache disabled and
+enabled, then runs concurrent password checks inline and through
+``verify_password_async`` while measuring event-loop lag, which is what
+other requests feel while logins are being checked.
+
+    python -m benchmarks.bench_auth --verifications 20000 --logins 16 --rounds 12
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from finzup_api import auth
+from finzup_api.cache import MemoryCache, NullCache
+
+from .loadtest import monitor_loop_lag, percentile
+
+
+def time_verify_token(token: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        auth.verify_token(token)
+    return (time.perf_counter() - start) / iterations
+
+
+async def check_passwords(hashed: str, logins: int, off_loop: bool) -> List[float]:
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+    await asyncio.sleep(0.05)
+
+    async def login() -> None:
+        if off_loop:
+            await auth.verify_password_async("correct horse", hashed)
+        else:
+            auth.verify_password("correct horse", hashed)
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+    stop.set()
+    await monitor
+    return lag
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=20000)
+    parser.add_argument("--logins", type=int, default=16, help="Concurrent password checks; 0 skips bcrypt")
+    parser.add_argument("--rounds", type=int, default=auth.settings.BCRYPT_ROUNDS)
+    args = parser.parse_args()
+
+    token = auth.create_access_token("bench-user")
+    auth.token_cache = NullCache()
+    uncached = time_verify_token(token, args.verifications)
+    auth.token_cache = MemoryCache(max_entries=1024)
+    cached = time_verify_token(token, args.verifications)
+    print(f"verify_token   uncached {uncached * 1e6:8.1f} us/request")
+    print(f"verify_token   cached   {cached * 1e6:8.1f} us/request ({uncached / cached:.0f}x faster)")
+
+    if args.logins <= 0:
+        return
+    auth.settings.BCRYPT_ROUNDS = args.rounds
+    auth.get_pwd_context.cache_clear()
+    hashed = auth.get_password_hash("correct horse")
+    start = time.perf_counter()
+    auth.verify_password("correct horse", hashed)
+    print(f"bcrypt verify  rounds={args.rounds} {(time.perf_counter() - start) * 1e3:8.1f} ms")
+    for off_loop in (False, True):
+        start = time.perf_counter()
+        lag = await check_passwords(hashed, args.logins, off_loop)
+        elapsed = time.perf_counter() - start
+        label = "thread pool" if off_loop else "inline     "
+        print(
+            f"{args.logins} logins {label} {elapsed:6.2f}s total, "
+            f"loop lag p50 {percentile(lag, 50) * 1e3:7.1f} ms, max {max(lag, default=0) * 1e3:7.1f} ms"
+        )
+    auth.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
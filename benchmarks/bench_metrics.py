@@ -0,0 +1,75 @@
+"""Per-request overhead of the metrics middleware and stage timers.
+
+Calls a minimal ASGI app directly (no HTTP client, no network) with and
+without ``MetricsMiddleware``, and times ``metrics.stage`` on its own, so the
+numbers isolate the instrumentation cost.
+
+    python -m benchmarks.bench_metrics --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from finzup_api import metrics
+
+STAGES_PER_REQUEST = 6
+
+
+async def endpoint(request):
+    for _ in range(STAGES_PER_REQUEST):
+        with metrics.stage("bench"):
+            pass
+    return Response(b"ok")
+
+
+async def bare_endpoint(request):
+    return Response(b"ok")
+
+
+async def drive(app, requests: int) -> float:
+    scope = {
+        "type": "http", "method": "GET", "path": "/invoices/1", "raw_path": b"/invoices/1",
+        "query_string": b"", "headers": [], "http_version": "1.1", "scheme": "http",
+        "server": ("bench", 80), "client": ("bench", 1234), "root_path": "",
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    bare = Starlette(routes=[Route("/invoices/{invoice_id}", bare_endpoint)])
+    staged = Starlette(routes=[Route("/invoices/{invoice_id}", endpoint)])
+    instrumented = metrics.MetricsMiddleware(staged, server_timing=True)
+
+    for app in (bare, staged, instrumented):
+        asyncio.run(drive(app, 200))  # warm up
+    baseline = asyncio.run(drive(bare, args.requests))
+    with_stages = asyncio.run(drive(staged, args.requests))
+    with_middleware = asyncio.run(drive(instrumented, args.requests))
+
+    per_request = lambda total: total / args.requests * 1e6
+    print(f"{args.requests} requests, {STAGES_PER_REQUEST} stage timers each")
+    print(f"bare app              {per_request(baseline):7.2f} µs/request")
+    print(f"+ stage timers        {per_request(with_stages):7.2f} µs/request  (+{per_request(with_stages - baseline):.2f})")
+    print(f"+ middleware + header {per_request(with_middleware):7.2f} µs/request  (+{per_request(with_middleware - baseline):.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Bytes sent, tokens used and extraction accuracy with and without image normalization.
+
+Runs every invoice in a corpus directory through ``process_invoice`` twice, once
+with the raw upload and once through the normalization stage configured in
+Settings (IMAGE_*). When ``<name>.json`` sits next to ``<name>.pdf|png|jpg``,
+it is used as the expected ``InvoiceData`` to score field-level accuracy.
+Supplier templates and validation re-extraction are turned off, so both
+variants send the same prompts and make one model call per invoice.
+
+    python -m benchmarks.bench_preprocess data/invoices --concurrency 4
+
+This calls the configured model backend, so it spends real tokens.
+"""
+import argparse
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from finzup_api import services
+from finzup_api.preprocessing import ImageOptions
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, Any]:
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            out.update(flatten(item, f"{prefix}{key}."))
+        return out
+    if isinstance(value, list):
+        out = {}
+        for index, item in enumerate(value):
+            out.update(flatten(item, f"{prefix}{index}."))
+        return out
+    return {prefix.rstrip("."): value}
+
+
+def field_accuracy(expected: Dict[str, Any], actual: Optional[Dict[str, Any]]) -> float:
+    expected_fields = {k: v for k, v in flatten(expected).items() if v is not None}
+    if not expected_fields:
+        return 1.0
+    actual_fields = flatten(actual or {})
+    matched = sum(1 for key, value in expected_fields.items() if actual_fields.get(key) == value)
+    return matched / len(expected_fields)
+
+
+async def run_variant(files: List[Path], options: ImageOptions, concurrency: int) -> Dict[str, Any]:
+    services.image_options = options
+    semaphore = asyncio.Semaphore(concurrency)
+    totals = {"files": 0, "errors": 0, "uploaded_bytes": 0, "sent_bytes": 0, "input_tokens": 0, "total_tokens": 0}
+    accuracies = []
+
+    async def run(path: Path):
+        content = path.read_bytes()
+        async with semaphore:
+            result = await services.process_invoice(
+                content, path.suffix[1:].lower(), path.name, len(content), bypass_cache=True
+            )
+        totals["files"] += 1
+        totals["errors"] += 1 if result.error else 0
+        totals["uploaded_bytes"] += len(content)
+        totals["sent_bytes"] += result.preprocessing.get("sent_bytes", 0)
+        totals["total_tokens"] += services.get_total_tokens(result.usage_metadata)
+        totals["input_tokens"] += sum(
+            usage.get("input_tokens", 0) for usage in result.usage_metadata.values() if isinstance(usage, dict)
+        )
+        expected_path = path.with_suffix(".json")
+        if expected_path.exists():
+            expected = json.loads(expected_path.read_text(encoding="utf-8"))
+            actual = result.invoice_data.model_dump() if result.invoice_data else None
+            accuracies.append(field_accuracy(expected, actual))
+
+    await asyncio.gather(*(run(path) for path in files))
+    totals["accuracy"] = sum(accuracies) / len(accuracies) if accuracies else None
+    return totals
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path, help="directory with invoices (and optional expected .json files)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    files = sorted(
+        p for p in args.corpus.iterdir()
+        if p.suffix[1:].lower() in services.settings.ALLOWED_EXTENSIONS
+    )
+    if not files:
+        raise SystemExit(f"No invoices found in {args.corpus}")
+
+    # Templates learned in one pass would change the prompts of the next; re-reads add calls of their own
+    services.supplier_index = None
+    services.settings.VALIDATION_REEXTRACT = False
+    variants = {
+        "raw": ImageOptions(enabled=False),
+        "normalized": ImageOptions.from_settings(services.settings),
+    }
+    print(f"{len(files)} invoices, normalization: {variants['normalized'].model_dump_json()}")
+    print(f"{'variant':<11} {'sent MiB':>9} {'input tok':>10} {'total tok':>10} {'errors':>7} {'accuracy':>9}")
+    for name, options in variants.items():
+        stats = await run_variant(files, options, args.concurrency)
+        accuracy = f"{stats['accuracy']:.1%}" if stats["accuracy"] is not None else "n/a"
+        print(
+            f"{name:<11} {stats['sent_bytes'] / 2**20:>9.2f} {stats['input_tokens']:>10} "
+            f"{stats['total_tokens']:>10} {stats['errors']:>7} {accuracy:>9}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Per-request overhead of the quota middleware.
+
+Calls a minimal ASGI app directly (no HTTP client, no network) without
+``QuotaMiddleware``, with the in-memory store and, when fakeredis is
+installed, with the Redis store against an in-process fake server. Requests
+come from ``--tenants`` API keys in turn, with limits high enough that none is
+rejected, so the numbers are the cost of admitting and charging a request.
+
+    python -m benchmarks.bench_quotas --requests 20000 --tenants 1000
+"""
+import argparse
+import asyncio
+import importlib.util
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from finzup_api import quotas
+
+
+async def endpoint(request):
+    await quotas.charge_usage({"total_tokens": 1200})
+    return Response(b"ok")
+
+
+async def drive(app, requests: int, tenants: int) -> float:
+    scopes = [
+        {
+            "type": "http", "method": "POST", "path": "/api/v1/process-invoice", "raw_path": b"/api/v1/process-invoice",
+            "query_string": b"", "headers": [(b"x-api-key", f"fz_bench_{i}".encode())], "http_version": "1.1",
+            "scheme": "http", "server": ("bench", 80), "client": ("bench", 1234), "root_path": "",
+        }
+        for i in range(tenants)
+    ]
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(dict(scopes[i % tenants]), receive, send)
+    return time.perf_counter() - start
+
+
+def quota_app(app, store: quotas.QuotaStore) -> quotas.QuotaMiddleware:
+    return quotas.QuotaMiddleware(app, store=store, paths=["/api/v1"], budget_paths=["/api/v1/process-invoice"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--tenants", type=int, default=1000)
+    args = parser.parse_args()
+
+    limits = (1e9, 10**9, 10**15)
+    bare = Starlette(routes=[Route("/api/v1/process-invoice", endpoint, methods=["POST"])])
+    apps = {"no quotas": bare, "memory store": quota_app(bare, quotas.MemoryQuotaStore(*limits))}
+    if importlib.util.find_spec("fakeredis"):
+        from unittest import mock
+        import fakeredis
+
+        with mock.patch("redis.asyncio.from_url", lambda url: fakeredis.FakeAsyncRedis()):
+            apps["redis store (fakeredis)"] = quota_app(bare, quotas.RedisQuotaStore("redis://fake", *limits))
+
+    per_request = lambda total: total / args.requests * 1e6
+    print(f"{args.requests} requests from {args.tenants} tenants")
+    baseline = None
+    for label, app in apps.items():
+        asyncio.run(drive(app, 200, args.tenants))  # warm up
+        elapsed = asyncio.run(drive(app, args.requests, args.tenants))
+        baseline = baseline if baseline is not None else elapsed
+        print(f"{label:24s} {per_request(elapsed):8.2f} µs/request  (+{per_request(elapsed - baseline):.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Latency of concurrent uploads with inline vs pooled document rendering.
+
+Each simulated request renders a document and then awaits a fixed delay standing
+in for the model call, so rendering that blocks the event loop shows up as
+queueing latency for every other in-flight request.
+
+    python -m benchmarks.bench_render --requests 64 --concurrency 16 --pool-size 4
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+import fitz
+from PIL import Image
+
+from finzup_api import documents
+
+
+def make_scanned_pdf(pages: int, width: int = 2480, height: int = 3508) -> bytes:
+    # A4 at 300 DPI with a noisy full-page image, like a phone scan
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=buffer.getvalue())
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(mode: str, content: bytes, requests: int, concurrency: int, pool_size: int, model_delay: float):
+    documents.set_render_pool(documents.create_render_pool(mode, pool_size))
+    await documents.warm_up_render_pool()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request():
+        async with semaphore:
+            start = time.perf_counter()
+            await documents.run_prepare_document(content, "pdf")
+            await asyncio.sleep(model_delay)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    documents.shutdown_render_pool()
+    return {
+        "mode": mode,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": requests / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--model-delay", type=float, default=0.2, help="simulated model latency in seconds")
+    parser.add_argument("--modes", default="inline,thread,process")
+    args = parser.parse_args()
+
+    content = make_scanned_pdf(args.pages)
+    print(f"document: {len(content) / 1024:.0f} KiB, {args.pages} page(s)")
+    print(f"{'mode':<8} {'p50 ms':>10} {'p99 ms':>10} {'req/s':>8}")
+    for mode in args.modes.split(","):
+        stats = asyncio.run(run(mode, content, args.requests, args.concurrency, args.pool_size, args.model_delay))
+        print(f"{stats['mode']:<8} {stats['p50_ms']:>10.1f} {stats['p99_ms']:>10.1f} {stats['throughput_rps']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Audit payload size and throughput: inline output_data vs content-addressed results.
+
+Builds a synthetic audit history (``--rows`` rows, a ``--duplicate-rate``
+share of them re-uploads whose output repeats an earlier invoice) and
+compares the JSON sent to and stored by the database:
+
+* inline: every row carries ``output_data`` and the old ``input_data``
+  (with its ``file_name``/``file_size`` copies), as before migration 002;
+* keyed: rows carry ``output_key`` and each distinct result is stored once in
+  ``audit_results``, as JSON or zstd.
+
+It also times ``ResultStore.externalize`` on audit-writer batches and
+``rehydrate`` on 100-row listing pages against an in-memory table, cold and
+with the decoded-result cache. Sizes are of the JSON payloads; Postgres adds
+per-row overhead and compresses large jsonb values itself (TOAST), so on-disk
+savings differ somewhat.
+
+    python -m benchmarks.bench_results --rows 100000 --duplicate-rate 0.5
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from finzup_api.backends import FAKE_INVOICE
+from finzup_api.results import ResultStore
+
+PRODUCTS = ["אנרגי פריכיות", "קפה שחור", "חלב 3%", "לחם אחיד", "שמן זית", "גבינה לבנה", "ביצים L", "אורז פרסי"]
+
+
+class MemoryTable:
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+
+    async def save(self, rows):
+        for row in rows:
+            self.rows.setdefault(row["key"], row)
+
+    async def load(self, keys):
+        return [self.rows[key] for key in keys if key in self.rows]
+
+
+def make_invoice(rng: random.Random, number: int) -> Dict[str, Any]:
+    items = []
+    for _ in range(rng.randint(2, 25)):
+        quantity, price = rng.randint(1, 20), round(rng.uniform(1, 80), 2)
+        items.append({
+            "description": rng.choice(PRODUCTS), "quantity": quantity, "unitPriceNis": price,
+            "totalPriceNis": round(quantity * price, 2), "barcode": str(rng.randrange(7290000000000, 7299999999999)),
+        })
+    return {**FAKE_INVOICE, "invoiceNumber": number, "items": items,
+            "totalAmountNis": round(sum(item["totalPriceNis"] for item in items), 2)}
+
+
+def make_rows(rows: int, duplicate_rate: float, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    invoices: List[Dict[str, Any]] = []
+    history = []
+    for i in range(rows):
+        if invoices and rng.random() < duplicate_rate:
+            output = rng.choice(invoices)
+        else:
+            output = make_invoice(rng, 10_000_000 + i)
+            invoices.append(output)
+        file_name, file_size = f"invoice-{i}.pdf", rng.randint(50_000, 2_000_000)
+        history.append({
+            "user_id": None, "api_key": "3f2a9c1b7d6e5f40", "file_name": file_name, "file_size": file_size,
+            "num_pages": 1, "tokens_used": rng.randint(1500, 4000), "status": "success",
+            "created_at": "2025-01-01T10:00:00+00:00",
+            "input_data": {
+                "file_name": file_name, "file_size": file_size, "cached": output is not invoices[-1],
+                "document": {"file_type": "pdf", "num_pages": 1}, "preprocessing": {"bytes_in": file_size, "bytes_out": 180_000},
+                "validation": {"valid": True, "issues": [], "corrected_fields": []},
+            },
+            "output_data": output,
+            "error_message": None,
+        })
+    return history
+
+
+def slim(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The row as written now: no file_name/file_size copies in input_data."""
+    input_data = {k: v for k, v in row["input_data"].items() if k not in ("file_name", "file_size")}
+    return {**row, "input_data": input_data}
+
+
+def payload_size(rows) -> int:
+    return sum(len(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8")) for row in rows)
+
+
+async def externalize_all(store: ResultStore, rows: List[Dict[str, Any]], batch_size: int) -> List[Dict[str, Any]]:
+    written = []
+    for start in range(0, len(rows), batch_size):
+        written.extend(await store.externalize(rows[start:start + batch_size]))
+    return written
+
+
+async def rehydrate_all(store: ResultStore, rows: List[Dict[str, Any]], page_size: int) -> None:
+    for start in range(0, len(rows), page_size):
+        await store.rehydrate([dict(row) for row in rows[start:start + page_size]])
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=100, help="Audit writer batch size")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.duplicate_rate, args.seed)
+    slim_rows = [slim(row) for row in rows]
+    inline = payload_size(rows)
+    print(f"{args.rows} rows, duplicate rate {args.duplicate_rate:.0%}")
+    print(f"inline                 {inline / 1e6:8.1f} MB")
+
+    for compression in ("none", "zstd"):
+        table = MemoryTable()
+        store = ResultStore(table.save, table.load, compression=compression, cache_size=0)
+        start = time.perf_counter()
+        keyed = await externalize_all(store, slim_rows, args.batch_size)
+        write_time = time.perf_counter() - start
+        row_bytes = payload_size(keyed)
+        result_bytes = sum(len(result["data"].encode("utf-8")) for result in table.rows.values())
+        total = row_bytes + result_bytes
+        start = time.perf_counter()
+        await rehydrate_all(store, keyed, 100)
+        cold = time.perf_counter() - start
+        warm_store = ResultStore(table.save, table.load, cache_size=len(table.rows))
+        await rehydrate_all(warm_store, keyed, 100)
+        start = time.perf_counter()
+        await rehydrate_all(warm_store, keyed, 100)
+        warm = time.perf_counter() - start
+        print(
+            f"keyed ({compression:4s})          {total / 1e6:8.1f} MB ({total / inline:.0%}): rows {row_bytes / 1e6:.1f} MB "
+            f"+ {len(table.rows)} results {result_bytes / 1e6:.1f} MB; "
+            f"write {args.rows / write_time:9.0f} rows/s, read {args.rows / cold:9.0f} rows/s cold, "
+            f"{args.rows / warm:9.0f} rows/s cached"
+        )
+
+    page = slice(0, 100)
+    print(f"listing page of 100 with output_data: inline {payload_size(rows[page]) / 1e3:.1f} KB, "
+          f"keys only {payload_size(keyed[page]) / 1e3:.1f} KB before rehydration")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""Worker startup cost: import time, lifespan startup and time to first request.
+
+Each run happens in a fresh interpreter, so module caches and lazily built
+clients start cold the way they do in a new worker process. Reports the median
+over ``--runs``.
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --backend gemini   # include building the Gemini client
+
+The first request is a cached-invoice lookup that never leaves the process,
+so no tokens are spent whichever backend is configured.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+from finzup_api import main
+imported = time.perf_counter()
+
+import asyncio
+import httpx
+
+async def first_request():
+    async with main.lifespan(main.app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get(f"{main.settings.API_V1_STR}/cache/stats")
+            response.raise_for_status()
+        return started, time.perf_counter()
+
+started, answered = asyncio.run(first_request())
+print(json.dumps({
+    "import": imported - start,
+    "lifespan": started - imported,
+    "first_request": answered - started,
+    "total": answered - start,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="fake", help="LLM_BACKEND for the probe process")
+    args = parser.parse_args()
+
+    env = {**os.environ, "LLM_BACKEND": args.backend}
+    runs = [run_once(env) for _ in range(args.runs)]
+    print(f"{args.runs} cold starts, LLM_BACKEND={args.backend}")
+    for key in ("import", "lifespan", "first_request", "total"):
+        values = [run[key] for run in runs]
+        print(f"{key:<14} median {statistics.median(values) * 1000:8.1f} ms  max {max(values) * 1000:8.1f} ms")
+    print(f"{'modules':<14} {runs[0]['modules']}")
+
+
+if __name__ == "__main__":
+    main()
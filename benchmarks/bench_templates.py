@@ -0,0 +1,63 @@
+"""Supplier template lookup: multi-index hashing vs a linear scan over every fingerprint.
+
+Fills the index with random 64-bit fingerprints, then times lookups of
+known layouts (a stored fingerprint with a few bits flipped, as a rescan
+produces) and of unknown ones, which have to rule out every template.
+
+    python -m benchmarks.bench_templates --templates 50000 --lookups 2000 --distance 10
+"""
+import argparse
+import random
+import time
+
+from finzup_api.suppliers import HammingIndex, hamming
+
+
+def linear_search(fingerprints, query: int, max_distance: int):
+    return sorted((d, i) for i, fp in enumerate(fingerprints) if (d := hamming(query, fp)) <= max_distance)
+
+
+def flip_bits(value: int, bits: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--templates", type=int, default=50_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--distance", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    fingerprints = [rng.getrandbits(64) for _ in range(args.templates)]
+    start = time.perf_counter()
+    index = HammingIndex()
+    for i, fp in enumerate(fingerprints):
+        index.add(fp, i)
+    print(f"indexed {len(index)} templates in {time.perf_counter() - start:.2f}s")
+
+    queries = {
+        "known layout": [flip_bits(rng.choice(fingerprints), rng.randrange(args.distance // 2 + 1), rng)
+                         for _ in range(args.lookups)],
+        "unknown": [rng.getrandbits(64) for _ in range(args.lookups)],
+    }
+    for label, batch in queries.items():
+        start = time.perf_counter()
+        index_results = [index.search(q, args.distance) for q in batch]
+        index_time = (time.perf_counter() - start) / len(batch)
+        sample = batch[:max(1, len(batch) // 20)]
+        start = time.perf_counter()
+        linear_results = [linear_search(fingerprints, q, args.distance) for q in sample]
+        linear_time = (time.perf_counter() - start) / len(sample)
+        assert [sorted(r) for r in index_results[:len(sample)]] == linear_results
+        print(
+            f"{label:12s} indexed {index_time * 1e6:9.1f} us/lookup, linear {linear_time * 1e6:9.1f} us/lookup "
+            f"({linear_time / index_time:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Throughput of the production server with 1, 2 and 4 worker processes.
+
+Starts ``finzup_api.server`` on a free local port for each worker count,
+with the fake extraction backend, no result cache and a Supabase URL that
+refuses connections (audit rows spill to a temporary file). Concurrent
+clients then upload the same invoice over real HTTP. Each server is stopped
+with SIGTERM while a last wave of requests is still in flight, and every one
+of them must still succeed.
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --requests 400 --concurrency 32 --latency-ms 200
+
+The fake model call only sleeps, so extra workers pay off through rendering,
+normalization and request handling; on a machine with fewer cores than
+workers, expect no gain.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from .loadtest import percentile, sample_invoice
+
+API = "/api/v1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, latency_ms: float, spill_dir: str, server: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "LLM_BACKEND": "fake",
+        "FAKE_LATENCY_MS": str(latency_ms),
+        "FAKE_JITTER_MS": "0",
+        "LLM_MAX_CONCURRENCY": "1000",
+        "CACHE_BACKEND": "none",
+        "TEMPLATES_ENABLED": "false",
+        "QUOTA_BACKEND": "none",
+        "AUDIT_SPILL_PATH": os.path.join(spill_dir, "audit_spill.jsonl"),
+        "SECRET_KEY": os.environ.get("SECRET_KEY", "bench-secret"),
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_KEY": os.environ.get("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench"),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "finzup_api.server", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--server", server, "--graceful-timeout", "30"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 60) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            if (await client.get(f"{API}/cache/stats")).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError("Server did not start")
+
+
+async def drive(client: httpx.AsyncClient, content: bytes, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.post(
+                f"{API}/process-invoice", files={"file": ("invoice.jpg", content, "image/jpeg")}
+            )
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "throughput": requests / elapsed, "statuses": statuses,
+            "p50": percentile(latencies, 50), "p99": percentile(latencies, 99)}
+
+
+async def drain_on_sigterm(client: httpx.AsyncClient, process: subprocess.Popen, content: bytes, requests: int) -> Dict[int, int]:
+    """Send SIGTERM while ``requests`` uploads are in flight; returns their status codes."""
+    pending = [
+        asyncio.create_task(client.post(f"{API}/process-invoice", files={"file": ("invoice.jpg", content, "image/jpeg")}))
+        for _ in range(requests)
+    ]
+    await asyncio.sleep(0.1)
+    process.send_signal(signal.SIGTERM)
+    statuses: Dict[int, int] = {}
+    for result in await asyncio.gather(*pending, return_exceptions=True):
+        code = result.status_code if isinstance(result, httpx.Response) else 0
+        statuses[code] = statuses.get(code, 0) + 1
+    return statuses
+
+
+async def bench(workers: int, args: argparse.Namespace, content: bytes) -> Dict[str, Any]:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as spill_dir:
+        process = start_server(workers, port, args.latency_ms, spill_dir, args.server)
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+                startup = await wait_until_ready(client, process)
+                # Warm every worker's pools before measuring
+                await drive(client, content, args.concurrency * 2, args.concurrency)
+                stats = await drive(client, content, args.requests, args.concurrency)
+                stats["drain"] = await drain_on_sigterm(client, process, content, args.concurrency)
+            process.wait(timeout=120)
+            stats["exit_code"] = process.returncode
+        finally:
+            if process.poll() is None:
+                process.kill()
+    stats["startup"] = startup
+    return stats
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--server", choices=("auto", "gunicorn", "uvicorn"), default="auto")
+    args = parser.parse_args()
+
+    content = sample_invoice()
+    print(f"{os.cpu_count()} CPUs, {args.requests} requests, concurrency {args.concurrency}, "
+          f"fake latency {args.latency_ms:.0f} ms")
+    baseline = None
+    for workers in args.workers:
+        stats = await bench(workers, args, content)
+        baseline = baseline or stats["throughput"]
+        print(
+            f"workers {workers}: {stats['throughput']:7.1f} req/s ({stats['throughput'] / baseline:.2f}x)  "
+            f"p50 {stats['p50'] * 1000:7.1f} ms  p99 {stats['p99'] * 1000:7.1f} ms  "
+            f"ready in {stats['startup']:.1f}s  statuses {stats['statuses']}  "
+            f"SIGTERM with {args.concurrency} in flight: {stats['drain']}, exit {stats['exit_code']}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
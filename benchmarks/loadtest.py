@@ -0,0 +1,155 @@
+"""In-process load test of ``/process-invoice`` against the fake extraction backend.
+
+Concurrent clients upload the same invoice through the full ASGI stack
+(middleware, multipart parsing, rendering, normalization, audit writer) with
+the model call replaced by ``FakeBackend``, the result cache disabled and audit
+rows discarded. Nothing leaves the process, so this is safe to run in CI.
+
+    python -m benchmarks.loadtest --requests 500 --concurrency 50 --latency-ms 800
+
+Reports throughput, p50/p95/p99 request latency and event-loop lag (how late a
+periodic timer fires while the load is running).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Never build the Gemini client when the app is imported for a load test
+os.environ.setdefault("LLM_BACKEND", "fake")
+# One client address sends every request; per-tenant quotas would throttle it
+os.environ.setdefault("QUOTA_BACKEND", "none")
+
+from finzup_api import main as api, services
+from finzup_api.audit import AuditLogWriter
+from finzup_api.backends import FakeBackend
+from finzup_api.cache import NullCache
+from finzup_api.resilience import ResilientBackend
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def discard(logs: List[Dict[str, Any]]) -> None:
+    return None
+
+
+def use_fake_backend(latency: float, jitter: float, error_rate: float, seed: Optional[int]) -> FakeBackend:
+    """Point the app at a fake backend with no cache and a no-op audit sink.
+
+    The fake sits behind the same limiter, retries and circuit breaker as the
+    real backend, so injected 429s exercise them.
+    """
+    backend = FakeBackend(latency=latency, jitter=jitter, error_rate=error_rate, seed=seed)
+    services.backend = ResilientBackend.from_settings(backend, api.settings)
+    services.result_cache = NullCache()
+    api.audit_writer = AuditLogWriter(discard, max_batch_size=api.settings.AUDIT_BATCH_SIZE)
+    return backend
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def run_load_test(
+    content: bytes,
+    file_name: str,
+    requests: int,
+    concurrency: int,
+    content_type: str = "application/octet-stream"
+) -> Dict[str, Any]:
+    """Drive ``requests`` uploads with ``concurrency`` clients and collect latency stats."""
+    url = f"{api.settings.API_V1_STR}/process-invoice"
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lag: List[float] = []
+    remaining = iter(range(requests))
+
+    async with api.lifespan(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+
+            async def worker():
+                for _ in remaining:
+                    start = time.perf_counter()
+                    response = await client.post(url, files={"file": (file_name, content, content_type)})
+                    latencies.append(time.perf_counter() - start)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            stop = asyncio.Event()
+            monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await monitor
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "statuses": statuses,
+        "errors": sum(count for code, count in statuses.items() if code >= 400),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "loop_lag_p99": percentile(lag, 99),
+        "loop_lag_max": max(lag, default=0.0),
+    }
+
+
+def sample_invoice() -> bytes:
+    import io
+
+    from PIL import Image, ImageDraw
+
+    # A4 at 150 DPI with some "text" so normalization has real work to do
+    image = Image.new("RGB", (1240, 1754), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(40):
+        draw.text((100, 100 + row * 38), f"Item {row:02d}    {row * 3.5:>8.2f}    7290000{row:06d}", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", type=Path, help="invoice to upload (default: a generated A4 JPEG)")
+    args = parser.parse_args()
+
+    content = args.file.read_bytes() if args.file else sample_invoice()
+    file_name = args.file.name if args.file else "invoice.jpg"
+    use_fake_backend(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, args.seed)
+    stats = asyncio.run(run_load_test(content, file_name, args.requests, args.concurrency))
+
+    print(f"{stats['requests']} requests, concurrency {stats['concurrency']}, fake latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms")
+    print(f"throughput  {stats['throughput']:8.1f} req/s  ({stats['elapsed']:.2f} s)")
+    print(f"latency     p50 {stats['p50'] * 1000:7.1f} ms  p95 {stats['p95'] * 1000:7.1f} ms  p99 {stats['p99'] * 1000:7.1f} ms")
+    print(f"loop lag    p99 {stats['loop_lag_p99'] * 1000:7.1f} ms  max {stats['loop_lag_max'] * 1000:7.1f} ms")
+    print(f"statuses    {dict(sorted(stats['statuses'].items()))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import logging
+import secrets
+import time
+from datetime import datetime, UTC
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+API_KEY_PREFIX = "fz_"
+
+
+def generate_api_key() -> str:
+    return API_KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+def hash_api_key(api_key: str) -> str:
+    """What ``users.api_key`` stores; keys are random, so a fast unsalted hash is enough."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class ApiKeyPrincipal:
+    """The user behind a verified API key."""
+
+    __slots__ = ("user_id", "email", "key_hash")
+
+    def __init__(self, user_id: str, email: Optional[str], key_hash: str):
+        self.user_id = user_id
+        self.email = email
+        self.key_hash = key_hash
+
+    @property
+    def key_id(self) -> str:
+        # Short, non-secret identifier recorded in audit rows
+        return self.key_hash[:16]
+
+
+class ApiKeyIndex:
+    """In-memory map of hashed API keys to their users, so checking a key costs no database call.
+
+    ``load`` returns every user row with an ``api_key`` set. The index is
+    reloaded every ``refresh_interval`` seconds and right after
+    ``invalidate()``; an unknown key triggers an early reload at most once per
+    ``miss_refresh_interval`` seconds, so a key issued by another worker is
+    picked up quickly while garbage keys can't hammer the database.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        refresh_interval: float = 300.0,
+        miss_refresh_interval: float = 5.0
+    ):
+        self.load = load
+        self.refresh_interval = refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self._keys: Dict[str, ApiKeyPrincipal] = {}
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.failed_refreshes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run(), name="api-key-index")
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        # The first load happens on the first lookup, so apps that never see a key never query
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            if self._loaded_at is not None:
+                await self.refresh()
+
+    async def refresh(self) -> None:
+        """Reload the index; concurrent callers share one load."""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._refresh_lock:
+            if self._loaded_at is not None and self._loaded_at >= started:
+                return
+            try:
+                rows = await self.load()
+            except Exception:
+                # Keep serving the last good index
+                self.failed_refreshes += 1
+                logger.exception("Failed to reload API keys")
+                return
+            self._keys = {
+                row["api_key"]: ApiKeyPrincipal(str(row["id"]), row.get("email"), row["api_key"])
+                for row in rows
+                if row.get("api_key") and row.get("is_active", True)
+            }
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+
+    def invalidate(self, key_hash: Optional[str] = None) -> None:
+        """Schedule an immediate reload, e.g. after a key was issued or revoked.
+
+        A revoked ``key_hash`` stops working in this process right away.
+        """
+        if key_hash is not None:
+            self._keys.pop(key_hash, None)
+        self._loaded_at = None
+        if self.running:
+            asyncio.get_running_loop().create_task(self.refresh())
+
+    async def authenticate(self, api_key: str) -> Optional[ApiKeyPrincipal]:
+        key_hash = hash_api_key(api_key)
+        principal = self._keys.get(key_hash)
+        if principal is not None:
+            return principal
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.miss_refresh_interval:
+            await self.refresh()
+            return self._keys.get(key_hash)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._keys),
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+            "age_seconds": None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1),
+        }
+
+
+class LastUsedTracker:
+    """Coalesces ``api_key_last_used`` updates and writes them in one call per flush.
+
+    Only the latest use per user is kept between flushes; ``write`` receives
+    ``{user_id: used_at}`` every ``flush_interval`` seconds and on shutdown.
+    Failed writes are merged back so the next flush retries them.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Dict[str, datetime]], Awaitable[Any]],
+        flush_interval: float = 60.0
+    ):
+        self.write = write
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.written = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id: str) -> None:
+        self._pending[user_id] = datetime.now(UTC)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run(), name="api-key-last-used")
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self.write(batch)
+        except Exception:
+            logger.exception("Failed to update api_key_last_used for %d users", len(batch))
+            for user_id, used_at in batch.items():
+                if user_id not in self._pending:
+                    self._pending[user_id] = used_at
+            return
+        self.flushes += 1
+        self.written += len(batch)
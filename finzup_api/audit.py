@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so the spill file is only safe with one worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """Buffers audit rows in memory and writes them in batches off the request path.
+
+    A batch is flushed when ``max_batch_size`` rows are waiting or every
+    ``flush_interval`` seconds, through a single multi-row ``insert`` call.
+    Batches that fail to insert (or rows arriving while the buffer is full)
+    are appended to ``spill_path`` as JSON lines and replayed once the
+    database accepts writes again. Workers share the spill file: appends and
+    the read-and-remove of a replay hold an exclusive ``flock`` on
+    ``<spill_path>.lock``, so each spilled row is replayed by exactly one of them.
+    """
+
+    def __init__(
+        self,
+        insert: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        max_batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10_000,
+        spill_path: Optional[str] = None,
+        spill_retry_interval: float = 30.0
+    ):
+        self.insert = insert
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.spill_retry_interval = spill_retry_interval
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        # Rows that arrived while the buffer was full; spilled by the flush task, off the request path
+        self._overflow: List[Dict[str, Any]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._spill_pending = False
+        self._last_flush_failed = False
+        self._last_failure_at = 0.0
+
+        # Metrics
+        self.written = 0
+        self.spilled = 0
+        self.failed_flushes = 0
+        self.flushes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def queue_depth(self) -> int:
+        return len(self._buffer)
+
+    def submit(self, log: Dict[str, Any]) -> None:
+        """Queue one row without waiting for the database or the disk."""
+        if len(self._buffer) >= self.max_queue_size:
+            self._overflow.append(log)
+            if self._wakeup is not None:
+                self._wakeup.set()
+            return
+        self._buffer.append(log)
+        if self._wakeup is not None and len(self._buffer) >= self.max_batch_size:
+            self._wakeup.set()
+
+    def submit_many(self, logs: List[Dict[str, Any]]) -> None:
+        for log in logs:
+            self.submit(log)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run(), name="audit-log-writer")
+        await self.replay_spill()
+
+    async def stop(self) -> None:
+        """Stop the background task and drain everything still buffered.
+
+        The task is asked to finish rather than cancelled, so a batch being
+        written when shutdown starts is not lost.
+        """
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write out the whole buffer in batches of ``max_batch_size``."""
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            if self._overflow:
+                overflow, self._overflow = self._overflow, []
+                await asyncio.to_thread(self._spill, overflow)
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.max_batch_size, len(self._buffer)))]
+                await self._write(batch)
+
+    async def replay_spill(self) -> None:
+        """Re-queue rows spilled while the database was unavailable."""
+        self._spill_pending = False
+        if self.spill_path is None:
+            return
+        logs = await asyncio.to_thread(self._take_spill)
+        if not logs:
+            return
+        logger.info("Replaying %d spilled audit rows", len(logs))
+        # Goes through the normal path, so a still-failing database spills them again
+        self._buffer.extend(logs)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._buffer) + len(self._overflow),
+            "written": self.written,
+            "spilled": self.spilled,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_latency_ms": round(self.last_flush_latency * 1000, 3),
+            "avg_flush_latency_ms": round(self._total_flush_latency / self.flushes * 1000, 3) if self.flushes else 0.0,
+            "max_flush_latency_ms": round(self.max_flush_latency * 1000, 3),
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._spill_pending and (
+                not self._last_flush_failed
+                or time.monotonic() - self._last_failure_at >= self.spill_retry_interval
+            ):
+                await self.replay_spill()
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            await self.insert(batch)
+        except asyncio.CancelledError:
+            # Put the batch back for the drain on shutdown instead of dropping it
+            self._buffer.extendleft(reversed(batch))
+            raise
+        except Exception:
+            logger.exception("Failed to write %d audit rows, spilling to disk", len(batch))
+            self.failed_flushes += 1
+            self._last_flush_failed = True
+            self._last_failure_at = time.monotonic()
+            await asyncio.to_thread(self._spill, batch)
+            return
+        finally:
+            latency = time.perf_counter() - start
+            self.flushes += 1
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self._total_flush_latency += latency
+            metrics.stage_duration.observe(latency, stage="audit_write")
+        self._last_flush_failed = False
+        self.written += len(batch)
+
+    @contextmanager
+    def _spill_lock(self) -> Iterator[None]:
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path.with_name(self.spill_path.name + ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _take_spill(self) -> List[Dict[str, Any]]:
+        """Read and remove the spill file, including rows other workers spilled."""
+        with self._spill_lock():
+            if not self.spill_path.exists():
+                return []
+            with open(self.spill_path, "r", encoding="utf-8") as f:
+                logs = [json.loads(line) for line in f if line.strip()]
+            self.spill_path.unlink()
+        return logs
+
+    def _spill(self, logs: List[Dict[str, Any]]) -> None:
+        if self.spill_path is None:
+            logger.error("Dropping %d audit rows: no spill file configured", len(logs))
+            return
+        with self._spill_lock(), open(self.spill_path, "a", encoding="utf-8") as f:
+            for log in logs:
+                f.write(json.dumps(log, default=str, ensure_ascii=False) + "\n")
+        self.spilled += len(logs)
+        self._spill_pending = True
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import random
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import get_usage_metadata_callback
+from langchain_core.messages import BaseMessage
+
+from .config import Settings
+from .models import InvoiceCorrections, InvoiceData, ItemCorrection
+
+# Canned extraction returned by the fake backend
+FAKE_INVOICE = {
+    "invoiceNumber": 10088979,
+    "invoiceDate": "2024-02-25",
+    "supplier": {
+        "name": "אם ג'י. אם. פיקסל",
+        "address": {"street": "החרושת 4034", "city": "רעננה", "phone": "09-8010990"}
+    },
+    "recipient": {
+        "name": "מרקט תאטי",
+        "address": {"street": "9 זייגר האחים", "city": "לציון ראשון"}
+    },
+    "items": [
+        {"description": "אנרגי פריכיות", "quantity": 10, "unitPriceNis": 3.42, "totalPriceNis": 34.2, "barcode": "7290119371105"},
+        {"description": "קפה שחור", "quantity": 2, "unitPriceNis": 12.5, "totalPriceNis": 25.0, "barcode": "7290000066318"}
+    ],
+    "totalAmountNis": 59.2
+}
+
+# Gemini bills a fixed number of tokens per image tile; close enough for load tests
+FAKE_TOKENS_PER_IMAGE = 258
+
+
+def get_total_tokens(usage_metadata: dict) -> int:
+    """Total tokens in either a flat usage dict or the per-model dict from the usage callback."""
+    if "total_tokens" in usage_metadata:
+        return usage_metadata["total_tokens"]
+    return sum(
+        usage.get("total_tokens", 0)
+        for usage in usage_metadata.values()
+        if isinstance(usage, dict)
+    )
+
+
+class ExtractionBackend:
+    """Turns a multimodal invoice message into ``InvoiceData``.
+
+    ``extract`` returns the invoice and the token usage of the call, keyed by
+    model name like langchain's usage callback. ``extract_corrections`` does
+    the same for a focused re-read of a few fields. ``stream`` yields
+    ``(partial, usage)`` pairs: ``partial`` is the JSON output parsed so far,
+    and ``usage`` is None on every pair except the last, which carries the
+    complete output.
+    """
+
+    name = "base"
+
+    def warm_up(self) -> None:
+        """Build clients ahead of the first request; a no-op unless overridden."""
+
+    async def extract(self, messages: List[BaseMessage]) -> Tuple[InvoiceData, Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def extract_corrections(self, messages: List[BaseMessage]) -> Tuple[InvoiceCorrections, Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def stream(self, messages: List[BaseMessage]) -> AsyncIterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        invoice, usage = await self.extract(messages)
+        yield invoice.model_dump(mode="json"), usage
+
+
+class GeminiBackend(ExtractionBackend):
+    """Gemini through langchain's structured output.
+
+    The chat model and its structured-output runnables (JSON schema and tool
+    binding derived from ``InvoiceData``) are built once, on first use, and
+    shared by every request. Streaming binds the plain JSON schema so the
+    parser can emit partial objects as tokens arrive.
+    """
+
+    name = "gemini"
+
+    def __init__(self, settings: Settings):
+        self.model_name = settings.GEMINI_MODEL
+        self._runnable = None
+        self._stream_runnable = None
+        self._corrections_runnable = None
+        self._lock = threading.Lock()
+
+    def _build(self) -> None:
+        with self._lock:
+            if self._runnable is None:
+                # Importing the provider package is the slow part of startup
+                from langchain.chat_models import init_chat_model
+
+                # ResilientBackend retries with backoff and counts failures for the circuit
+                # breaker; the client's own retries would hide them and multiply the calls
+                model = init_chat_model(
+                    model=self.model_name, model_provider="google_genai", temperature=0, max_retries=0
+                )
+                self._stream_runnable = model.with_structured_output(InvoiceData.model_json_schema())
+                self._corrections_runnable = model.with_structured_output(InvoiceCorrections)
+                self._runnable = model.with_structured_output(InvoiceData)
+
+    @property
+    def runnable(self):
+        if self._runnable is None:
+            self._build()
+        return self._runnable
+
+    @property
+    def stream_runnable(self):
+        if self._runnable is None:
+            self._build()
+        return self._stream_runnable
+
+    @property
+    def corrections_runnable(self):
+        if self._runnable is None:
+            self._build()
+        return self._corrections_runnable
+
+    def warm_up(self) -> None:
+        self._build()
+
+    async def extract(self, messages):
+        with get_usage_metadata_callback() as cb:
+            response = await self.runnable.ainvoke(messages)
+        return response, cb.usage_metadata
+
+    async def extract_corrections(self, messages):
+        with get_usage_metadata_callback() as cb:
+            response = await self.corrections_runnable.ainvoke(messages)
+        return response, cb.usage_metadata
+
+    async def stream(self, messages):
+        partial = None
+        with get_usage_metadata_callback() as cb:
+            async for chunk in self.stream_runnable.astream(messages):
+                if partial is not None:
+                    yield partial, None
+                partial = chunk
+        if partial is None:
+            raise ValueError("Model returned no output")
+        yield partial, cb.usage_metadata
+
+
+class FakeBackendError(Exception):
+    """Injected failure; ``status_code`` mimics the provider's HTTP status."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeBackend(ExtractionBackend):
+    """Deterministic local backend for tests, benchmarks and load tests.
+
+    Sleeps ``latency`` ± ``jitter`` seconds, fails with probability
+    ``error_rate`` and otherwise returns a canned invoice with plausible
+    token usage. Corrections re-read every item and the total from the same
+    invoice. No network access.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        seed: Optional[int] = None,
+        invoice: Optional[Dict[str, Any]] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.invoice = InvoiceData.model_validate(invoice or FAKE_INVOICE)
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _usage(self, messages: List[BaseMessage], output: Optional[str] = None) -> Dict[str, Any]:
+        images = 0
+        text_chars = 0
+        for message in messages:
+            for part in message.content if isinstance(message.content, list) else [message.content]:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    images += 1
+                else:
+                    text_chars += len(str(part))
+        input_tokens = images * FAKE_TOKENS_PER_IMAGE + text_chars // 4
+        output_tokens = len(output if output is not None else self.invoice.model_dump_json()) // 4
+        return {
+            self.name: {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            }
+        }
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _maybe_fail(self) -> None:
+        if self._random.random() < self.error_rate:
+            raise FakeBackendError(f"Injected backend error ({self.error_status})", self.error_status)
+
+    async def extract(self, messages):
+        self.calls += 1
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._maybe_fail()
+        return self.invoice.model_copy(deep=True), self._usage(messages)
+
+    async def extract_corrections(self, messages):
+        self.calls += 1
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._maybe_fail()
+        corrections = InvoiceCorrections(
+            items=[
+                ItemCorrection(
+                    index=index,
+                    quantity=item.quantity,
+                    unitPriceNis=item.unitPriceNis,
+                    totalPriceNis=item.totalPriceNis
+                )
+                for index, item in enumerate(self.invoice.items)
+            ],
+            totalAmountNis=self.invoice.totalAmountNis
+        )
+        return corrections, self._usage(messages, corrections.model_dump_json())
+
+    async def stream(self, messages):
+        """Emit the header, then one more item per chunk, spreading the latency across them."""
+        self.calls += 1
+        self._maybe_fail()
+        data = self.invoice.model_dump(mode="json")
+        items = data.pop("items")
+        total = data.pop("totalAmountNis")
+        steps = len(items) + 2
+        delay = self._delay() / steps
+        for count in range(len(items) + 1):
+            await asyncio.sleep(delay)
+            yield {**data, "items": items[:count]}, None
+        await asyncio.sleep(delay)
+        yield {**data, "items": items, "totalAmountNis": total}, self._usage(messages)
+
+
+def load_fake_invoice(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_backend(settings: Settings) -> ExtractionBackend:
+    backend = settings.LLM_BACKEND.lower()
+    if backend == "gemini":
+        return GeminiBackend(settings)
+    if backend == "fake":
+        return FakeBackend(
+            latency=settings.FAKE_LATENCY_MS / 1000,
+            jitter=settings.FAKE_JITTER_MS / 1000,
+            error_rate=settings.FAKE_ERROR_RATE,
+            error_status=settings.FAKE_ERROR_STATUS,
+            seed=settings.FAKE_SEED,
+            invoice=load_fake_invoice(settings.FAKE_INVOICE_PATH)
+        )
+    raise ValueError(f"Unknown LLM backend: {settings.LLM_BACKEND}")
@@ -0,0 +1,282 @@
+"""Extract invoices from a directory (or globs) of files, resumably.
+
+    python -m finzup_api.batch ./archive --output results.jsonl
+    python -m finzup_api.batch 'scans/**/*.pdf' --output results.jsonl --format parquet
+
+Every processed file is appended to the JSONL output as soon as it finishes,
+and that file doubles as the checkpoint: rerunning the same command skips
+files already recorded there, so a killed run picks up where it stopped.
+Files the model backend was unavailable for are retried on the next run;
+other failures only with ``--retry-failed``.
+
+Concurrency is bounded by ``--concurrency``; model calls still go through the
+shared limiter, so the run proceeds at ``LLM_MAX_CONCURRENCY`` /
+``LLM_TOKENS_PER_MINUTE`` rather than one file at a time.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO
+
+from . import services
+from .backends import get_total_tokens
+from .documents import shutdown_render_pool, warm_up_render_pool
+from .export import ExportUnavailable, flatten_log, item_row_schema, require_pyarrow
+
+settings = services.settings
+
+# Records converted per Parquet row group
+PARQUET_CHUNK_SIZE = 1000
+
+
+def get_file_type(path: Path) -> str:
+    return path.suffix.lstrip(".").lower()
+
+
+def discover_files(inputs: Iterable[str], extensions: Set[str]) -> List[Path]:
+    """Expand directories (recursively) and glob patterns into supported files, sorted and deduplicated."""
+    found: Set[Path] = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            candidates = (p for p in Path(entry).rglob("*") if p.is_file())
+        else:
+            candidates = (Path(p) for p in glob.glob(entry, recursive=True) if os.path.isfile(p))
+        found.update(p.resolve() for p in candidates if get_file_type(p) in extensions)
+    return sorted(found)
+
+
+def load_checkpoint(output: Path, retry_failed: bool = False) -> Set[str]:
+    """Paths already recorded in ``output``; a partially written last line is cut off."""
+    done: Set[str] = set()
+    if not output.exists():
+        return done
+    with open(output, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # Killed mid-write: drop the torn record so appends start on a fresh line
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        status = record.get("status")
+        if status == "unavailable" or (retry_failed and status != "success"):
+            continue
+        done.add(record["path"])
+    return done
+
+
+def build_record(path: Path, result: services.ProcessInvoiceResponse) -> Dict[str, Any]:
+    if result.invoice_data is not None:
+        status = "success"
+    elif result.retry_after is not None:
+        status = "unavailable"
+    else:
+        status = "error"
+    return {
+        "path": str(path),
+        "file_name": path.name,
+        "status": status,
+        "error_message": result.error,
+        "warnings": result.warnings,
+        "num_pages": result.num_pages,
+        # Cached results carry the usage of the call that first produced them
+        "tokens_used": 0 if result.cached else get_total_tokens(result.usage_metadata),
+        "cached": result.cached,
+        "processed_at": datetime.now(UTC).isoformat(),
+        "output_data": result.invoice_data.model_dump(mode="json") if result.invoice_data else None,
+    }
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Progress:
+    """Throughput and ETA line, redrawn in place on a terminal and logged periodically otherwise."""
+
+    def __init__(self, total: int, stream: TextIO = sys.stderr, interval: float = 1.0):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.succeeded = 0
+        self.failed = 0
+        self.tokens = 0
+        self.start = time.monotonic()
+        self._last_report = 0.0
+        self._tty = stream.isatty()
+
+    @property
+    def done(self) -> int:
+        return self.succeeded + self.failed
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        rate = self.done / elapsed
+        eta = format_duration((self.total - self.done) / rate) if rate else "?"
+        return (
+            f"[{self.done}/{self.total}] {rate:.2f} files/s, {self.succeeded} ok, {self.failed} failed, "
+            f"{self.tokens} tokens, elapsed {format_duration(elapsed)}, ETA {eta}"
+        )
+
+    def update(self, record: Dict[str, Any]) -> None:
+        if record["status"] == "success":
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self.tokens += record["tokens_used"] or 0
+        now = time.monotonic()
+        if now - self._last_report >= self.interval or self.done == self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self) -> None:
+        self.stream.write(("\r" if self._tty else "") + self.line() + ("" if self._tty else "\n"))
+        self.stream.flush()
+
+    def finish(self) -> None:
+        if self._tty:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+async def run_batch(
+    files: List[Path],
+    output: Path,
+    concurrency: int,
+    bypass_cache: bool = False,
+    progress: Optional[Progress] = None
+) -> Progress:
+    """Process ``files`` with ``concurrency`` workers, appending one JSONL record per file to ``output``."""
+    progress = progress or Progress(len(files))
+    queue: asyncio.Queue[Path] = asyncio.Queue()
+    for path in files:
+        queue.put_nowait(path)
+
+    async def worker(out: TextIO) -> None:
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                content = await asyncio.to_thread(path.read_bytes)
+                result = await services.process_invoice(
+                    content, get_file_type(path), path.name, len(content), bypass_cache=bypass_cache
+                )
+            except Exception as e:
+                result = services.ProcessInvoiceResponse(invoice_data=None, error=str(e), usage_metadata={})
+            record = build_record(path, result)
+            # One write per record, flushed, so the checkpoint is never more than one file behind
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            progress.update(record)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "a", encoding="utf-8") as out:
+        await asyncio.gather(*(worker(out) for _ in range(max(1, min(concurrency, len(files) or 1)))))
+    return progress
+
+
+def read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """Latest record per source path; reruns append, so earlier attempts are superseded."""
+    latest: Dict[str, int] = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            if line.strip():
+                latest[json.loads(line)["path"]] = number
+    keep = set(latest.values())
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            if number in keep:
+                yield json.loads(line)
+
+
+def write_parquet(records: Iterable[Dict[str, Any]], destination: Path, chunk_size: int = PARQUET_CHUNK_SIZE) -> int:
+    """Write one row per line item (keyed by source path) in row groups of ``chunk_size`` records."""
+    pa = require_pyarrow()
+    schema = item_row_schema(pa)
+    schema = schema.set(schema.get_field_index("log_id"), pa.field("path", pa.string()))
+    schema = schema.set(schema.get_field_index("created_at"), pa.field("processed_at", pa.string()))
+    rows_written = 0
+
+    def flush(rows: List[Dict[str, Any]]) -> None:
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+    with pa.parquet.ParquetWriter(destination, schema) as writer:
+        rows: List[Dict[str, Any]] = []
+        for index, record in enumerate(records, 1):
+            for row in flatten_log({**record, "id": record["path"], "created_at": record["processed_at"]}):
+                row["path"] = row.pop("log_id")
+                row["processed_at"] = row.pop("created_at")
+                rows.append(row)
+            if index % chunk_size == 0:
+                flush(rows)
+                rows_written += len(rows)
+                rows = []
+        if rows:
+            flush(rows)
+            rows_written += len(rows)
+    return rows_written
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extract invoice data from many files, resumably")
+    parser.add_argument("inputs", nargs="+", help="Directories (searched recursively), files or glob patterns")
+    parser.add_argument("--output", "-o", type=Path, required=True, help="JSONL results file, also the checkpoint")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl",
+                        help="parquet also writes <output>.parquet with one row per line item")
+    parser.add_argument("--concurrency", "-c", type=int, default=settings.LLM_MAX_CONCURRENCY,
+                        help="Files processed at once (default: LLM_MAX_CONCURRENCY)")
+    parser.add_argument("--retry-failed", action="store_true", help="Reprocess files recorded as failed")
+    parser.add_argument("--bypass-cache", action="store_true", help="Skip result cache lookups")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> int:
+    files = discover_files(args.inputs, settings.ALLOWED_EXTENSIONS)
+    done = load_checkpoint(args.output, retry_failed=args.retry_failed)
+    pending = [path for path in files if str(path) not in done]
+    print(f"{len(files)} files found, {len(files) - len(pending)} already done, {len(pending)} to process",
+          file=sys.stderr)
+    if args.format == "parquet":
+        # Fail before spending model calls, not after
+        try:
+            require_pyarrow()
+        except ExportUnavailable as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    if pending:
+        await asyncio.to_thread(services.backend.warm_up)
+        await warm_up_render_pool()
+        try:
+            progress = await run_batch(pending, args.output, args.concurrency, bypass_cache=args.bypass_cache)
+        finally:
+            shutdown_render_pool()
+        progress.finish()
+
+    if args.format == "parquet":
+        destination = args.output.with_suffix(".parquet")
+        rows = await asyncio.to_thread(write_parquet, read_records(args.output), destination)
+        print(f"Wrote {rows} rows to {destination}", file=sys.stderr)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .config import Settings
+
+
+def make_cache_key(file_content: bytes, *parts: str) -> str:
+    """Content-addressed key: hash of the file bytes plus whatever shapes the result."""
+    digest = hashlib.sha256(file_content)
+    for part in parts:
+        digest.update(b"\x00")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CacheBackend:
+    """Base class for result caches. Values are JSON-serializable dicts."""
+
+    # Backends whose get/set do file or network I/O; the async wrappers run them in a thread
+    blocking = False
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl_seconds if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self._set(key, value, self._expires_at(ttl))
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        if self.blocking:
+            await asyncio.to_thread(self.set, key, value, ttl)
+        else:
+            self.set(key, value, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self),
+        }
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Dict[str, Any], expires_at: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    """Cache that never stores anything (CACHE_BACKEND=none)."""
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value, expires_at):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with a size bound and per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache(CacheBackend):
+    """One JSON file per key under a local directory; survives restarts."""
+
+    blocking = True
+
+    def __init__(self, directory: str, max_entries: int = 10_000, ttl_seconds: Optional[float] = None):
+        super().__init__(ttl_seconds)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._count = sum(1 for _ in self.directory.glob("*.json"))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            with self._lock:
+                self.evictions += 1
+            return None
+        # Touch so pruning evicts the least recently used entries first
+        os.utime(path)
+        return entry["value"]
+
+    def _set(self, key, value, expires_at):
+        path = self._path(key)
+        existed = path.exists()
+        # A unique temporary file per write: threads and forked workers may write the same key at once
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.directory, prefix=f"{key}.", suffix=".tmp", delete=False
+        ) as f:
+            json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+        os.replace(f.name, path)
+        with self._lock:
+            if not existed:
+                self._count += 1
+            over = self._count > self.max_entries
+        if over:
+            self._prune()
+
+    def _prune(self) -> None:
+        # Drop the oldest tenth in one pass instead of scanning on every write
+        files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        excess = len(files) - self.max_entries
+        for path in files[:max(excess, self.max_entries // 10)]:
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self._count = sum(1 for _ in self.directory.glob("*.json"))
+
+    def delete(self, key):
+        path = self._path(key)
+        if path.exists():
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self._count -= 1
+
+    def clear(self):
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._count = 0
+
+    def __len__(self):
+        return self._count
+
+
+def create_cache(settings: Settings) -> CacheBackend:
+    backend = settings.CACHE_BACKEND.lower()
+    ttl = settings.CACHE_TTL_SECONDS or None
+    if backend == "memory":
+        return MemoryCache(max_entries=settings.CACHE_MAX_ENTRIES, ttl_seconds=ttl)
+    if backend == "disk":
+        return DiskCache(settings.CACHE_DIR, max_entries=settings.CACHE_MAX_ENTRIES, ttl_seconds=ttl)
+    if backend == "none":
+        return NullCache()
+    raise ValueError(f"Unknown cache backend: {settings.CACHE_BACKEND}")
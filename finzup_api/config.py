@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional, Set
+from typing import List, Optional, Set
 import os
 
 class Settings(BaseSettings):
@@ -13,19 +13,131 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    TOKEN_CACHE_SIZE: int = 10_000  # verified tokens kept until they expire; 0 disables
+    BCRYPT_ROUNDS: int = 12  # cost factor for new hashes; existing hashes keep their own
+    AUTH_MAX_WORKERS: int = 4  # threads running bcrypt hash/verify
+
+    # API Keys (X-API-Key header)
+    API_KEY_REQUIRED: bool = False  # reject invoice requests without a valid key
+    API_KEY_REFRESH_SECONDS: float = 300  # reload the in-memory key index
+    API_KEY_MISS_REFRESH_SECONDS: float = 5  # earliest reload triggered by an unknown key
+    API_KEY_LAST_USED_FLUSH_SECONDS: float = 60  # api_key_last_used is written in batches this often
     
+    # Server (finzup-server)
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WEB_CONCURRENCY: Optional[int] = None  # worker processes; defaults to the usable CPU count
+    GRACEFUL_SHUTDOWN_SECONDS: float = 30  # on SIGTERM, for in-flight requests and again for queued jobs
+
+    # Tenant Quotas (per API key, user or client address)
+    QUOTA_BACKEND: str = "memory"  # "memory" (per worker), "redis" (shared by all workers) or "none"
+    QUOTA_REDIS_URL: str = "redis://localhost:6379/0"
+    QUOTA_REQUESTS_PER_SECOND: float = 10  # 0 disables the rate limit
+    QUOTA_BURST: int = 50
+    QUOTA_TOKENS_PER_HOUR: int = 2_000_000  # rolling model-token budget; 0 disables
+    QUOTA_MAX_TENANTS: int = 100_000  # memory backend forgets the least recently seen beyond this
+
     # Supabase
     SUPABASE_URL: str = os.getenv("SUPABASE_URL")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY")
+    DB_MAX_WORKERS: int = 8  # threads running blocking supabase requests
     
     # Google Gemini
-    GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY")
+    GOOGLE_API_KEY: Optional[str] = os.getenv("GOOGLE_API_KEY")
     GEMINI_MODEL: str = "gemini-2.5-flash-preview-04-17"
+
+    # Extraction Backend
+    LLM_BACKEND: str = "gemini"  # "gemini" or "fake" (local, no network)
+    FAKE_LATENCY_MS: float = 800
+    FAKE_JITTER_MS: float = 200
+    FAKE_ERROR_RATE: float = 0.0
+    FAKE_ERROR_STATUS: int = 429
+    FAKE_SEED: Optional[int] = None
+    FAKE_INVOICE_PATH: Optional[str] = None  # JSON InvoiceData returned by the fake backend
+
+    # Model Call Limits
+    LLM_MAX_CONCURRENCY: int = 8  # model calls in flight across the process
+    LLM_TOKENS_PER_MINUTE: int = 1_000_000  # 0 disables the token budget
+    LLM_ESTIMATED_TOKENS_PER_CALL: int = 2000  # reserved per call until actual usage is known
+    LLM_TIMEOUT_SECONDS: float = 60
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 8
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # consecutive transient failures before failing fast
+    LLM_CIRCUIT_RESET_SECONDS: float = 30
     
     # File Upload
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: Set[str] = {"pdf", "png", "jpg", "jpeg"}
-    
+
+    # Document Rendering
+    RENDER_EXECUTOR: str = "thread"  # "inline", "thread" or "process"
+    RENDER_POOL_SIZE: Optional[int] = None  # defaults to the CPU count
+
+    # Multi-page PDFs
+    PDF_RENDER_DPI: int = 150
+    PDF_MAX_PAGES: int = 10
+    PDF_PAGE_MODE: str = "per_page"  # "per_page" (concurrent calls, merged) or "combined" (one multi-image call)
+
+    # Image Normalization (applied before sending pages to the model)
+    IMAGE_PREPROCESS: bool = True
+    IMAGE_MAX_DIMENSION: int = 2048
+    IMAGE_GRAYSCALE: bool = False
+    IMAGE_FORMAT: str = "jpeg"  # "jpeg", "webp" or "png"
+    IMAGE_QUALITY: int = 85
+    IMAGE_AUTOCROP: bool = True
+
+    # Extraction Result Cache
+    CACHE_BACKEND: str = "memory"  # "memory", "disk" or "none"
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60  # 0 disables expiry
+    CACHE_DIR: str = ".cache/invoices"
+
+    # Batch Processing
+    BATCH_MAX_FILES: int = 500
+    BATCH_MAX_CONCURRENCY: int = 4
+    BATCH_MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024  # whole request body, zip archives included
+
+    # Audit Log Export
+    EXPORT_PAGE_SIZE: int = 500  # rows fetched per page while streaming an export
+
+    # Job Queue
+    JOB_WORKERS: int = 4
+    JOB_QUEUE_SIZE: int = 100
+    JOB_RESULT_TTL_SECONDS: int = 60 * 60
+    JOB_STORE_PATH: Optional[str] = ".cache/jobs.sqlite3"  # shared by the workers on a host; empty keeps jobs per process
+
+    # Arithmetic Validation
+    VALIDATION_ENABLED: bool = True  # check item and invoice totals after extraction
+    VALIDATION_REEXTRACT: bool = True  # ask the model again, for the failing fields only
+    VAT_RATES: List[float] = [0.18, 0.17]  # tried in order; 17% applied before 2025
+    VALIDATION_ITEM_TOLERANCE_NIS: float = 0.05
+    VALIDATION_TOTAL_TOLERANCE_NIS: float = 1.0
+
+    # Supplier Templates (few-shot hints learned from validated invoices)
+    TEMPLATES_ENABLED: bool = True
+    TEMPLATES_PATH: Optional[str] = ".cache/supplier_templates.jsonl"  # None keeps templates in memory only
+    TEMPLATE_MAX_DISTANCE: int = 10  # Hamming distance (of 64 bits) between header hashes of one layout
+    TEMPLATE_HEADER_FRACTION: float = 0.25  # top share of the first page that is fingerprinted
+    TEMPLATE_MAX_ITEMS: int = 30  # known items per supplier included in the hint
+    TEMPLATE_MAX_COUNT: int = 50_000
+
+    # Metrics
+    METRICS_ENABLED: bool = True  # per-route request metrics; stage timings are always recorded
+    SERVER_TIMING: bool = False  # add a Server-Timing header with per-stage durations
+
+    # Audit Log Writer
+    AUDIT_BATCH_SIZE: int = 100
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 1.0
+    AUDIT_QUEUE_SIZE: int = 10_000
+    AUDIT_SPILL_PATH: str = ".cache/audit_spill.jsonl"
+
+    # Audit Result Storage (each distinct output_data stored once, referenced by hash)
+    RESULT_COMPRESSION: str = "none"  # "none" or "zstd" (pip install 'finzup-api[zstd]')
+    RESULT_ZSTD_LEVEL: int = 3
+    RESULT_CACHE_SIZE: int = 1024  # decoded results kept for reading audit logs back
+    RESULT_KNOWN_KEYS: int = 100_000  # hashes this worker has stored, so duplicates skip the upsert
+
     class Config:
         env_file = ".env"
         case_sensitive = True
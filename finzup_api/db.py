@@ -1,35 +1,207 @@
-from supabase import create_client, Client
 from .config import get_settings
-from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Sequence, Tuple
 from datetime import datetime
+import asyncio
+import base64
+import json
+import threading
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 settings = get_settings()
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+
+# Created on first use; importing supabase and building the client is a noticeable
+# part of worker startup, and most tests never touch the database.
+_client: Optional["Client"] = None
+_client_lock = threading.Lock()
+
+def get_client() -> "Client":
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from supabase import create_client
+                _client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    return _client
+
+# The supabase client is synchronous; its requests run on a bounded pool of threads
+# sharing the client's HTTP connection pool, so they never block the event loop.
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.DB_MAX_WORKERS, thread_name_prefix="supabase")
+    return _executor
+
+async def execute(query):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), query.execute)
+
+def shutdown() -> None:
+    """Wait for in-flight requests and release the worker threads."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
 
 async def get_user(email: str) -> Optional[Dict[str, Any]]:
-    response = supabase.table("users").select("*").eq("email", email).execute()
+    response = await execute(get_client().table("users").select("*").eq("email", email))
     return response.data[0] if response.data else None
 
 async def create_user(user_data: Dict[str, Any]) -> Dict[str, Any]:
-    response = supabase.table("users").insert(user_data).execute()
+    response = await execute(get_client().table("users").insert(user_data))
     return response.data[0]
 
+# Users per request when loading the API key index
+API_KEY_PAGE_SIZE = 1000
+# Ids per last-used update; they travel in the URL, which proxies cap at a few KB
+API_KEY_UPDATE_CHUNK = 100
+
+async def list_api_keys() -> List[Dict[str, Any]]:
+    """Every user with an API key (hashed), for the in-memory key index."""
+    rows: List[Dict[str, Any]] = []
+    while True:
+        query = get_client().table("users")\
+            .select("id,email,is_active,api_key")\
+            .not_.is_("api_key", "null")\
+            .order("id")\
+            .range(len(rows), len(rows) + API_KEY_PAGE_SIZE - 1)
+        page = (await execute(query)).data
+        rows.extend(page)
+        if len(page) < API_KEY_PAGE_SIZE:
+            return rows
+
+async def touch_api_keys(last_used: Dict[str, datetime]) -> None:
+    """Set ``api_key_last_used`` for many users in one update.
+
+    All users in the batch get the latest timestamp, so values are accurate to
+    the flush interval rather than to the request.
+    """
+    if not last_used:
+        return
+    used_at = max(last_used.values()).isoformat()
+    user_ids = sorted(last_used)
+    for start in range(0, len(user_ids), API_KEY_UPDATE_CHUNK):
+        query = get_client().table("users")\
+            .update({"api_key_last_used": used_at})\
+            .in_("id", user_ids[start:start + API_KEY_UPDATE_CHUNK])
+        await execute(query)
+
 async def create_audit_log(log_data: Dict[str, Any]) -> Dict[str, Any]:
-    response = supabase.table("audit_logs").insert(log_data).execute()
+    response = await execute(get_client().table("audit_logs").insert(log_data))
     return response.data[0]
 
-async def get_audit_logs(user_id: str, limit: int = 100) -> list:
-    response = supabase.table("audit_logs")\
-        .select("*")\
-        .eq("user_id", user_id)\
-        .order("created_at", desc=True)\
-        .limit(limit)\
-        .execute()
+async def create_audit_logs(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not logs:
+        return []
+    response = await execute(get_client().table("audit_logs").insert(logs))
     return response.data
 
+# Result keys per lookup; the 64-character hashes travel in the URL
+RESULT_FETCH_CHUNK = 50
+
+async def store_results(results: List[Dict[str, Any]]) -> None:
+    """Insert extraction results into ``audit_results``; keys already stored are left as they are."""
+    if not results:
+        return
+    from postgrest.types import ReturnMethod
+    query = get_client().table("audit_results")\
+        .upsert(results, on_conflict="key", ignore_duplicates=True, returning=ReturnMethod.minimal)
+    await execute(query)
+
+async def get_results(keys: Sequence[str]) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for start in range(0, len(keys), RESULT_FETCH_CHUNK):
+        query = get_client().table("audit_results")\
+            .select("key,encoding,data")\
+            .in_("key", list(keys[start:start + RESULT_FETCH_CHUNK]))
+        rows.extend((await execute(query)).data)
+    return rows
+
+# Columns returned when listing audit logs; the input/output JSON blobs are fetched per log.
+# output_data is kept once per distinct result in audit_results, referenced by output_key.
+AUDIT_LOG_SUMMARY_COLUMNS = (
+    "id", "user_id", "file_name", "file_size", "num_pages", "tokens_used", "status", "created_at", "error_message"
+)
+AUDIT_LOG_COLUMNS = AUDIT_LOG_SUMMARY_COLUMNS + ("api_key", "input_data", "output_data", "output_key")
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque keyset cursor pointing just past ``row`` in (created_at, id) order."""
+    raw = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, log_id = json.loads(raw)
+        # Validates the timestamp; it is interpolated into the filter below
+        datetime.fromisoformat(created_at)
+        return created_at, str(log_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def _quote(value: str) -> str:
+    # PostgREST filter values containing ',', '.', ':' or parentheses must be double-quoted
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+async def list_audit_logs(
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    file_name: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    columns: Sequence[str] = AUDIT_LOG_SUMMARY_COLUMNS
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of audit logs, newest first, and the cursor of the next page (None on the last).
+
+    Pages are keyset-paginated on ``(created_at, id)`` so every page is an index
+    range scan, however deep into the history it is.
+    """
+    # The cursor needs the sort key of the last row, whatever was projected
+    selected = list(dict.fromkeys(["id", "created_at", *columns]))
+    if "output_data" in selected and "output_key" not in selected:
+        # Rows written since migration 002 hold only the key; the caller rehydrates them
+        selected.append("output_key")
+    query = get_client().table("audit_logs").select(",".join(selected))
+    if user_id is not None:
+        query = query.eq("user_id", user_id)
+    if status is not None:
+        query = query.eq("status", status)
+    if created_from is not None:
+        query = query.gte("created_at", created_from.isoformat())
+    if created_to is not None:
+        query = query.lt("created_at", created_to.isoformat())
+    if file_name:
+        query = query.ilike("file_name", f"*{file_name}*")
+    if cursor is not None:
+        created_at, log_id = decode_cursor(cursor)
+        query = query.or_(
+            f"created_at.lt.{_quote(created_at)},"
+            f"and(created_at.eq.{_quote(created_at)},id.lt.{_quote(log_id)})"
+        )
+    # One extra row tells us whether another page follows
+    query = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+    response = await execute(query)
+    rows = response.data
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+async def get_audit_log(log_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """One audit log; with ``user_id``, only if it belongs to that user."""
+    query = get_client().table("audit_logs").select("*").eq("id", log_id)
+    if user_id is not None:
+        query = query.eq("user_id", user_id)
+    response = await execute(query.limit(1))
+    return response.data[0] if response.data else None
+
 async def update_user(user_id: str, user_data: Dict[str, Any]) -> Dict[str, Any]:
-    response = supabase.table("users")\
+    query = get_client().table("users")\
         .update(user_data)\
-        .eq("id", user_id)\
-        .execute()
+        .eq("id", user_id)
+    response = await execute(query)
     return response.data[0] 
\ No newline at end of file
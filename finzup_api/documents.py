@@ -0,0 +1,212 @@
+import asyncio
+import base64
+import io
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import fitz  # PyMuPDF for PDF processing
+from PIL import Image
+from pydantic import BaseModel, Field
+
+from .config import get_settings
+from .preprocessing import ImageOptions, normalize_image
+from .suppliers import dhash
+
+settings = get_settings()
+
+
+class ParsedDocument:
+    """An uploaded invoice opened once per request.
+
+    PDFs are opened with PyMuPDF, images with PIL; page count, metadata and
+    rendered page data all come from the same handle. Use it as a context
+    manager so the underlying document is closed as soon as rendering is done.
+    """
+
+    def __init__(self, file_content: bytes, file_type: str):
+        self.file_content = file_content
+        self.file_type = file_type
+        self._pdf: Optional[fitz.Document] = None
+        self._image: Optional[Image.Image] = None
+        self.bytes_rendered = 0
+        if file_type == "pdf":
+            self._pdf = fitz.open(stream=file_content, filetype="pdf")
+        else:
+            self._image = Image.open(io.BytesIO(file_content))
+
+    @property
+    def num_pages(self) -> int:
+        if self._pdf is not None:
+            return len(self._pdf)
+        return 1
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if self._pdf is not None:
+            info = {k: v for k, v in (self._pdf.metadata or {}).items() if v}
+            info["num_pages"] = len(self._pdf)
+            return info
+        return {
+            "format": self._image.format,
+            "width": self._image.width,
+            "height": self._image.height,
+            "mode": self._image.mode,
+            "num_pages": 1,
+        }
+
+    def render_page_data(self, page_number: int = 0, options: Optional[ImageOptions] = None) -> str:
+        """Return the page as a base64 data URL ready for the model.
+
+        PDF pages are rasterized at ``options.pdf_dpi``. With enabled ``options``
+        the page goes through the normalization stage (orientation, crop,
+        resize, re-encode) first.
+        """
+        dpi = options.pdf_dpi if options is not None else None
+        if options is not None and options.enabled:
+            if self._pdf is not None:
+                pixmap = self._pdf[page_number].get_pixmap(dpi=dpi)
+                image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+            else:
+                image = self._image
+            image_bytes, mime_type = normalize_image(image, options)
+        elif self._pdf is not None:
+            image_bytes = self._pdf[page_number].get_pixmap(dpi=dpi).tobytes("png")
+            mime_type = "image/png"
+        else:
+            image_bytes = self.file_content
+            mime_type = f"image/{self.file_type}"
+        self.bytes_rendered += len(image_bytes)
+
+        # Convert to base64
+        base64_data = base64.b64encode(image_bytes).decode('utf-8')
+
+        # Return the base64 data with mime type
+        return f"data:{mime_type};base64,{base64_data}"
+
+    def fingerprint(self, header_fraction: float, dpi: int = 72) -> int:
+        """Perceptual hash of the first page's header band, for matching supplier layouts."""
+        if self._pdf is not None:
+            pixmap = self._pdf[0].get_pixmap(dpi=dpi)
+            image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        else:
+            image = self._image
+        return dhash(image, header_fraction)
+
+    def close(self) -> None:
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+        if self._image is not None:
+            self._image.close()
+            self._image = None
+
+    def __enter__(self) -> "ParsedDocument":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class PreparedDocument(BaseModel):
+    """Everything the service needs from a parsed document; cheap to send between processes."""
+    num_pages: int = Field(..., description="Number of pages in the document")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="Document metadata")
+    page_data: List[str] = Field(default_factory=list, description="Rendered pages as base64 data URLs")
+    preprocessing: Dict[str, Any] = Field(default_factory=dict, description="Bytes uploaded vs bytes sent to the model")
+    fingerprint: Optional[int] = Field(None, description="Header hash used to look up the supplier template")
+
+def prepare_document(
+    file_content: bytes,
+    file_type: str,
+    options: Optional[ImageOptions] = None,
+    header_fraction: Optional[float] = None
+) -> PreparedDocument:
+    """Decode, render and encode a document. CPU-bound; runs on the render pool.
+
+    Renders every page up to ``options.max_pages``. With ``header_fraction``
+    the first page's header is also fingerprinted.
+    """
+    with ParsedDocument(file_content, file_type) as document:
+        max_pages = options.max_pages if options is not None else document.num_pages
+        page_data = [
+            document.render_page_data(page_number, options=options)
+            for page_number in range(min(document.num_pages, max_pages))
+        ]
+        return PreparedDocument(
+            num_pages=document.num_pages,
+            metadata={**document.metadata, "rendered_pages": len(page_data)},
+            page_data=page_data,
+            preprocessing={
+                "normalized": bool(options and options.enabled),
+                "original_bytes": len(file_content),
+                "sent_bytes": document.bytes_rendered,
+            },
+            fingerprint=document.fingerprint(header_fraction) if header_fraction else None
+        )
+
+# Render pool
+_render_pool: Optional[Executor] = None
+
+def create_render_pool(mode: str, size: Optional[int] = None) -> Optional[Executor]:
+    """``inline`` renders on the calling thread; ``thread``/``process`` use a pool of ``size`` workers."""
+    size = size or os.cpu_count() or 1
+    if mode == "inline":
+        return None
+    if mode == "thread":
+        return ThreadPoolExecutor(max_workers=size, thread_name_prefix="render")
+    if mode == "process":
+        # spawn: forking a process that already runs threads (db pool, event loop) is unsafe
+        return ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context("spawn"))
+    raise ValueError(f"Unknown render executor: {mode}")
+
+def get_render_pool() -> Optional[Executor]:
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = create_render_pool(settings.RENDER_EXECUTOR, settings.RENDER_POOL_SIZE)
+    return _render_pool
+
+def set_render_pool(pool: Optional[Executor]) -> None:
+    """Swap the pool in use (benchmarks, tests); the previous one is shut down."""
+    global _render_pool
+    shutdown_render_pool()
+    _render_pool = pool
+
+def _warm_up() -> int:
+    # Imports fitz/PIL in the worker and exercises both decode paths once
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "white").save(buffer, format="PNG")
+    prepare_document(buffer.getvalue(), "png")
+    doc = fitz.open()
+    doc.new_page(width=8, height=8)
+    prepare_document(doc.tobytes(), "pdf")
+    doc.close()
+    return os.getpid()
+
+async def warm_up_render_pool() -> None:
+    """Start every pool worker up front so the first uploads don't pay for process start-up."""
+    pool = get_render_pool()
+    if pool is None:
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(pool, _warm_up) for _ in range(pool._max_workers)))
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=True)
+        _render_pool = None
+
+async def run_prepare_document(
+    file_content: bytes,
+    file_type: str,
+    options: Optional[ImageOptions] = None,
+    header_fraction: Optional[float] = None
+) -> PreparedDocument:
+    """Prepare a document on the render pool, keeping the event loop free."""
+    pool = get_render_pool()
+    if pool is None:
+        return prepare_document(file_content, file_type, options, header_fraction)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, prepare_document, file_content, file_type, options, header_fraction)
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+from . import db
+from .results import result_store
+
+# Columns fetched per audit log; input_data is left out, output_data carries the invoice
+EXPORT_COLUMNS = db.AUDIT_LOG_SUMMARY_COLUMNS + ("output_data",)
+
+# One row per invoice line item; header fields repeat on every item of the invoice
+ITEM_ROW_FIELDS = (
+    "log_id", "created_at", "file_name", "status", "error_message",
+    "invoice_number", "invoice_date", "supplier_name", "recipient_name", "total_amount_nis",
+    "item_index", "description", "quantity", "unit_price_nis", "total_price_nis", "barcode",
+)
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+async def iter_audit_log_pages(page_size: int, **filters) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Walk the filtered audit logs page by page, following keyset cursors.
+
+    Only one page is held at a time, so memory doesn't grow with the range exported.
+    """
+    cursor = None
+    while True:
+        rows, cursor = await db.list_audit_logs(cursor=cursor, limit=page_size, columns=EXPORT_COLUMNS, **filters)
+        if rows:
+            yield await result_store.rehydrate(rows)
+        if cursor is None:
+            return
+
+
+def flatten_log(log: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """Item-level rows for one audit log; logs without extracted items yield a single row."""
+    invoice = log.get("output_data") or {}
+    base = {
+        "log_id": log.get("id"),
+        "created_at": log.get("created_at"),
+        "file_name": log.get("file_name"),
+        "status": log.get("status"),
+        "error_message": log.get("error_message"),
+        "invoice_number": invoice.get("invoiceNumber"),
+        "invoice_date": invoice.get("invoiceDate"),
+        "supplier_name": (invoice.get("supplier") or {}).get("name"),
+        "recipient_name": (invoice.get("recipient") or {}).get("name"),
+        "total_amount_nis": invoice.get("totalAmountNis"),
+    }
+    items = invoice.get("items") or []
+    if not items:
+        yield {**base, "item_index": None, "description": None, "quantity": None,
+               "unit_price_nis": None, "total_price_nis": None, "barcode": None}
+        return
+    for index, item in enumerate(items):
+        yield {
+            **base,
+            "item_index": index,
+            "description": item.get("description"),
+            "quantity": item.get("quantity"),
+            "unit_price_nis": item.get("unitPriceNis"),
+            "total_price_nis": item.get("totalPriceNis"),
+            "barcode": item.get("barcode"),
+        }
+
+
+async def export_ndjson(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for rows in pages:
+        yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows).encode("utf-8")
+
+
+async def export_csv(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ITEM_ROW_FIELDS)
+    # BOM so Excel opens Hebrew text as UTF-8
+    buffer.write("﻿")
+    writer.writeheader()
+    async for rows in pages:
+        for log in rows:
+            writer.writerows(flatten_log(log))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ExportUnavailable("Parquet export requires pyarrow (pip install 'finzup-api[export]')") from e
+    return pyarrow
+
+
+def item_row_schema(pa):
+    """Arrow schema for ``ITEM_ROW_FIELDS``."""
+    return pa.schema([
+        ("log_id", pa.string()), ("created_at", pa.string()), ("file_name", pa.string()),
+        ("status", pa.string()), ("error_message", pa.string()),
+        ("invoice_number", pa.int64()), ("invoice_date", pa.string()),
+        ("supplier_name", pa.string()), ("recipient_name", pa.string()), ("total_amount_nis", pa.float64()),
+        ("item_index", pa.int32()), ("description", pa.string()), ("quantity", pa.int64()),
+        ("unit_price_nis", pa.float64()), ("total_price_nis", pa.float64()), ("barcode", pa.string()),
+    ])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def export_parquet(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """One Parquet row group per fetched page, streamed as each group is written."""
+    pa = require_pyarrow()
+    schema = item_row_schema(pa)
+    sink = _ChunkSink()
+    writer = pa.parquet.ParquetWriter(sink, schema)
+    try:
+        async for rows in pages:
+            items = [row for log in rows for row in flatten_log(log)]
+            writer.write_table(pa.Table.from_pylist(items, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_audit_logs(export_format: str, page_size: int, filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[bytes]:
+    pages = iter_audit_log_pages(page_size, **(filters or {}))
+    if export_format == "ndjson":
+        return export_ndjson(pages)
+    if export_format == "csv":
+        return export_csv(pages)
+    if export_format == "parquet":
+        require_pyarrow()
+        return export_parquet(pages)
+    raise ValueError(f"Unknown export format: {export_format}")
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from .models import JobStatus, JobStatusResponse
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    def __init__(self, file_name: str, payload: Dict[str, Any], owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.file_name = file_name
+        # User id of the submitter; only they can read the job
+        self.owner = owner
+        self.payload: Optional[Dict[str, Any]] = payload
+        self.status = JobStatus.queued
+        self.created_at = datetime.now(UTC)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._finished_monotonic: Optional[float] = None
+
+    def to_response(self) -> JobStatusResponse:
+        return JobStatusResponse(
+            job_id=self.id,
+            status=self.status,
+            file_name=self.file_name,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error=self.error
+        )
+
+
+class JobStore:
+    """Job status and results in a SQLite file shared by the worker processes on one host.
+
+    A job runs in the worker that accepted it; every state change is written
+    here, so a poll answered by any other worker sees it too. Results are
+    stored as JSON of ``result_type``.
+
+    The connection is opened on first use rather than here: the app is
+    imported in the gunicorn master, and a SQLite connection must not be
+    carried across ``fork()`` into the workers.
+    """
+
+    def __init__(self, path: str, result_type: Type[BaseModel]):
+        self.path = Path(path)
+        self.result_type = result_type
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with the lock held
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.execute(
+                "create table if not exists jobs ("
+                "id text primary key, file_name text, status text, created_at text, started_at text,"
+                " finished_at text, finished_ts real, error text, result text, owner text)"
+            )
+            # Stores created before jobs had an owner
+            if "owner" not in {row[1] for row in conn.execute("pragma table_info(jobs)")}:
+                conn.execute("alter table jobs add column owner text")
+            self._conn = conn
+        return self._conn
+
+    def save(self, job: "Job") -> None:
+        with self._lock:
+            # Read under the lock, so the last write always carries the latest state
+            result = job.result.model_dump_json() if isinstance(job.result, BaseModel) else None
+            self._connection().execute(
+                "insert or replace into jobs (id, file_name, status, created_at, started_at, finished_at,"
+                " finished_ts, error, result, owner) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id, job.file_name, job.status.value, job.created_at.isoformat(),
+                    job.started_at.isoformat() if job.started_at else None,
+                    job.finished_at.isoformat() if job.finished_at else None,
+                    job.finished_at.timestamp() if job.finished_at else None,
+                    job.error, result, job.owner,
+                )
+            )
+
+    def load(self, job_id: str) -> Optional["Job"]:
+        with self._lock:
+            row = self._connection().execute(
+                "select file_name, status, created_at, started_at, finished_at, error, result, owner from jobs where id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        file_name, status, created_at, started_at, finished_at, error, result, owner = row
+        job = Job(file_name, None, owner)
+        job.id = job_id
+        job.status = JobStatus(status)
+        job.created_at = datetime.fromisoformat(created_at)
+        job.started_at = datetime.fromisoformat(started_at) if started_at else None
+        job.finished_at = datetime.fromisoformat(finished_at) if finished_at else None
+        job.error = error
+        job.result = self.result_type.model_validate_json(result) if result else None
+        return job
+
+    def delete_finished_before(self, timestamp: float) -> None:
+        with self._lock:
+            self._connection().execute("delete from jobs where finished_ts < ?", (timestamp,))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JobQueue:
+    """In-process job queue: a bounded asyncio queue drained by a fixed pool of worker tasks.
+
+    ``handler`` receives the job payload as keyword arguments and returns the result
+    object; a result with a truthy ``error`` attribute marks the job as failed.
+    With a ``store``, job states are also written there, so ``fetch`` finds jobs
+    submitted to other worker processes.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable[Any]],
+        max_size: int = 100,
+        workers: int = 4,
+        result_ttl_seconds: float = 3600,
+        store: Optional[JobStore] = None
+    ):
+        self.handler = handler
+        self.store = store
+        self.max_size = max_size
+        self.num_workers = workers
+        self.result_ttl_seconds = result_ttl_seconds
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._draining = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+
+    async def stop(self, drain: bool = True, timeout: Optional[float] = None) -> None:
+        """Stop the workers, first finishing queued jobs when ``drain`` is set.
+
+        Submissions are refused while draining. Jobs still unfinished after
+        ``timeout`` seconds are cancelled and marked failed.
+        """
+        if not self.running:
+            return
+        self._draining = True
+        try:
+            if drain:
+                try:
+                    await asyncio.wait_for(self._queue.join(), timeout)
+                except TimeoutError:
+                    unfinished = sum(job.status in (JobStatus.queued, JobStatus.running) for job in self.jobs.values())
+                    logger.warning("Gave up draining the job queue with %d jobs unfinished", unfinished)
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+        finally:
+            self._draining = False
+
+    def submit(self, file_name: str, /, owner: Optional[str] = None, **payload: Any) -> Job:
+        if not self.running:
+            raise RuntimeError("Job queue is not running")
+        if self._draining:
+            raise QueueFullError("Job queue is shutting down")
+        self._evict_expired()
+        job = Job(file_name, payload, owner)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_size} jobs pending)")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def fetch(self, job_id: str) -> Optional[Job]:
+        """A job of this process, else one submitted to another worker sharing the store."""
+        job = self.jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = await asyncio.to_thread(self.store.load, job_id)
+        return job
+
+    async def persist(self, job: Job) -> None:
+        """Write the job's current state to the shared store; a failed write only costs other workers the job."""
+        if self.store is None:
+            return
+        try:
+            await asyncio.to_thread(self.store.save, job)
+        except Exception:
+            logger.exception("Failed to record job %s in the job store", job.id)
+
+    def _evict_expired(self) -> None:
+        cutoff = time.monotonic() - self.result_ttl_seconds
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job._finished_monotonic is not None and job._finished_monotonic < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if expired and self.store is not None:
+            asyncio.get_running_loop().run_in_executor(
+                None, self.store.delete_finished_before, time.time() - self.result_ttl_seconds
+            )
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                job.status = JobStatus.running
+                job.started_at = datetime.now(UTC)
+                await self.persist(job)
+                result = await self.handler(**job.payload)
+                job.result = result
+                job.error = getattr(result, "error", None)
+                job.status = JobStatus.failed if job.error else JobStatus.succeeded
+            except asyncio.CancelledError:
+                job.error = "Cancelled while the server was shutting down"
+                job.status = JobStatus.failed
+                raise
+            except Exception as e:
+                logger.exception("Job %s failed", job.id)
+                job.error = str(e)
+                job.status = JobStatus.failed
+            finally:
+                # Drop the uploaded bytes as soon as the job is done
+                job.payload = None
+                job.finished_at = datetime.now(UTC)
+                job._finished_monotonic = time.monotonic()
+                try:
+                    await asyncio.shield(self.persist(job))
+                finally:
+                    self._queue.task_done()
@@ -1,16 +1,138 @@
-from fastapi import FastAPI, HTTPException, status, UploadFile, File
+from fastapi import Depends, FastAPI, HTTPException, Query, Response, Security, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from contextlib import asynccontextmanager
 from .config import get_settings
-from .models import InvoiceData
-from .db import create_audit_log, get_audit_logs, update_user, supabase
-from .services import process_invoice, get_num_pages, ProcessInvoiceResponse
+from .models import InvoiceData, ApiKeyResponse, AuditLogPage, BatchItemResult, BatchProcessResponse, JobStatus, JobStatusResponse
+from .jobs import JobQueue, JobStore, QueueFullError
+from .api_keys import ApiKeyIndex, ApiKeyPrincipal, LastUsedTracker, generate_api_key, hash_api_key
+from .audit import AuditLogWriter
+from .uploads import MULTIPART_OVERHEAD, UploadRejected, UploadSizeLimitMiddleware, read_upload_limited, sniff_file_type
+from .db import get_audit_log, get_user, list_api_keys, list_audit_logs, touch_api_keys, update_user
+from . import auth, db
+from .documents import warm_up_render_pool, shutdown_render_pool
+from . import services
+from .streaming import SSE_HEADERS, format_sse
+from .export import EXPORT_FORMATS, ExportUnavailable, export_audit_logs
+from .results import insert_audit_logs, result_store
+from . import metrics, quotas
+from .metrics import MetricsMiddleware
+from .quotas import QuotaMiddleware, create_quota_store
+from .services import process_invoice, process_invoice_batch, stream_invoice, get_total_tokens, ProcessInvoiceResponse, result_cache
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import io
+import math
 import os
+import zipfile
+import zlib
 from datetime import datetime, UTC
 
 settings = get_settings()
-app = FastAPI(title=settings.PROJECT_NAME)
 
-# CORS middleware
+async def run_invoice_job(
+    content: bytes,
+    file_type: str,
+    file_name: str,
+    bypass_cache: bool = False,
+    principal: Optional[ApiKeyPrincipal] = None,
+    quota: Optional[Tuple[quotas.QuotaStore, str]] = None
+) -> ProcessInvoiceResponse:
+    # Job workers outlive the request, so the submitting tenant is carried in the payload
+    with quotas.charging(quota):
+        result = await process_invoice(content, file_type, file_name, len(content), bypass_cache=bypass_cache)
+    audit_writer.submit(build_audit_log(file_name, content, result, principal))
+    return result
+
+# Audit rows are buffered and inserted in batches in the background; each distinct
+# output_data is stored once in audit_results and the rows reference it by hash
+audit_writer = AuditLogWriter(
+    insert_audit_logs,
+    max_batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    max_queue_size=settings.AUDIT_QUEUE_SIZE,
+    spill_path=settings.AUDIT_SPILL_PATH
+)
+
+# Jobs run in the worker that accepted them; their state goes through a SQLite file
+# so that a poll answered by any worker process finds them
+job_queue = JobQueue(
+    run_invoice_job,
+    max_size=settings.JOB_QUEUE_SIZE,
+    workers=settings.JOB_WORKERS,
+    result_ttl_seconds=settings.JOB_RESULT_TTL_SECONDS,
+    store=JobStore(settings.JOB_STORE_PATH, ProcessInvoiceResponse) if settings.JOB_STORE_PATH else None
+)
+
+# Keys are checked against an in-memory index; last-used timestamps are written in batches
+api_key_index = ApiKeyIndex(
+    list_api_keys,
+    refresh_interval=settings.API_KEY_REFRESH_SECONDS,
+    miss_refresh_interval=settings.API_KEY_MISS_REFRESH_SECONDS
+)
+api_key_usage = LastUsedTracker(touch_api_keys, flush_interval=settings.API_KEY_LAST_USED_FLUSH_SECONDS)
+
+# Per-tenant request rate and model-token budget; None with QUOTA_BACKEND=none
+quota_store = create_quota_store(settings)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the model and database clients before taking traffic rather than on the first request
+    await asyncio.gather(
+        asyncio.to_thread(services.backend.warm_up),
+        asyncio.to_thread(db.get_client),
+        warm_up_render_pool()
+    )
+    await audit_writer.start()
+    await job_queue.start()
+    await api_key_index.start()
+    await api_key_usage.start()
+    yield
+    # The server has already let in-flight requests finish; jobs get as long again
+    await job_queue.stop(timeout=settings.GRACEFUL_SHUTDOWN_SECONDS)
+    await api_key_usage.stop()
+    await api_key_index.stop()
+    await audit_writer.stop()
+    shutdown_render_pool()
+    if quota_store is not None:
+        await quota_store.close()
+    auth.shutdown()
+    db.shutdown()
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
+
+# Refuse oversized single-file uploads before the multipart body is parsed
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+    paths=[
+        f"{settings.API_V1_STR}/process-invoice",
+        f"{settings.API_V1_STR}/process-invoice/stream",
+        f"{settings.API_V1_STR}/jobs"
+    ]
+)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.BATCH_MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+    paths=[f"{settings.API_V1_STR}/process-invoice/batch"]
+)
+
+# Per-tenant limits, checked before the upload is read; the token budget only guards model routes
+if quota_store is not None:
+    app.add_middleware(
+        QuotaMiddleware,
+        store=quota_store,
+        paths=[settings.API_V1_STR],
+        budget_paths=[f"{settings.API_V1_STR}/process-invoice", f"{settings.API_V1_STR}/jobs"],
+        authenticate=lambda api_key: api_key_index.authenticate(api_key)
+    )
+
+# Request counts, latency and Server-Timing; outside the limits so rejected uploads are counted too
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, server_timing=settings.SERVER_TIMING, exclude=["/metrics"])
+
+# CORS middleware; added last so it is outermost and rejections from the middleware above carry its headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -19,60 +141,545 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post(f"{settings.API_V1_STR}/process-invoice", response_model=InvoiceData)
-async def process_invoice_endpoint(
-    file: UploadFile = File(...)
-):
+def collect_runtime_metrics():
+    """Queue depths and backend state, read when /metrics is scraped."""
+    job_depth = metrics.Gauge("finzup_job_queue_depth", "Invoice jobs waiting for a worker")
+    job_depth.set(job_queue.depth())
+    audit_depth = metrics.Gauge("finzup_audit_queue_depth", "Audit rows buffered for the next flush")
+    audit_depth.set(audit_writer.stats()["queue_depth"])
+    cache_size = metrics.Gauge("finzup_cache_entries", "Entries in the extraction result cache")
+    cache_size.set(len(services.result_cache))
+    yield from (job_depth, audit_depth, cache_size)
+
+    stats = services.backend.stats() if hasattr(services.backend, "stats") else {}
+    if stats:
+        waiting = metrics.Gauge("finzup_llm_calls_waiting", "Model calls queued behind the concurrency or token limit")
+        waiting.set(stats["waiting"])
+        tokens = metrics.Gauge("finzup_llm_tokens_last_minute", "Tokens spent in the rolling rate-limit window")
+        tokens.set(stats["tokens_last_minute"])
+        circuit = metrics.Gauge("finzup_llm_circuit_open", "1 while the model circuit breaker is open")
+        circuit.set(0 if stats["circuit"] == "closed" else 1)
+        yield from (waiting, tokens, circuit)
+
+metrics.registry.add_collector(collect_runtime_metrics)
+
+def get_file_type(file_name: str) -> str:
+    return file_name.split(".")[-1].lower()
+
+def build_audit_log(
+    file_name: str,
+    content: bytes,
+    result: ProcessInvoiceResponse,
+    principal: Optional[ApiKeyPrincipal] = None
+) -> Dict[str, Any]:
+    # A cached result cost no model call; what it first cost is kept alongside
+    tokens = get_total_tokens(result.usage_metadata)
+    return {
+        "user_id": principal.user_id if principal else None,
+        "api_key": principal.key_id if principal else None,
+        "file_name": file_name,
+        "file_size": len(content),
+        "num_pages": result.num_pages,
+        "tokens_used": 0 if result.cached else tokens,
+        "status": "success" if result.invoice_data else "error",
+        "created_at": datetime.now(UTC).isoformat(),
+        "input_data": {
+            "cached": result.cached,
+            "cached_tokens": tokens if result.cached else None,
+            "document": result.document_metadata,
+            "preprocessing": result.preprocessing,
+            "validation": result.validation.model_dump(mode="json") if result.validation else None
+        },
+        "output_data": result.invoice_data.model_dump(mode="json") if result.invoice_data else None,
+        "error_message": result.error
+    }
+
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
+
+async def api_key_auth(api_key: Optional[str] = Security(api_key_header)) -> Optional[ApiKeyPrincipal]:
+    """Resolve ``X-API-Key`` from the in-memory index; required only with ``API_KEY_REQUIRED``."""
+    if api_key is None:
+        if settings.API_KEY_REQUIRED:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Missing API key"
+            )
+        return None
+    principal = await api_key_index.authenticate(api_key)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key"
+        )
+    api_key_usage.record(principal.user_id)
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
+    payload = auth.verify_token(token)
+    user = await get_user(payload.sub) if payload else None
+    if user is None or not user.get("is_active", True):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return user
+
+async def audit_log_owner(
+    principal: Optional[ApiKeyPrincipal] = Depends(api_key_auth),
+    token: Optional[str] = Depends(optional_oauth2_scheme)
+) -> str:
+    """Id of the user whose audit logs the caller may read: the API key's owner, else the signed-in user."""
+    if principal is not None:
+        return principal.user_id
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return (await get_current_user(token))["id"]
+
+async def read_upload(file: UploadFile) -> Tuple[bytes, str]:
     # Validate file type
-    file_type = file.filename.split(".")[-1].lower()
+    file_type = get_file_type(file.filename)
     if file_type not in settings.ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File type not allowed. Allowed types: {settings.ALLOWED_EXTENSIONS}"
         )
     
-    # Read file content
-    content = await file.read()
-    if len(content) > settings.MAX_UPLOAD_SIZE:
+    # Read file content in chunks, rejecting oversized or non-document payloads early
+    try:
+        with metrics.stage("upload_read"):
+            return await read_upload_limited(file, settings.MAX_UPLOAD_SIZE, settings.ALLOWED_EXTENSIONS)
+    except UploadRejected as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Maximum size: {settings.MAX_UPLOAD_SIZE} bytes"
+            detail=e.detail
+        )
+
+def validation_headers(result: ProcessInvoiceResponse) -> Dict[str, str]:
+    """``X-Invoice-Validation: passed|corrected|failed`` for endpoints that return bare invoice data."""
+    if result.validation is None:
+        return {}
+    if not result.validation.valid:
+        outcome = "failed"
+    elif result.validation.corrected_fields:
+        outcome = "corrected"
+    else:
+        outcome = "passed"
+    return {"X-Invoice-Validation": outcome}
+
+def raise_for_result(result: ProcessInvoiceResponse) -> None:
+    """Map a failed extraction to an HTTP error: 503 when the model is unavailable, else 400."""
+    if not result.error:
+        return
+    if result.retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=result.error,
+            headers={"Retry-After": str(math.ceil(result.retry_after))}
         )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=result.error
+    )
+
+@app.post(f"{settings.API_V1_STR}/process-invoice", response_model=InvoiceData)
+async def process_invoice_endpoint(
+    response: Response,
+    file: UploadFile = File(...),
+    bypass_cache: bool = False,
+    principal: Optional[ApiKeyPrincipal] = Depends(api_key_auth)
+):
+    content, file_type = await read_upload(file)
     
     # Process invoice
     result = await process_invoice(
         content,
         file_type,
         file.filename,
-        len(content)
+        len(content),
+        bypass_cache=bypass_cache
     )
     
-    # Create audit log (user_id and api_key are omitted)
-    await create_audit_log({
-        "user_id": None,
-        "api_key": None,
-        "file_name": file.filename,
-        "file_size": len(content),
-        "num_pages": get_num_pages(content, file_type),
-        "tokens_used": result.usage_metadata.get("total_tokens", -1),
-        "status": "success" if result.invoice_data else "error",
-        "created_at": datetime.now(UTC),
-        "input_data": {"file_name": file.filename, "file_size": len(content)},
-        "output_data": result.invoice_data.model_dump() if result.invoice_data else None,
-        "error_message": result.error
-    })
+    audit_writer.submit(build_audit_log(file.filename, content, result, principal))
+    
+    raise_for_result(result)
     
-    if result.error:
+    response.headers.update(validation_headers(result))
+    return result.invoice_data
+
+@app.post(f"{settings.API_V1_STR}/process-invoice/stream")
+async def process_invoice_stream_endpoint(
+    file: UploadFile = File(...),
+    bypass_cache: bool = False,
+    principal: Optional[ApiKeyPrincipal] = Depends(api_key_auth)
+):
+    """Same as ``/process-invoice``, but reports progress and partial output as server-sent events.
+
+    Events: ``accepted``, ``document_parsed``, ``pages_rendered``, ``model_started``,
+    ``header``, ``item`` (one per line item), then ``result`` or ``error``.
+    """
+    content, file_type = await read_upload(file)
+    file_name = file.filename
+
+    async def events():
+        yield format_sse("accepted", {"file_name": file_name, "file_size": len(content), "file_type": file_type})
+        async for event, payload in stream_invoice(content, file_type, bypass_cache=bypass_cache):
+            if event != "result":
+                yield format_sse(event, payload)
+                continue
+            audit_writer.submit(build_audit_log(file_name, content, payload, principal))
+            if payload.error:
+                yield format_sse("error", {
+                    "detail": payload.error,
+                    "status_code": 503 if payload.retry_after is not None else 400,
+                    "retry_after": payload.retry_after
+                })
+            else:
+                yield format_sse("result", {
+                    "invoice_data": payload.invoice_data.model_dump(mode="json"),
+                    "cached": payload.cached,
+                    "usage_metadata": payload.usage_metadata,
+                    "warnings": payload.warnings,
+                    "validation": payload.validation.model_dump(mode="json") if payload.validation else None
+                })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def expand_batch_upload(content: bytes, max_entries: int) -> List[Tuple[str, Optional[bytes], Optional[str], Optional[str]]]:
+    """Unpack a zip archive into ``(file_name, content, file_type, error)`` entries; blocking.
+
+    Entries are checked like single uploads (extension, size, magic bytes).
+    The archive is rejected once its entries add up to more than
+    ``BATCH_MAX_UPLOAD_SIZE`` unpacked, and unpacking stops past ``max_entries``.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile:
+        raise UploadRejected("File content is not a zip archive")
+    entries = []
+    unpacked = 0
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            if len(entries) > max_entries:
+                break
+            file_type = get_file_type(info.filename)
+            if file_type not in settings.ALLOWED_EXTENSIONS:
+                entries.append((info.filename, None, None, f"File type not allowed. Allowed types: {settings.ALLOWED_EXTENSIONS}"))
+                continue
+            # The declared size bounds what read() inflates, so archives can't balloon memory
+            if info.file_size > settings.MAX_UPLOAD_SIZE:
+                entries.append((info.filename, None, None, f"File too large. Maximum size: {settings.MAX_UPLOAD_SIZE} bytes"))
+                continue
+            unpacked += info.file_size
+            if unpacked > settings.BATCH_MAX_UPLOAD_SIZE:
+                raise UploadRejected(f"Archive too large once unpacked. Maximum size: {settings.BATCH_MAX_UPLOAD_SIZE} bytes")
+            try:
+                data = archive.read(info)
+            except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError):
+                entries.append((info.filename, None, None, "File could not be unpacked"))
+                continue
+            sniffed = sniff_file_type(data)
+            if not data:
+                entries.append((info.filename, None, None, "File is empty"))
+            elif sniffed is None or sniffed not in settings.ALLOWED_EXTENSIONS:
+                entries.append((info.filename, None, None, "File content is not a supported PDF or image"))
+            else:
+                entries.append((info.filename, data, sniffed, None))
+    return entries
+
+async def read_batch_part(
+    file: UploadFile,
+    max_entries: int
+) -> List[Tuple[str, Optional[bytes], Optional[str], Optional[str]]]:
+    """Read one batch part as ``(file_name, content, file_type, error)`` entries.
+
+    Documents are read like single uploads and capped at ``MAX_UPLOAD_SIZE``;
+    zip archives only by the whole batch limit, then unpacked off the event loop.
+    """
+    file_type = get_file_type(file.filename)
+    if file_type != "zip" and file_type not in settings.ALLOWED_EXTENSIONS:
+        return [(file.filename, None, None, f"File type not allowed. Allowed types: {settings.ALLOWED_EXTENSIONS}")]
+    try:
+        if file_type == "zip":
+            content, _ = await read_upload_limited(file, settings.BATCH_MAX_UPLOAD_SIZE, ["zip"])
+        else:
+            content, file_type = await read_upload_limited(file, settings.MAX_UPLOAD_SIZE, settings.ALLOWED_EXTENSIONS)
+    except UploadRejected as e:
+        return [(file.filename, None, None, e.detail)]
+    if file_type != "zip":
+        return [(file.filename, content, file_type, None)]
+    try:
+        return await asyncio.to_thread(expand_batch_upload, content, max_entries)
+    except UploadRejected as e:
+        return [(file.filename, None, None, e.detail)]
+
+@app.post(f"{settings.API_V1_STR}/process-invoice/batch", response_model=BatchProcessResponse)
+async def process_invoice_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    bypass_cache: bool = False,
+    principal: Optional[ApiKeyPrincipal] = Depends(api_key_auth)
+):
+    too_many = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Too many files. Maximum per batch: {settings.BATCH_MAX_FILES}"
+    )
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise too_many
+
+    uploads = []
+    with metrics.stage("upload_read"):
+        for file in files:
+            uploads.extend(await read_batch_part(file, settings.BATCH_MAX_FILES - len(uploads)))
+            # Zip archives can still push the count over once unpacked
+            if len(uploads) > settings.BATCH_MAX_FILES:
+                raise too_many
+
+    # Reject individual files up front; the rest of the batch still runs
+    results: List[BatchItemResult] = [None] * len(uploads)
+    accepted = []
+    for index, (file_name, content, file_type, error) in enumerate(uploads):
+        if error is None and file_type not in settings.ALLOWED_EXTENSIONS:
+            error = f"File type not allowed. Allowed types: {settings.ALLOWED_EXTENSIONS}"
+        elif error is None and (not content or len(content) > settings.MAX_UPLOAD_SIZE):
+            error = f"File too large or empty. Maximum size: {settings.MAX_UPLOAD_SIZE} bytes"
+        elif error is None:
+            accepted.append((index, file_name, content, file_type))
+            continue
+        results[index] = BatchItemResult(file_name=file_name, error=error)
+
+    responses = await process_invoice_batch(
+        [(content, file_type, file_name) for _, file_name, content, file_type in accepted],
+        settings.BATCH_MAX_CONCURRENCY,
+        bypass_cache=bypass_cache
+    )
+
+    audit_logs = []
+    for (index, file_name, content, file_type), result in zip(accepted, responses):
+        results[index] = BatchItemResult(
+            file_name=file_name,
+            invoice_data=result.invoice_data,
+            error=result.error,
+            cached=result.cached,
+            validation=result.validation
+        )
+        audit_logs.append(build_audit_log(file_name, content, result, principal))
+
+    audit_writer.submit_many(audit_logs)
+
+    succeeded = sum(1 for r in results if r.invoice_data is not None)
+    return BatchProcessResponse(
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=results
+    )
+
+@app.post(
+    f"{settings.API_V1_STR}/jobs",
+    response_model=JobStatusResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def submit_invoice_job(
+    file: UploadFile = File(...),
+    bypass_cache: bool = False,
+    principal: Optional[ApiKeyPrincipal] = Depends(api_key_auth)
+):
+    content, file_type = await read_upload(file)
+    try:
+        job = job_queue.submit(
+            file.filename,
+            owner=principal.user_id if principal else None,
+            content=content,
+            file_type=file_type,
+            file_name=file.filename,
+            bypass_cache=bypass_cache,
+            principal=principal,
+            quota=quotas.current()
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+    await job_queue.persist(job)
+    return job.to_response()
+
+async def get_job_or_404(job_id: str, principal: Optional[ApiKeyPrincipal]):
+    job = await job_queue.fetch(job_id)
+    # Another caller's job is reported as missing, like an unknown id
+    if job is None or job.owner != (principal.user_id if principal else None):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@app.get(
+    f"{settings.API_V1_STR}/jobs/{{job_id}}",
+    response_model=JobStatusResponse
+)
+async def get_invoice_job(job_id: str, principal: Optional[ApiKeyPrincipal] = Depends(api_key_auth)):
+    return (await get_job_or_404(job_id, principal)).to_response()
+
+@app.get(
+    f"{settings.API_V1_STR}/jobs/{{job_id}}/result",
+    response_model=InvoiceData
+)
+async def get_invoice_job_result(
+    job_id: str,
+    response: Response,
+    principal: Optional[ApiKeyPrincipal] = Depends(api_key_auth)
+):
+    job = await get_job_or_404(job_id, principal)
+    if job.status in (JobStatus.queued, JobStatus.running):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {job.status.value}",
+            headers={"Retry-After": "1"}
+        )
+    if job.status == JobStatus.failed:
+        if isinstance(job.result, ProcessInvoiceResponse):
+            raise_for_result(job.result)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=result.error
+            detail=job.error
         )
-    
-    return result.invoice_data
+    response.headers.update(validation_headers(job.result))
+    return job.result.invoice_data
 
-@app.get(f"{settings.API_V1_STR}/audit-logs")
+def audit_log_filters(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    file_name: Optional[str] = None
+) -> Dict[str, Any]:
+    return {
+        "status": status_filter,
+        "created_from": created_from,
+        "created_to": created_to,
+        "file_name": file_name
+    }
+
+@app.get(f"{settings.API_V1_STR}/audit-logs", response_model=AuditLogPage)
 async def get_user_audit_logs(
-    limit: int = 100
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns; defaults to the summary columns"),
+    filters: Dict[str, Any] = Depends(audit_log_filters),
+    owner: str = Depends(audit_log_owner)
 ):
-    logs = await get_audit_logs(None, limit)
-    return logs 
\ No newline at end of file
+    """The caller's audit logs newest first, one keyset page at a time; pass ``next_cursor`` back as ``cursor``."""
+    columns = db.AUDIT_LOG_SUMMARY_COLUMNS
+    if fields:
+        columns = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = sorted(set(columns) - set(db.AUDIT_LOG_COLUMNS))
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {unknown}. Allowed: {list(db.AUDIT_LOG_COLUMNS)}"
+            )
+    try:
+        logs, next_cursor = await list_audit_logs(
+            cursor=cursor, limit=limit, columns=columns, user_id=owner, **filters
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if "output_data" in columns:
+        logs = await result_store.rehydrate(logs)
+    return AuditLogPage(items=logs, next_cursor=next_cursor)
+
+@app.get(f"{settings.API_V1_STR}/audit-logs/export")
+async def export_audit_logs_endpoint(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv|parquet)$"),
+    filters: Dict[str, Any] = Depends(audit_log_filters),
+    owner: str = Depends(audit_log_owner)
+):
+    """Stream the caller's matching audit logs as NDJSON, or one row per invoice item as CSV or Parquet.
+
+    Rows are fetched page by page and written out as they arrive, so memory
+    stays flat however large the range.
+    """
+    try:
+        body = export_audit_logs(export_format, settings.EXPORT_PAGE_SIZE, {**filters, "user_id": owner})
+    except ExportUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e)
+        )
+    media_type, extension = EXPORT_FORMATS[export_format]
+    file_name = f"audit-logs-{datetime.now(UTC):%Y%m%dT%H%M%SZ}.{extension}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
+@app.get(f"{settings.API_V1_STR}/audit-logs/{{log_id}}")
+async def get_audit_log_detail(log_id: str, owner: str = Depends(audit_log_owner)):
+    """One of the caller's audit logs with its full ``input_data`` and ``output_data``."""
+    log = await get_audit_log(log_id, user_id=owner)
+    if log is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Audit log not found"
+        )
+    return (await result_store.rehydrate([log]))[0]
+
+@app.post(f"{settings.API_V1_STR}/auth/generate-api-key", response_model=ApiKeyResponse)
+async def generate_api_key_endpoint(user: Dict[str, Any] = Depends(get_current_user)):
+    """Issue (or rotate) the caller's API key. Only its hash is stored, so it is shown once."""
+    api_key = generate_api_key()
+    created_at = datetime.now(UTC)
+    await update_user(user["id"], {"api_key": hash_api_key(api_key), "api_key_created_at": created_at.isoformat()})
+    # The previous key stops working here at once, and in other workers on their next reload
+    api_key_index.invalidate(user.get("api_key"))
+    return ApiKeyResponse(api_key=api_key, api_key_created_at=created_at)
+
+@app.get(f"{settings.API_V1_STR}/api-keys/stats")
+async def get_api_key_stats():
+    return {**api_key_index.stats(), "last_used_pending": api_key_usage.pending()}
+
+@app.get(f"{settings.API_V1_STR}/cache/stats")
+async def get_cache_stats():
+    return result_cache.stats()
+
+@app.get(f"{settings.API_V1_STR}/quotas/stats")
+async def get_quota_stats():
+    if quota_store is None:
+        return {"enabled": False}
+    return {"enabled": True, **quota_store.stats()}
+
+@app.get(f"{settings.API_V1_STR}/templates/stats")
+async def get_template_stats():
+    if services.supplier_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **services.supplier_index.stats()}
+
+@app.get(f"{settings.API_V1_STR}/results/stats")
+async def get_result_store_stats():
+    return result_store.stats()
+
+@app.get(f"{settings.API_V1_STR}/audit-writer/stats")
+async def get_audit_writer_stats():
+    return audit_writer.stats()
+
+@app.get(f"{settings.API_V1_STR}/backend/stats")
+async def get_backend_stats():
+    stats = getattr(services.backend, "stats", None)
+    return {"backend": services.backend.name, **(stats() if stats else {})}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
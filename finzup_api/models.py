@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
+from enum import Enum
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -28,6 +29,10 @@ class Token(BaseModel):
     refresh_token: str
     token_type: str = "bearer"
 
+class ApiKeyResponse(BaseModel):
+    api_key: str = Field(..., description="Shown once; only its hash is stored")
+    api_key_created_at: datetime
+
 class TokenPayload(BaseModel):
     sub: str
     exp: int
@@ -46,6 +51,10 @@ class AuditLog(BaseModel):
     output_data: Optional[dict] = None
     error_message: Optional[str] = None
 
+class AuditLogPage(BaseModel):
+    items: List[dict] = Field(..., description="Audit logs, newest first, with the requested columns")
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to fetch the next page; null on the last page")
+
 # Invoice Data Models
 class Address(BaseModel):
     street: str = Field(..., description="Street address of the entity")
@@ -83,4 +92,60 @@ class InvoiceData(BaseModel):
     recipient: Recipient = Field(..., description="Information about the recipient")
     delivery_company: Optional[DeliveryCompany] = Field(None, description="Information about the delivery company")
     items: List[InvoiceItem] = Field(..., description="List of items or services in the invoice", min_items=1)
-    totalAmountNis: float = Field(..., description="Total amount of the invoice in NIS", ge=0) 
\ No newline at end of file
+    totalAmountNis: float = Field(..., description="Total amount of the invoice in NIS", ge=0) 
+
+# Arithmetic Validation Models
+class ValidationIssue(BaseModel):
+    field: str = Field(..., description="Path of the inconsistent value, e.g. items[2].totalPriceNis or totalAmountNis")
+    expected: float = Field(..., description="Value implied by the other fields")
+    actual: float = Field(..., description="Value that was extracted")
+    message: str
+
+class ValidationReport(BaseModel):
+    valid: bool = Field(..., description="Whether every item and the invoice total add up")
+    items_total: float = Field(..., description="Sum of the item totals")
+    vat_rate: Optional[float] = Field(None, description="VAT rate that reconciles the items with the total; 0 when the total is net")
+    issues: List[ValidationIssue] = Field(default_factory=list, description="Checks still failing")
+    corrected_fields: List[str] = Field(default_factory=list, description="Fields changed by a focused re-extraction")
+    reextracted: bool = Field(False, description="Whether a focused re-extraction was run")
+
+class ItemCorrection(BaseModel):
+    index: int = Field(..., description="Zero-based position of the item in the invoice items list")
+    quantity: Optional[int] = Field(None, description="Quantity of the item, as printed", ge=1)
+    unitPriceNis: Optional[float] = Field(None, description="Unit price in NIS, as printed", ge=0)
+    totalPriceNis: Optional[float] = Field(None, description="Total price for the item in NIS, as printed", ge=0)
+
+class InvoiceCorrections(BaseModel):
+    items: List[ItemCorrection] = Field(default_factory=list, description="Re-read values of the requested items")
+    totalAmountNis: Optional[float] = Field(None, description="Re-read total amount of the invoice in NIS", ge=0)
+
+# Batch Processing Models
+class BatchItemResult(BaseModel):
+    file_name: str = Field(..., description="Name of the uploaded file (or zip entry)")
+    invoice_data: Optional[InvoiceData] = Field(None, description="The extracted invoice data")
+    error: Optional[str] = Field(None, description="Error message if processing failed")
+    cached: bool = Field(False, description="Whether the result was served from the extraction cache")
+    validation: Optional[ValidationReport] = Field(None, description="Arithmetic checks of items and totals")
+
+class BatchProcessResponse(BaseModel):
+    total: int = Field(..., description="Number of files in the batch")
+    succeeded: int = Field(..., description="Number of files extracted successfully")
+    failed: int = Field(..., description="Number of files that failed")
+    results: List[BatchItemResult] = Field(..., description="Per-file results, in upload order")
+
+
+# Job Queue Models
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+class JobStatusResponse(BaseModel):
+    job_id: str = Field(..., description="Identifier to poll the job with")
+    status: JobStatus = Field(..., description="Current state of the job")
+    file_name: str = Field(..., description="Name of the uploaded file")
+    created_at: datetime = Field(..., description="When the job was accepted")
+    started_at: Optional[datetime] = Field(None, description="When a worker picked the job up")
+    finished_at: Optional[datetime] = Field(None, description="When the job finished")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
@@ -0,0 +1,78 @@
+import io
+from typing import Tuple
+
+from PIL import Image, ImageChops, ImageOps
+from pydantic import BaseModel, Field
+
+from .config import Settings
+
+# PIL format name and MIME type per output format
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+}
+
+
+class ImageOptions(BaseModel):
+    """How pages are rendered and normalized before they are sent to the model."""
+    pdf_dpi: int = Field(150, description="Resolution PDF pages are rasterized at")
+    max_pages: int = Field(10, description="Pages beyond this are not sent to the model")
+    enabled: bool = Field(True, description="Run the normalization stage at all")
+    max_dimension: int = Field(2048, description="Longest side in pixels; larger images are downscaled")
+    grayscale: bool = Field(False, description="Convert to 8-bit grayscale")
+    output_format: str = Field("jpeg", description="jpeg, webp or png")
+    quality: int = Field(85, description="Encoder quality for jpeg/webp")
+    autocrop: bool = Field(True, description="Trim uniform margins around the page")
+    autocrop_threshold: int = Field(24, description="Pixel difference from the margin colour treated as content")
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ImageOptions":
+        return cls(
+            pdf_dpi=settings.PDF_RENDER_DPI,
+            max_pages=settings.PDF_MAX_PAGES,
+            enabled=settings.IMAGE_PREPROCESS,
+            max_dimension=settings.IMAGE_MAX_DIMENSION,
+            grayscale=settings.IMAGE_GRAYSCALE,
+            output_format=settings.IMAGE_FORMAT.lower(),
+            quality=settings.IMAGE_QUALITY,
+            autocrop=settings.IMAGE_AUTOCROP,
+        )
+
+
+def crop_margins(image: Image.Image, threshold: int) -> Image.Image:
+    """Trim borders that match the top-left pixel colour (scanner bed, blank paper)."""
+    gray = image.convert("L")
+    background = Image.new("L", gray.size, gray.getpixel((0, 0)))
+    diff = ImageChops.difference(gray, background).point(lambda p: 255 if p > threshold else 0)
+    bbox = diff.getbbox()
+    if bbox is None:
+        return image
+    # Keep a small margin so text touching the content edge isn't clipped
+    pad = max(2, min(image.size) // 100)
+    left, top, right, bottom = bbox
+    bbox = (max(0, left - pad), max(0, top - pad), min(image.width, right + pad), min(image.height, bottom + pad))
+    return image.crop(bbox)
+
+
+def normalize_image(image: Image.Image, options: ImageOptions) -> Tuple[bytes, str]:
+    """Apply orientation fix, crop, resize and colour conversion, then re-encode.
+
+    Returns the encoded bytes and their MIME type.
+    """
+    image = ImageOps.exif_transpose(image)
+    if options.autocrop:
+        image = crop_margins(image, options.autocrop_threshold)
+    if max(image.size) > options.max_dimension:
+        image.thumbnail((options.max_dimension, options.max_dimension), Image.Resampling.LANCZOS)
+
+    pil_format, mime_type = OUTPUT_FORMATS[options.output_format]
+    if options.grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    save_kwargs = {"quality": options.quality} if pil_format in ("JPEG", "WEBP") else {"optimize": True}
+    image.save(buffer, format=pil_format, **save_kwargs)
+    return buffer.getvalue(), mime_type
@@ -0,0 +1,371 @@
+"""Per-tenant request rate limits and rolling model-token budgets.
+
+A tenant is a known API key, a signed-in user or, for anonymous calls (and
+keys that don't check out), the client address. Each tenant gets a token bucket refilled at ``requests_per_second``
+(bursting to ``burst``) and a budget of model tokens per rolling ``window``,
+estimated from the current and previous fixed windows, so admitting a request
+costs O(1) however busy the tenant is. The middleware admits or rejects
+requests with ``429`` and ``Retry-After``; the tokens a request actually spent
+are charged from ``usage_metadata`` after each model call.
+
+``MemoryQuotaStore`` keeps the state in the worker process, so with several
+workers each enforces the limits on the traffic it sees. ``RedisQuotaStore``
+shares one state across all workers and hosts.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import auth, metrics
+from .api_keys import ApiKeyPrincipal
+from .backends import get_total_tokens
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+TOKEN_WINDOW_SECONDS = 3600
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(
+            "Too many requests" if reason == "rate" else "Model token budget exhausted"
+        )
+        self.reason = reason
+        self.retry_after = max(0.0, retry_after)
+
+
+def refill(allowance: float, updated: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, allowance + max(0.0, now - updated) * rate)
+
+
+def window_usage(previous: float, current: float, elapsed: float, window: float) -> float:
+    """Sliding-window estimate: the previous window counts in proportion to its overlap."""
+    return previous * (1 - elapsed / window) + current
+
+
+def budget_retry_after(previous: float, current: float, budget: float, elapsed: float, window: float) -> float:
+    """Seconds until ``window_usage`` drops below ``budget``."""
+    if current >= budget:
+        # This window alone is over budget: wait for the next one and for its carry-over to decay
+        return (window - elapsed) + window * (1 - budget / current)
+    return window * (1 - (budget - current) / previous) - elapsed
+
+
+class QuotaStore:
+    """Base class for quota state; ``requests_per_second`` or ``tokens_per_window`` of 0 disables that check."""
+
+    def __init__(
+        self,
+        requests_per_second: float,
+        burst: int,
+        tokens_per_window: int,
+        window: float = TOKEN_WINDOW_SECONDS
+    ):
+        self.requests_per_second = requests_per_second
+        self.burst = max(1, burst)
+        self.tokens_per_window = tokens_per_window
+        self.window = window
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"rate": 0, "tokens": 0}
+        self.tokens_charged = 0
+
+    async def admit(self, tenant: str, check_budget: bool = True) -> None:
+        """Take one request from the tenant's bucket, or raise ``QuotaExceeded``."""
+        try:
+            await self._admit(tenant, check_budget and self.tokens_per_window > 0, time.time())
+        except QuotaExceeded as e:
+            self.rejected[e.reason] += 1
+            metrics.quota_rejections.inc(reason=e.reason)
+            raise
+        self.admitted += 1
+
+    async def charge(self, tenant: str, tokens: int) -> None:
+        if tokens <= 0 or self.tokens_per_window <= 0:
+            return
+        await self._charge(tenant, tokens, time.time())
+        self.tokens_charged += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "requests_per_second": self.requests_per_second,
+            "burst": self.burst,
+            "tokens_per_window": self.tokens_per_window,
+            "window_seconds": self.window,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "tokens_charged": self.tokens_charged,
+        }
+
+    async def close(self) -> None:
+        pass
+
+    async def _admit(self, tenant: str, check_budget: bool, now: float) -> None:
+        raise NotImplementedError
+
+    async def _charge(self, tenant: str, tokens: int, now: float) -> None:
+        raise NotImplementedError
+
+
+class _TenantState:
+    __slots__ = ("allowance", "updated", "index", "previous", "current")
+
+    def __init__(self, allowance: float, now: float, index: int):
+        self.allowance = allowance
+        self.updated = now
+        self.index = index
+        self.previous = 0
+        self.current = 0
+
+    def roll(self, index: int) -> None:
+        if index != self.index:
+            self.previous = self.current if index == self.index + 1 else 0
+            self.current = 0
+            self.index = index
+
+
+class MemoryQuotaStore(QuotaStore):
+    """Quota state in this process; the least recently seen tenants are dropped past ``max_tenants``."""
+
+    def __init__(self, *args, max_tenants: int = 100_000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_tenants = max_tenants
+        self._tenants: "OrderedDict[str, _TenantState]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def _state(self, tenant: str, now: float) -> _TenantState:
+        index = int(now // self.window)
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = self._tenants[tenant] = _TenantState(self.burst, now, index)
+            if len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+        else:
+            self._tenants.move_to_end(tenant)
+            state.roll(index)
+        return state
+
+    async def _admit(self, tenant: str, check_budget: bool, now: float) -> None:
+        state = self._state(tenant, now)
+        if check_budget:
+            elapsed = now % self.window
+            if window_usage(state.previous, state.current, elapsed, self.window) >= self.tokens_per_window:
+                raise QuotaExceeded("tokens", budget_retry_after(
+                    state.previous, state.current, self.tokens_per_window, elapsed, self.window
+                ))
+        if self.requests_per_second <= 0:
+            return
+        allowance = refill(state.allowance, state.updated, now, self.requests_per_second, self.burst)
+        state.updated = now
+        if allowance < 1:
+            state.allowance = allowance
+            raise QuotaExceeded("rate", (1 - allowance) / self.requests_per_second)
+        state.allowance = allowance - 1
+
+    async def _charge(self, tenant: str, tokens: int, now: float) -> None:
+        self._state(tenant, now).current += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "tenants": len(self._tenants)}
+
+
+# Budget check first (read only), then the token bucket; all in one round trip.
+# Returns {0, previous, current} over budget, {1, allowance} rate limited, {2} admitted.
+ADMIT_SCRIPT = """
+local budget = tonumber(ARGV[4])
+if budget > 0 then
+  local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+  local current = tonumber(redis.call('GET', KEYS[3]) or '0')
+  if previous * (1 - tonumber(ARGV[5])) + current >= budget then
+    return {0, tostring(previous), tostring(current)}
+  end
+end
+local rate = tonumber(ARGV[2])
+if rate <= 0 then
+  return {2}
+end
+local now = tonumber(ARGV[1])
+local burst = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'allowance', 'updated')
+local allowance = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+allowance = math.min(burst, allowance + math.max(0, now - updated) * rate)
+if allowance < 1 then
+  return {1, tostring(allowance)}
+end
+redis.call('HSET', KEYS[1], 'allowance', tostring(allowance - 1), 'updated', ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {2}
+"""
+
+
+def require_redis():
+    try:
+        import redis.asyncio
+    except ImportError as e:
+        raise RuntimeError("QUOTA_BACKEND=redis requires redis (pip install 'finzup-api[redis]')") from e
+    return redis.asyncio
+
+
+class RedisQuotaStore(QuotaStore):
+    """Quota state in Redis, shared by every worker; clocks of the workers should agree to within a second."""
+
+    def __init__(self, url: str, *args, prefix: str = "finzup:quota", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefix = prefix
+        self._redis = require_redis().from_url(url)
+        self._admit_script = self._redis.register_script(ADMIT_SCRIPT)
+
+    def _keys(self, tenant: str, index: int) -> Tuple[str, str, str]:
+        base = f"{self.prefix}:{tenant}"
+        return f"{base}:rate", f"{base}:tokens:{index - 1}", f"{base}:tokens:{index}"
+
+    async def _admit(self, tenant: str, check_budget: bool, now: float) -> None:
+        index = int(now // self.window)
+        elapsed = now % self.window
+        budget = self.tokens_per_window if check_budget else 0
+        result = await self._admit_script(
+            keys=self._keys(tenant, index),
+            args=[repr(now), self.requests_per_second, self.burst, budget, elapsed / self.window]
+        )
+        if int(result[0]) == 0:
+            previous, current = float(result[1]), float(result[2])
+            raise QuotaExceeded("tokens", budget_retry_after(previous, current, budget, elapsed, self.window))
+        if int(result[0]) == 1:
+            raise QuotaExceeded("rate", (1 - float(result[1])) / self.requests_per_second)
+
+    async def _charge(self, tenant: str, tokens: int, now: float) -> None:
+        key = self._keys(tenant, int(now // self.window))[2]
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.incrby(key, tokens)
+            pipe.expire(key, int(2 * self.window))
+            await pipe.execute()
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_quota_store(settings: Settings) -> Optional[QuotaStore]:
+    backend = settings.QUOTA_BACKEND.lower()
+    limits = (settings.QUOTA_REQUESTS_PER_SECOND, settings.QUOTA_BURST, settings.QUOTA_TOKENS_PER_HOUR)
+    if backend == "memory":
+        return MemoryQuotaStore(*limits, max_tenants=settings.QUOTA_MAX_TENANTS)
+    if backend == "redis":
+        return RedisQuotaStore(settings.QUOTA_REDIS_URL, *limits)
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown quota backend: {settings.QUOTA_BACKEND}")
+
+
+async def resolve_tenant(
+    scope: Scope,
+    authenticate: Optional[Callable[[str], Awaitable[Optional[ApiKeyPrincipal]]]] = None
+) -> str:
+    """API key, else bearer-token user, else client address.
+
+    A key only becomes its own tenant once ``authenticate`` knows it; made-up
+    keys would otherwise each get a fresh bucket and budget.
+    """
+    headers = Headers(scope=scope)
+    api_key = headers.get("x-api-key")
+    if api_key and authenticate is not None:
+        principal = await authenticate(api_key)
+        if principal is not None:
+            # Same short id as in audit rows
+            return "key:" + principal.key_id
+    authorization = headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        payload = auth.verify_token(authorization[7:])
+        if payload is not None:
+            return "user:" + payload.sub
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+# (store, tenant) of the request being served; model calls made within it are charged to the tenant
+_current: ContextVar[Optional[Tuple[QuotaStore, str]]] = ContextVar("quota_tenant", default=None)
+
+
+def current() -> Optional[Tuple[QuotaStore, str]]:
+    return _current.get()
+
+
+@contextmanager
+def charging(target: Optional[Tuple[QuotaStore, str]]) -> Iterator[None]:
+    """Charge model calls to ``target``, e.g. in a job worker running on behalf of a request."""
+    token = _current.set(target)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+async def charge_usage(usage_metadata: dict) -> None:
+    """Charge the tokens in ``usage_metadata`` to the current tenant; quota errors never fail a request."""
+    target = _current.get()
+    if target is None:
+        return
+    store, tenant = target
+    try:
+        await store.charge(tenant, get_total_tokens(usage_metadata))
+    except Exception:
+        logger.exception("Failed to charge tokens to %s", tenant)
+
+
+class QuotaMiddleware:
+    """Admit requests under ``paths`` against the tenant's quota, answering ``429`` when it is spent.
+
+    The token budget is only checked on POSTs to ``budget_paths`` (the routes
+    that call the model), so a tenant over budget can still poll jobs and read
+    logs. If the quota store is unreachable, requests are let through.
+    ``authenticate`` looks up ``X-API-Key`` (``ApiKeyIndex.authenticate``);
+    without it, keys are ignored and callers are told apart by user or address.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: QuotaStore,
+        paths: Iterable[str],
+        budget_paths: Iterable[str] = (),
+        authenticate: Optional[Callable[[str], Awaitable[Optional[ApiKeyPrincipal]]]] = None
+    ):
+        self.app = app
+        self.store = store
+        self.authenticate = authenticate
+        self.paths = tuple(paths)
+        self.budget_paths = tuple(budget_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        tenant = await resolve_tenant(scope, self.authenticate)
+        check_budget = scope["method"] == "POST" and scope["path"].startswith(self.budget_paths)
+        try:
+            await self.store.admit(tenant, check_budget=check_budget)
+        except QuotaExceeded as e:
+            response = JSONResponse(
+                {"detail": str(e)},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+        except Exception:
+            logger.exception("Quota check failed; admitting the request")
+
+        with charging((self.store, tenant)):
+            await self.app(scope, receive, send)
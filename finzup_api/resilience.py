@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from .backends import ExtractionBackend, get_total_tokens
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: rate limited, overloaded or a gateway hiccup
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Provider errors don't always carry a status code; these markers show up in their messages
+TRANSIENT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "unavailable", "overloaded", "deadline")
+
+
+class BackendUnavailable(Exception):
+    """The model can't take the call right now; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(BackendUnavailable):
+    pass
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    for attr in ("status_code", "code"):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code in TRANSIENT_STATUS_CODES
+    message = str(exc).lower()
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+class CallLimiter:
+    """Caps in-flight model calls and the tokens spent per rolling minute.
+
+    Each call reserves an estimated token count up front; once the call
+    returns the reservation is replaced with what ``usage_metadata`` says was
+    actually spent, so the budget tracks real usage. ``tokens_per_minute=0``
+    disables the token budget.
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int, estimated_tokens: int, window: float = 60.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = tokens_per_minute
+        self.estimated_tokens = estimated_tokens
+        self.window = window
+        self._spent: Deque[List[float]] = deque()
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def tokens_in_window(self) -> int:
+        cutoff = time.monotonic() - self.window
+        while self._spent and self._spent[0][0] <= cutoff:
+            self._spent.popleft()
+        return int(sum(tokens for _, tokens in self._spent))
+
+    async def _acquire_slot(self) -> None:
+        while self._in_flight >= self.max_concurrency:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Woken, then cancelled before it could run: pass the wakeup on or the slot sits idle
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_next()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._in_flight += 1
+
+    def _release_slot(self) -> None:
+        self._in_flight -= 1
+        self._wake_next()
+
+    def _wake_next(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    async def _reserve_tokens(self) -> List[float]:
+        while self.tokens_per_minute > 0:
+            used = self.tokens_in_window()
+            # An empty window always admits one call, however large the estimate
+            if not self._spent or used + self.estimated_tokens <= self.tokens_per_minute:
+                break
+            await asyncio.sleep(max(0.01, self._spent[0][0] + self.window - time.monotonic()))
+        entry = [time.monotonic(), self.estimated_tokens]
+        self._spent.append(entry)
+        return entry
+
+    async def acquire(self) -> List[float]:
+        """Wait for a call slot and token budget; returns the reservation to settle."""
+        await self._acquire_slot()
+        try:
+            return await self._reserve_tokens()
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def release(self, reservation: List[float], tokens_used: int) -> None:
+        reservation[1] = tokens_used
+        self._release_slot()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "tokens_last_minute": self.tokens_in_window(),
+            "tokens_per_minute": self.tokens_per_minute,
+        }
+
+
+class CircuitBreaker:
+    """Fails fast after ``failure_threshold`` consecutive transient failures.
+
+    While open every call is refused for ``reset_timeout`` seconds; then one
+    trial call is let through (half-open) and its outcome closes or reopens
+    the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_in_flight):
+            raise CircuitOpenError(
+                "Model backend is unavailable, try again later",
+                retry_after=max(1.0, self.retry_after())
+            )
+        if state == "half_open":
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Circuit opened after %d consecutive model failures", self.failures)
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Forget a half-open trial that ended without a transient outcome."""
+        self._trial_in_flight = False
+
+
+class ResilientBackend(ExtractionBackend):
+    """Wraps a backend with the call limiter, timeouts, retries and a circuit breaker.
+
+    Transient failures (429/5xx, timeouts) are retried with full-jitter
+    exponential backoff. When retries run out or the circuit is open,
+    ``BackendUnavailable`` is raised with a Retry-After hint; other errors
+    propagate unchanged on the first attempt.
+    """
+
+    def __init__(
+        self,
+        backend: ExtractionBackend,
+        limiter: CallLimiter,
+        breaker: CircuitBreaker,
+        timeout: Optional[float] = 60.0,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0
+    ):
+        self.backend = backend
+        self.limiter = limiter
+        self.breaker = breaker
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    @classmethod
+    def from_settings(cls, backend: ExtractionBackend, settings: Settings) -> "ResilientBackend":
+        return cls(
+            backend,
+            CallLimiter(
+                max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+                estimated_tokens=settings.LLM_ESTIMATED_TOKENS_PER_CALL
+            ),
+            CircuitBreaker(
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=settings.LLM_CIRCUIT_RESET_SECONDS
+            ),
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            base_delay=settings.LLM_RETRY_BASE_DELAY_SECONDS,
+            max_delay=settings.LLM_RETRY_MAX_DELAY_SECONDS
+        )
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    def warm_up(self) -> None:
+        self.backend.warm_up()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _call_once(self, call: Callable[[List[BaseMessage]], Awaitable[Any]], messages: List[BaseMessage]):
+        self.breaker.before_call()
+        reservation = await self.limiter.acquire()
+        tokens_used = 0
+        try:
+            result = await asyncio.wait_for(call(messages), self.timeout)
+        except BaseException as e:
+            if isinstance(e, Exception) and is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_trial()
+            raise
+        else:
+            self.breaker.record_success()
+            tokens_used = get_total_tokens(result[1])
+            return result
+        finally:
+            self.limiter.release(reservation, tokens_used)
+
+    async def _call_with_retries(self, call: Callable[[List[BaseMessage]], Awaitable[Any]], messages: List[BaseMessage]):
+        attempt = 0
+        while True:
+            try:
+                return await self._call_once(call, messages)
+            except BackendUnavailable:
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                if attempt >= self.max_retries:
+                    raise BackendUnavailable(
+                        f"Model backend is unavailable after {attempt + 1} attempts: {e or type(e).__name__}",
+                        retry_after=max(1.0, self.breaker.retry_after(), self.max_delay)
+                    ) from e
+                delay = max(self.backoff(attempt), float(getattr(e, "retry_after", 0) or 0))
+                logger.info("Transient model error (%s), retrying in %.2fs", e or type(e).__name__, delay)
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def extract(self, messages):
+        return await self._call_with_retries(self.backend.extract, messages)
+
+    async def extract_corrections(self, messages):
+        return await self._call_with_retries(self.backend.extract_corrections, messages)
+
+    async def stream(self, messages):
+        """Stream through the same limits; retries only happen before the first chunk."""
+        attempt = 0
+        while True:
+            started = False
+            self.breaker.before_call()
+            reservation = await self.limiter.acquire()
+            tokens_used = 0
+            chunks = self.backend.stream(messages)
+            try:
+                while True:
+                    # The timeout bounds each wait for the model, not the time the caller spends per chunk
+                    async with asyncio.timeout(self.timeout):
+                        try:
+                            partial, usage = await anext(chunks)
+                        except StopAsyncIteration:
+                            break
+                    started = True
+                    if usage is not None:
+                        tokens_used = get_total_tokens(usage)
+                    yield partial, usage
+                self.breaker.record_success()
+                return
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.release_trial()
+                    raise
+                self.breaker.record_failure()
+                if started or attempt >= self.max_retries:
+                    raise BackendUnavailable(
+                        f"Model backend is unavailable after {attempt + 1} attempts: {e or type(e).__name__}",
+                        retry_after=max(1.0, self.breaker.retry_after(), self.max_delay)
+                    ) from e
+            except BaseException:
+                # The caller went away mid-stream
+                self.breaker.release_trial()
+                raise
+            finally:
+                await chunks.aclose()
+                self.limiter.release(reservation, tokens_used)
+            self.retries += 1
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.limiter.stats(),
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retries": self.retries,
+        }
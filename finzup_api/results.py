@@ -0,0 +1,186 @@
+"""Content-addressed storage of extraction results referenced by audit rows.
+
+Each distinct ``output_data`` is stored once in ``audit_results`` under the
+SHA-256 of its canonical JSON, and audit rows keep only that ``output_key``.
+Duplicate uploads, whose output usually comes back from the result cache
+unchanged, then cost a row of scalars instead of another copy of the invoice.
+Results can be compressed with zstd (``pip install 'finzup-api[zstd]'``);
+stored results say how they are encoded, so the setting can change at any time.
+"""
+import base64
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List
+
+from . import db
+from .config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def canonical_json(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def result_key(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def require_zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("RESULT_COMPRESSION=zstd requires zstandard (pip install 'finzup-api[zstd]')") from e
+    return zstandard
+
+
+def decode_result(encoding: str, data: str) -> Dict[str, Any]:
+    if encoding == "zstd":
+        return json.loads(require_zstd().ZstdDecompressor().decompress(base64.b64decode(data)))
+    if encoding == "json":
+        return json.loads(data)
+    raise ValueError(f"Unknown result encoding: {encoding}")
+
+
+class ResultStore:
+    """Moves ``output_data`` out of audit rows on write and puts it back on read.
+
+    ``save`` upserts ``{key, encoding, data, size}`` rows and ``load`` fetches
+    them by key. Keys this process has already saved are remembered (up to
+    ``known_keys``), so a repeated result skips the upsert entirely; recently
+    read results are kept decoded (up to ``cache_size``).
+    """
+
+    def __init__(
+        self,
+        save: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        load: Callable[[List[str]], Awaitable[List[Dict[str, Any]]]],
+        compression: str = "none",
+        level: int = 3,
+        cache_size: int = 1024,
+        known_keys: int = 100_000
+    ):
+        self.save = save
+        self.load = load
+        if compression.lower() not in ("none", "zstd"):
+            raise ValueError(f"Unknown result compression: {compression}")
+        self.encoding = "zstd" if compression.lower() == "zstd" else "json"
+        self._compressor = require_zstd().ZstdCompressor(level=level) if self.encoding == "zstd" else None
+        self.cache_size = cache_size
+        self.known_keys = known_keys
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        # Metrics
+        self.stored = 0
+        self.deduplicated = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.loaded = 0
+        self.cache_hits = 0
+        self.missing = 0
+
+    def encode(self, raw: bytes) -> str:
+        if self._compressor is not None:
+            return base64.b64encode(self._compressor.compress(raw)).decode("ascii")
+        return raw.decode("utf-8")
+
+    async def externalize(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Save each new ``output_data`` and return copies of ``rows`` carrying ``output_key`` instead.
+
+        ``rows`` are left untouched, so a batch that fails to insert is spilled
+        and replayed with its results.
+        """
+        pending: Dict[str, Dict[str, Any]] = {}
+        externalized = []
+        for row in rows:
+            output = row.get("output_data")
+            if output is None:
+                # Every row of a bulk insert needs the same columns
+                externalized.append({**row, "output_key": None})
+                continue
+            raw = canonical_json(output)
+            key = result_key(raw)
+            if key in self._known or key in pending:
+                self.deduplicated += 1
+            else:
+                pending[key] = {"key": key, "encoding": self.encoding, "data": self.encode(raw), "size": len(raw)}
+            externalized.append({**row, "output_data": None, "output_key": key})
+        if pending:
+            await self.save(list(pending.values()))
+            for key, result in pending.items():
+                self._remember(key)
+                self.raw_bytes += result["size"]
+                self.stored_bytes += len(result["data"])
+            self.stored += len(pending)
+        return externalized
+
+    async def rehydrate(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill in ``output_data`` of rows that only reference their result, in one lookup per page."""
+        wanted = {row["output_key"] for row in rows if row.get("output_key") and row.get("output_data") is None}
+        if not wanted:
+            return rows
+        results = {}
+        for key in wanted:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                results[key] = cached
+        self.cache_hits += len(results)
+        missing = sorted(wanted - results.keys())
+        if missing:
+            for stored in await self.load(missing):
+                results[stored["key"]] = self._cache_put(stored["key"], decode_result(stored["encoding"], stored["data"]))
+            self.loaded += len(missing)
+        for row in rows:
+            key = row.get("output_key")
+            if key and row.get("output_data") is None:
+                row["output_data"] = results.get(key)
+                if row["output_data"] is None:
+                    self.missing += 1
+                    logger.warning("Audit log %s references missing result %s", row.get("id"), key)
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "encoding": self.encoding,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "loaded": self.loaded,
+            "cache_hits": self.cache_hits,
+            "missing": self.missing,
+            "cached": len(self._cache),
+        }
+
+    def _remember(self, key: str) -> None:
+        self._known[key] = None
+        self._known.move_to_end(key)
+        if len(self._known) > self.known_keys:
+            self._known.popitem(last=False)
+
+    def _cache_put(self, key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        if self.cache_size > 0:
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+
+result_store = ResultStore(
+    db.store_results,
+    db.get_results,
+    compression=settings.RESULT_COMPRESSION,
+    level=settings.RESULT_ZSTD_LEVEL,
+    cache_size=settings.RESULT_CACHE_SIZE,
+    known_keys=settings.RESULT_KNOWN_KEYS
+)
+
+
+async def insert_audit_logs(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """``AuditLogWriter`` insert: results first, so every ``output_key`` points at a stored row."""
+    return await db.create_audit_logs(await result_store.externalize(rows))
@@ -0,0 +1,189 @@
+"""Production server: several worker processes sharing one listening socket.
+
+    finzup-server                          # WEB_CONCURRENCY workers, default: usable CPUs
+    finzup-server --workers 4 --port 8080  # or: python -m finzup_api.server ...
+
+With gunicorn installed (``pip install 'finzup-api[server]'``) the master
+process imports the heavy libraries and the app once, then forks the
+workers, which share those pages copy-on-write instead of each paying the
+import. Importing the app builds no clients, threads or sockets; every
+worker builds its own in the app lifespan, after the fork. Without gunicorn
+(e.g. on Windows) uvicorn's supervisor spawns the workers instead, and each
+imports everything itself.
+
+Workers run uvloop and httptools when they are installed. On SIGTERM a
+worker stops accepting connections and gives in-flight requests, model calls
+included, ``GRACEFUL_SHUTDOWN_SECONDS`` to finish. The lifespan shutdown then
+drains queued jobs for up to as long again and flushes buffered audit rows
+and API key timestamps before the process exits.
+
+Job status and results go through the SQLite file ``JOB_STORE_PATH``, so any
+worker can answer a poll for a job another worker accepted. The file is per
+host: behind a load balancer spanning hosts, poll with sticky sessions.
+"""
+import argparse
+import importlib
+import importlib.util
+import logging
+import math
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from .config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+APP = "finzup_api.main:app"
+
+# Imported once in the gunicorn master; clients are still built per worker
+PRELOAD_MODULES = [
+    "fitz",
+    "PIL.Image",
+    "langchain_core.messages",
+    "langchain_google_genai",
+    "supabase",
+    "passlib.handlers.bcrypt",
+    "finzup_api.main",
+]
+
+# Extra time gunicorn allows after the graceful period, for the lifespan shutdown's flushes
+SHUTDOWN_FLUSH_SECONDS = 10
+
+
+def usable_cpus() -> int:
+    """CPUs this process may run on, which can be fewer than the machine has."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_workers() -> int:
+    return settings.WEB_CONCURRENCY or usable_cpus()
+
+
+def event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def preload(modules: List[str] = PRELOAD_MODULES) -> List[str]:
+    """Import ``modules``, skipping ones that are not installed; returns those loaded."""
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("Not preloading %s: %s", name, e)
+            continue
+        loaded.append(name)
+    return loaded
+
+
+def gunicorn_options(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "finzup_api.server.Worker",
+        "preload_app": True,
+        "graceful_timeout": math.ceil(2 * args.graceful_timeout) + SHUTDOWN_FLUSH_SECONDS,
+        # Long model calls are normal; only a worker that stops heart-beating is killed
+        "timeout": 120,
+        "keepalive": 5,
+        "accesslog": "-",
+        "errorlog": "-",
+    }
+
+
+def run_gunicorn(args: argparse.Namespace) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(args).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Runs in the master with preload_app, before the workers are forked
+            preload()
+            from .main import app
+            return app
+
+    Application().run()
+
+
+def run_uvicorn(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=event_loop(),
+        http=http_protocol(),
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+
+
+def _worker_class():
+    from uvicorn_worker import UvicornWorker
+
+    class ProductionWorker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": event_loop(), "http": http_protocol()}
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # UvicornWorker would wait for open connections until gunicorn kills it
+            self.config.timeout_graceful_shutdown = settings.GRACEFUL_SHUTDOWN_SECONDS
+
+    return ProductionWorker
+
+
+def __getattr__(name: str):
+    # gunicorn imports the worker class by path; built lazily so uvicorn_worker stays optional
+    if name == "Worker":
+        return _worker_class()
+    raise AttributeError(name)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Finzup API with several worker processes")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", "-w", type=int, default=default_workers(),
+                        help="Worker processes (default: WEB_CONCURRENCY, else usable CPUs)")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.GRACEFUL_SHUTDOWN_SECONDS,
+                        help="Seconds in-flight requests get to finish on SIGTERM")
+    parser.add_argument("--server", choices=("auto", "gunicorn", "uvicorn"), default="auto",
+                        help="auto uses gunicorn when installed (not on Windows)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.workers > 1 and not settings.JOB_STORE_PATH:
+        # Each worker would only know its own jobs, so most polls would 404
+        logger.error("Several workers need a shared job store: set JOB_STORE_PATH or run --workers 1")
+        return 2
+    # Read again by each worker's lifespan: forked workers inherit this object, spawned ones the environment
+    settings.GRACEFUL_SHUTDOWN_SECONDS = args.graceful_timeout
+    os.environ["GRACEFUL_SHUTDOWN_SECONDS"] = str(args.graceful_timeout)
+    use_gunicorn = args.server == "gunicorn" or (
+        args.server == "auto" and sys.platform != "win32"
+        and importlib.util.find_spec("gunicorn") is not None
+        and importlib.util.find_spec("uvicorn_worker") is not None
+    )
+    if use_gunicorn:
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,57 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.callbacks import UsageMetadataCallbackHandler
-from langchain_core.callbacks import get_usage_metadata_callback
-from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage
-from typing import List, Optional, Tuple
+from langchain_core.messages.ai import add_usage
+from typing import Any, AsyncIterator, List, Optional, Tuple
 from finzup_api.config import get_settings
-from finzup_api.models import InvoiceData
+from finzup_api.models import InvoiceData, ValidationReport
+from finzup_api.backends import create_backend, get_total_tokens
+from finzup_api.cache import create_cache, make_cache_key
+from finzup_api import metrics, quotas
+from finzup_api.documents import ParsedDocument, PreparedDocument, run_prepare_document
+from finzup_api.preprocessing import ImageOptions
+from finzup_api.resilience import BackendUnavailable, ResilientBackend
+from finzup_api.streaming import PartialInvoiceTracker
+from finzup_api.suppliers import SupplierIndex, SupplierTemplate
+from finzup_api.validation import apply_corrections, correction_prompt, validate_invoice
 from pydantic import BaseModel, Field
-import fitz  # PyMuPDF for PDF processing
-from PIL import Image
-import io
-import base64
+import asyncio
+import hashlib
+import json
+import logging
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
-# Initialize the Gemini model
-model = init_chat_model(model=settings.GEMINI_MODEL, model_provider="google_genai", temperature=0)
+# Extraction backend (Gemini, or the local fake for tests and load tests), behind the
+# shared call limiter, retries and circuit breaker
+backend = ResilientBackend.from_settings(create_backend(settings), settings)
+
+# Extraction results keyed by file content, model and prompt version
+result_cache = create_cache(settings)
+
+# How page images are normalized before they are sent to the model
+image_options = ImageOptions.from_settings(settings)
+
+# Supplier layouts seen in validated extractions, matched by header fingerprint
+supplier_index = SupplierIndex(
+    settings.TEMPLATES_PATH,
+    max_distance=settings.TEMPLATE_MAX_DISTANCE,
+    max_items=settings.TEMPLATE_MAX_ITEMS,
+    max_templates=settings.TEMPLATE_MAX_COUNT
+) if settings.TEMPLATES_ENABLED else None
 
 class ProcessInvoiceResponse(BaseModel):
     """Response model for invoice processing"""
     invoice_data: Optional[InvoiceData] = Field(None, description="The extracted invoice data")
     error: Optional[str] = Field(None, description="Error message if processing failed")
     usage_metadata: dict = Field(default_factory=dict, description="Token usage metadata")
+    cached: bool = Field(False, description="Whether the result was served from the extraction cache")
+    num_pages: int = Field(0, description="Number of pages in the uploaded document")
+    document_metadata: dict = Field(default_factory=dict, description="Metadata of the uploaded document")
+    preprocessing: dict = Field(default_factory=dict, description="Image normalization stats (bytes uploaded vs sent)")
+    warnings: List[str] = Field(default_factory=list, description="Non-fatal problems, e.g. pages that could not be extracted")
+    retry_after: Optional[float] = Field(None, description="Set when the model backend is unavailable; seconds to wait before retrying")
+    validation: Optional[ValidationReport] = Field(None, description="Arithmetic checks of items and totals")
+    supplier_template: Optional[str] = Field(None, description="ID of the known supplier layout whose hint was used")
 
 INVOICE_PROMPT = """
 You are an expert at extracting structured data from invoices. 
@@ -32,79 +62,368 @@ The invoice should be in Hebrew, but can be in English.
 Keep the original invoice values, don't change them, don't translate them.
 """
 
+# Changes whenever the prompt text changes, so cached results are not reused across prompts
+INVOICE_PROMPT_VERSION = hashlib.sha256(INVOICE_PROMPT.encode("utf-8")).hexdigest()[:12]
+
 def get_num_pages(file_content: bytes, file_type: str) -> int:
-    if file_type == "pdf":
-        doc = fitz.open(stream=file_content, filetype="pdf")
-        return len(doc)
-    return 1
+    with ParsedDocument(file_content, file_type) as document:
+        return document.num_pages
 
 def prepare_image_data(file_content: bytes, file_type: str) -> str:
-    if file_type == "pdf":
-        doc = fitz.open(stream=file_content, filetype="pdf")
-        image = doc[0].get_pixmap()
-        image_bytes = image.tobytes()
-        mime_type = "application/pdf"
-    else:
-        image = Image.open(io.BytesIO(file_content))
-        image_bytes = file_content
-        mime_type = f"image/{file_type}"
-
-    # Convert to base64
-    base64_data = base64.b64encode(image_bytes).decode('utf-8')
-    
-    # Return the base64 data with mime type
-    return f"data:{mime_type};base64,{base64_data}"
+    with ParsedDocument(file_content, file_type) as document:
+        return document.render_page_data()
+
+def get_cache_key(file_content: bytes) -> str:
+    return make_cache_key(
+        file_content,
+        backend.name,
+        settings.GEMINI_MODEL,
+        INVOICE_PROMPT_VERSION,
+        image_options.model_dump_json(),
+        json.dumps([
+            settings.VALIDATION_ENABLED,
+            settings.VALIDATION_REEXTRACT,
+            settings.VAT_RATES,
+            settings.VALIDATION_ITEM_TOLERANCE_NIS,
+            settings.VALIDATION_TOTAL_TOLERANCE_NIS
+        ])
+    )
+
+def merge_usage_metadata(*usages: dict) -> dict:
+    """Sum per-model usage dicts from several calls."""
+    merged = {}
+    for usage in usages:
+        for model_name, model_usage in usage.items():
+            merged[model_name] = add_usage(merged[model_name], model_usage) if model_name in merged else model_usage
+    return merged
 
 async def process_invoice(
     file_content: bytes,
     file_type: str,
     file_name: str,
-    file_size: int
+    file_size: int,
+    bypass_cache: bool = False
 ) -> ProcessInvoiceResponse:
+    """Extract invoice data, serving repeated uploads from the result cache.
+
+    With ``bypass_cache`` the lookup is skipped; a successful fresh result
+    still replaces the stored entry.
+    """
+    with metrics.stage("cache_lookup"):
+        cache_key = get_cache_key(file_content)
+        cached = None if bypass_cache else await result_cache.aget(cache_key)
+    if cached is not None:
+        metrics.extractions.inc(outcome="cached")
+        return ProcessInvoiceResponse.model_validate({**cached, "cached": True})
+
+    result = await _extract_invoice(file_content, file_type)
+    if result.invoice_data is not None:
+        with metrics.stage("cache_store"):
+            await result_cache.aset(cache_key, result.model_dump(mode="json"))
+    metrics.extractions.inc(outcome="success" if result.invoice_data is not None else "error")
+    return result
+
+async def process_invoice_batch(
+    files: List[Tuple[bytes, str, str]],
+    max_concurrency: int,
+    bypass_cache: bool = False
+) -> List[ProcessInvoiceResponse]:
+    """Process ``(content, file_type, file_name)`` tuples with at most ``max_concurrency`` in flight.
+
+    Results are returned in input order.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(file_content: bytes, file_type: str, file_name: str) -> ProcessInvoiceResponse:
+        async with semaphore:
+            return await process_invoice(
+                file_content,
+                file_type,
+                file_name,
+                len(file_content),
+                bypass_cache=bypass_cache
+            )
+
+    return await asyncio.gather(*(run(*f) for f in files))
+
+async def stream_invoice(
+    file_content: bytes,
+    file_type: str,
+    bypass_cache: bool = False
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Extract invoice data, yielding ``(event, payload)`` progress as it goes.
+
+    Events are ``document_parsed``, ``pages_rendered``, ``model_started``,
+    ``header`` and one ``item`` per line item as the model streams them, then
+    ``validation`` with the arithmetic checks (after any focused re-read, so
+    the result may differ from the streamed items). The last event is always
+    ``("result", ProcessInvoiceResponse)``, which may carry an error.
+    Multi-page documents are sent in one combined call so there is a single
+    stream to follow.
+    """
+    with metrics.stage("cache_lookup"):
+        cache_key = get_cache_key(file_content)
+        cached = None if bypass_cache else await result_cache.aget(cache_key)
+    if cached is not None:
+        metrics.extractions.inc(outcome="cached")
+        yield "result", ProcessInvoiceResponse.model_validate({**cached, "cached": True})
+        return
+
+    document_info = {}
+    usage_metadata = {}
     try:
-        # Get number of pages
-        num_pages = get_num_pages(file_content, file_type)
-        
-        # Prepare the image data
-        image_data = prepare_image_data(file_content, file_type)
-
-        # Create the message with multimodal content
-        message = HumanMessage(
-            content=[
-                INVOICE_PROMPT,
-                {"type": "image_url", "image_url": image_data}
-            ]
+        with metrics.stage("prepare_document"):
+            document = await run_prepare_document(file_content, file_type, image_options, _header_fraction())
+        document_info, warnings = _describe_document(document)
+        yield "document_parsed", {"num_pages": document.num_pages, "document_metadata": document.metadata}
+        yield "pages_rendered", {"pages": len(document.page_data), **document.preprocessing}
+
+        template = _match_template(document)
+        hint = _combined_hint(document.page_data) if len(document.page_data) > 1 else None
+        message = _build_message(document.page_data, hint, template)
+        yield "model_started", {"pages": len(document.page_data)}
+
+        tracker = PartialInvoiceTracker()
+        output = None
+        with metrics.llm_calls_in_flight.track():
+            async for partial, usage in backend.stream([message]):
+                if usage is not None:
+                    output, usage_metadata = partial, usage
+                for event in tracker.update(partial, final=usage is not None):
+                    yield event
+
+        await _record_usage(usage_metadata)
+
+        with metrics.stage("validation"):
+            invoice = InvoiceData.model_validate(output)
+        invoice, validation, correction_usage, validation_warnings = await _check_arithmetic(
+            invoice, document.page_data
+        )
+        if validation is not None:
+            yield "validation", validation.model_dump(mode="json")
+        await _learn_template(document, invoice, validation)
+        result = ProcessInvoiceResponse(
+            invoice_data=invoice,
+            usage_metadata=merge_usage_metadata(usage_metadata, correction_usage),
+            warnings=warnings + validation_warnings,
+            validation=validation,
+            supplier_template=template.id if template else None,
+            **document_info
         )
+        with metrics.stage("cache_store"):
+            await result_cache.aset(cache_key, result.model_dump(mode="json"))
+    except BackendUnavailable as e:
+        result = ProcessInvoiceResponse(error=str(e), retry_after=e.retry_after, **document_info)
+    except Exception as e:
+        result = ProcessInvoiceResponse(error=str(e), usage_metadata=usage_metadata, **document_info)
+    metrics.extractions.inc(outcome="success" if result.invoice_data is not None else "error")
+    yield "result", result
+
+def merge_invoice_pages(pages: List[InvoiceData]) -> InvoiceData:
+    """Merge per-page extractions of one invoice.
+
+    Header fields repeat on every page, so the first page's values are kept
+    (optional ones fall back to the first page that has them). Items are
+    concatenated in page order, and the total is the largest one seen, since
+    continuation pages often print running subtotals.
+    """
+    merged = pages[0].model_copy(deep=True)
+    for page in pages[1:]:
+        if merged.delivery_company is None and page.delivery_company is not None:
+            merged.delivery_company = page.delivery_company
+        merged.items.extend(page.items)
+        merged.totalAmountNis = max(merged.totalAmountNis, page.totalAmountNis)
+    return merged
+
+def _build_message(
+    page_data: List[str],
+    page_hint: Optional[str] = None,
+    template: Optional[SupplierTemplate] = None
+) -> HumanMessage:
+    prompt = INVOICE_PROMPT
+    if template is not None:
+        prompt = f"{prompt}\n{template.hint()}\n"
+    if page_hint is not None:
+        prompt = f"{prompt}\n{page_hint}\n"
+    # Create the message with multimodal content
+    return HumanMessage(
+        content=[prompt] + [{"type": "image_url", "image_url": data} for data in page_data]
+    )
 
-        # Process with Gemini
-        with get_usage_metadata_callback() as cb:
-            response = await model.with_structured_output(InvoiceData).ainvoke([message])
+async def _invoke_model(
+    page_data: List[str],
+    page_hint: Optional[str] = None,
+    template: Optional[SupplierTemplate] = None
+) -> Tuple[InvoiceData, dict]:
+    message = _build_message(page_data, page_hint, template)
+    with metrics.stage("model_call"), metrics.llm_calls_in_flight.track():
+        invoice, usage_metadata = await backend.extract([message])
+    await _record_usage(usage_metadata)
+    return invoice, usage_metadata
 
-            # Parse the response
-            try:
+async def _record_usage(usage_metadata: dict) -> None:
+    metrics.record_usage(usage_metadata)
+    # Charged to the tenant whose request (or job) made the call
+    await quotas.charge_usage(usage_metadata)
+
+def _combined_hint(page_data: List[str]) -> str:
+    return f"The {len(page_data)} images are the pages of one invoice, in order."
+
+async def _extract_pages(
+    page_data: List[str],
+    template: Optional[SupplierTemplate] = None
+) -> Tuple[InvoiceData, dict, List[str]]:
+    """Run the model over the rendered pages; returns the invoice, token usage and per-page warnings."""
+    if len(page_data) == 1:
+        return (*await _invoke_model(page_data, template=template), [])
+    if settings.PDF_PAGE_MODE == "combined":
+        return (*await _invoke_model(page_data, _combined_hint(page_data), template), [])
+
+    # One concurrent call per page, merged afterwards
+    results = await asyncio.gather(
+        *(
+            _invoke_model([data], f"This image is page {i + 1} of {len(page_data)} of the invoice.", template)
+            for i, data in enumerate(page_data)
+        ),
+        return_exceptions=True
+    )
+    pages = [r for r in results if not isinstance(r, BaseException)]
+    warnings = [
+        f"Page {i + 1} could not be extracted: {r}"
+        for i, r in enumerate(results) if isinstance(r, BaseException)
+    ]
+    if not pages:
+        raise results[0]
+    invoice = merge_invoice_pages([page for page, _ in pages])
+    return invoice, merge_usage_metadata(*(usage for _, usage in pages)), warnings
+
+def _header_fraction() -> Optional[float]:
+    # Only fingerprint documents when there is an index to look them up in
+    return settings.TEMPLATE_HEADER_FRACTION if supplier_index is not None else None
+
+def _match_template(document: PreparedDocument) -> Optional[SupplierTemplate]:
+    if supplier_index is None or document.fingerprint is None:
+        return None
+    with metrics.stage("template_lookup"):
+        match = supplier_index.match(document.fingerprint)
+    metrics.supplier_templates.inc(outcome="hit" if match else "miss")
+    return match[0] if match else None
+
+async def _learn_template(
+    document: PreparedDocument,
+    invoice: InvoiceData,
+    validation: Optional[ValidationReport]
+) -> None:
+    """Remember the supplier layout of an invoice whose totals add up; never fails the request."""
+    if supplier_index is None or validation is None or not validation.valid:
+        return
+    try:
+        await asyncio.to_thread(supplier_index.learn, document.fingerprint, invoice, validation)
+    except Exception:
+        logger.exception("Failed to learn supplier template")
+
+def _validate(invoice: InvoiceData) -> ValidationReport:
+    return validate_invoice(
+        invoice,
+        settings.VAT_RATES,
+        settings.VALIDATION_ITEM_TOLERANCE_NIS,
+        settings.VALIDATION_TOTAL_TOLERANCE_NIS
+    )
+
+async def _check_arithmetic(
+    invoice: InvoiceData,
+    page_data: List[str]
+) -> Tuple[InvoiceData, Optional[ValidationReport], dict, List[str]]:
+    """Validate totals; when they don't add up, re-read only the failing fields.
+
+    Returns the (possibly corrected) invoice, the report, the usage of the
+    focused call and warnings. A failed re-read keeps the original values.
+    """
+    if not settings.VALIDATION_ENABLED:
+        return invoice, None, {}, []
+    report = _validate(invoice)
+    if report.valid or not settings.VALIDATION_REEXTRACT:
+        metrics.invoice_validations.inc(outcome="valid" if report.valid else "invalid")
+        return invoice, report, {}, []
+
+    hint = _combined_hint(page_data) if len(page_data) > 1 else ""
+    message = HumanMessage(
+        content=[f"{correction_prompt(report)}\n{hint}"] + [{"type": "image_url", "image_url": data} for data in page_data]
+    )
+    try:
+        with metrics.stage("reextraction"), metrics.llm_calls_in_flight.track():
+            corrections, usage_metadata = await backend.extract_corrections([message])
+        await _record_usage(usage_metadata)
+        corrected, changed = apply_corrections(invoice, report, corrections)
+    except Exception as e:
+        metrics.invoice_validations.inc(outcome="invalid")
+        return invoice, report, {}, [f"Re-extraction of inconsistent fields failed: {e}"]
+
+    final = _validate(corrected).model_copy(update={"corrected_fields": changed, "reextracted": True})
+    metrics.invoice_validations.inc(outcome="corrected" if final.valid else "invalid")
+    return corrected, final, usage_metadata, []
+
+def _describe_document(document: PreparedDocument) -> Tuple[dict, List[str]]:
+    """Response fields describing the document, and warnings about pages left out."""
+    document_info = {
+        "num_pages": document.num_pages,
+        "document_metadata": document.metadata,
+        "preprocessing": document.preprocessing
+    }
+    warnings = []
+    if document.num_pages > len(document.page_data):
+        warnings.append(f"Only the first {len(document.page_data)} of {document.num_pages} pages were processed")
+    return document_info, warnings
+
+async def _extract_invoice(file_content: bytes, file_type: str) -> ProcessInvoiceResponse:
+    document_info = {}
+    try:
+        # Parse, normalize and render the document once, off the event loop
+        with metrics.stage("prepare_document"):
+            document = await run_prepare_document(file_content, file_type, image_options, _header_fraction())
+        document_info, warnings = _describe_document(document)
+
+        # Process with the extraction backend, hinted with the supplier's known layout if any
+        template = _match_template(document)
+        response, usage_metadata, page_warnings = await _extract_pages(document.page_data, template)
+        response, validation, correction_usage, validation_warnings = await _check_arithmetic(
+            response, document.page_data
+        )
+        await _learn_template(document, response, validation)
+        usage_metadata = merge_usage_metadata(usage_metadata, correction_usage)
+
+        # Parse the response
+        try:
+            with metrics.stage("validation"):
                 return ProcessInvoiceResponse(
                     invoice_data=response,
                     error=None,
-                    usage_metadata=cb.usage_metadata
-                )
-            except Exception as e:
-                return ProcessInvoiceResponse(
-                    invoice_data=None,
-                    error=f"Failed to parse invoice data: {str(e)}",
-                    usage_metadata=cb.usage_metadata
+                    usage_metadata=usage_metadata,
+                    warnings=warnings + page_warnings + validation_warnings,
+                    validation=validation,
+                    supplier_template=template.id if template else None,
+                    **document_info
                 )
+        except Exception as e:
+            return ProcessInvoiceResponse(
+                invoice_data=None,
+                error=f"Failed to parse invoice data: {str(e)}",
+                usage_metadata=usage_metadata,
+                **document_info
+            )
 
+    except BackendUnavailable as e:
+        return ProcessInvoiceResponse(
+            invoice_data=None,
+            error=str(e),
+            usage_metadata={},
+            retry_after=e.retry_after,
+            **document_info
+        )
     except Exception as e:
         return ProcessInvoiceResponse(
             invoice_data=None,
             error=str(e),
-            usage_metadata={}
+            usage_metadata={},
+            **document_info
         )
-    
-if __name__ == "__main__":
-    import asyncio
-
-    with open("/Users/adiel/git/invoce-scanner/data/invoices-images/invoice_14.jpeg", "rb") as f:
-        file_content = f.read()
-    result = asyncio.run(process_invoice(file_content, "jpeg", "test.jpeg", 1))
-    print(f"Result: {result.model_dump_json(indent=2)}")
\ No newline at end of file
@@ -0,0 +1,43 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+# Headers that stop proxies (nginx, Render) from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Top-level fields the model produces after the line items
+TRAILING_FIELDS = ("items", "totalAmountNis")
+
+
+def format_sse(event: str, data: Any) -> bytes:
+    """Encode one server-sent event with a JSON payload."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class PartialInvoiceTracker:
+    """Turns cumulative partial model output into header and per-item events.
+
+    The JSON is generated in schema order, so once ``items`` appears the
+    header fields are complete, and item ``n`` is complete as soon as item
+    ``n + 1`` starts. The last item is only emitted with the final output.
+    """
+
+    def __init__(self):
+        self.header_sent = False
+        self.items_sent = 0
+
+    def update(self, partial: Dict[str, Any], final: bool = False) -> List[Tuple[str, Any]]:
+        events = []
+        if not isinstance(partial, dict):
+            return events
+        items = partial.get("items")
+        if not self.header_sent and (items is not None or final):
+            header = {key: value for key, value in partial.items() if key not in TRAILING_FIELDS}
+            events.append(("header", header))
+            self.header_sent = True
+        if isinstance(items, list):
+            complete = len(items) if final else len(items) - 1
+            while self.items_sent < complete:
+                events.append(("item", {"index": self.items_sent, "item": items[self.items_sent]}))
+                self.items_sent += 1
+        return events
@@ -0,0 +1,284 @@
+"""Supplier layout fingerprints and the few-shot hints learned from validated extractions.
+
+Each document's first page is reduced to a 64-bit difference hash (dHash) of
+its header band, which stays stable across invoices from the same supplier
+template while the line items change. Fingerprints are indexed by
+multi-index hashing, so the nearest stored template within a Hamming distance
+is found without scanning every entry. Templates are learned only from
+extractions that passed the arithmetic checks, and are appended to a JSONL
+file that is replayed on start.
+"""
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so the template log is only safe with one worker
+    fcntl = None
+
+from PIL import Image, ImageOps
+from pydantic import BaseModel, Field
+
+from .models import InvoiceData, ValidationReport
+from .preprocessing import crop_margins
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+
+
+def dhash(image: Image.Image, header_fraction: float = 0.25, crop_threshold: int = 24) -> int:
+    """Difference hash of the page's header band, with scan margins trimmed.
+
+    The band is cut from the full page before trimming, so the line items
+    below it never shift what gets hashed.
+    """
+    image = ImageOps.exif_transpose(image)
+    header = crop_margins(image.crop((0, 0, image.width, max(1, int(image.height * header_fraction)))), crop_threshold)
+    pixels = header.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit fingerprints.
+
+    Each fingerprint is split into ``blocks`` chunks, each with its own exact
+    hash table. By the pigeonhole principle, any fingerprint within distance
+    ``d`` agrees with the query within ``d // blocks`` bits on at least one
+    chunk, so a search probes only those nearby chunk values and checks the
+    few candidates it finds, instead of every stored fingerprint.
+    """
+
+    def __init__(self, blocks: int = 4):
+        self.blocks = blocks
+        self._width = HASH_SIZE * HASH_SIZE // blocks
+        self._mask = (1 << self._width) - 1
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(blocks)]
+        self._entries: List[Tuple[int, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _chunks(self, fingerprint: int) -> List[int]:
+        return [(fingerprint >> (block * self._width)) & self._mask for block in range(self.blocks)]
+
+    def add(self, fingerprint: int, value: Any) -> None:
+        self._entries.append((fingerprint, value))
+        for table, chunk in zip(self._tables, self._chunks(fingerprint)):
+            table.setdefault(chunk, []).append(len(self._entries) - 1)
+
+    def search(self, fingerprint: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """Every value within ``max_distance``, closest first."""
+        seen: Set[int] = set()
+        found = []
+        for table, chunk in zip(self._tables, self._chunks(fingerprint)):
+            for flip in _flip_masks(self._width, max_distance // self.blocks):
+                for entry in table.get(chunk ^ flip, ()):
+                    if entry in seen:
+                        continue
+                    seen.add(entry)
+                    candidate, value = self._entries[entry]
+                    distance = hamming(fingerprint, candidate)
+                    if distance <= max_distance:
+                        found.append((distance, value))
+        found.sort(key=lambda match: match[0])
+        return found
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(width: int, radius: int) -> Tuple[int, ...]:
+    """Every ``width``-bit mask with at most ``radius`` bits set."""
+    return tuple(
+        sum(1 << bit for bit in bits)
+        for count in range(radius + 1)
+        for bits in combinations(range(width), count)
+    )
+
+
+class SupplierTemplate(BaseModel):
+    """What previously validated invoices with this layout had in common."""
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    fingerprint: int
+    supplier: Dict[str, Any] = Field(..., description="Supplier name and address as last validated")
+    vat_rate: Optional[float] = Field(None, description="VAT rate that reconciled the totals")
+    invoice_number_digits: Optional[int] = None
+    date_example: Optional[str] = None
+    items: Dict[str, str] = Field(default_factory=dict, description="Known items by barcode: description")
+    seen: int = 1
+
+    def hint(self) -> str:
+        """Prompt lines describing this supplier; amounts are always read from the document."""
+        address = self.supplier.get("address") or {}
+        details = ", ".join(
+            f"{name} {address[name]}" for name in ("street", "city", "phone", "fax", "email", "license")
+            if address.get(name)
+        )
+        lines = [
+            "This invoice matches the layout of a known supplier. Earlier validated invoices from it had:",
+            f"- supplier: {self.supplier.get('name')}" + (f" ({details})" if details else ""),
+        ]
+        if self.vat_rate is not None:
+            lines.append(f"- totalAmountNis {'net of VAT' if self.vat_rate == 0 else f'including {self.vat_rate:.0%} VAT'}")
+        if self.invoice_number_digits:
+            lines.append(f"- {self.invoice_number_digits}-digit invoice numbers; dates like {self.date_example}")
+        if self.items:
+            catalog = "; ".join(f"{barcode}: {description}" for barcode, description in self.items.items())
+            lines.append(f"- known items (barcode: description): {catalog}")
+        lines.append(
+            "Use these to read names and descriptions accurately, but take every number, date and item "
+            "from this document; if it disagrees, the document wins."
+        )
+        return "\n".join(lines)
+
+    def learn(self, invoice: InvoiceData, validation: ValidationReport, max_items: int) -> None:
+        self.supplier = invoice.supplier.model_dump(mode="json", exclude_none=True)
+        self.vat_rate = validation.vat_rate
+        self.invoice_number_digits = len(str(invoice.invoiceNumber))
+        self.date_example = invoice.invoiceDate
+        # Copy on write: hint() may be iterating the current catalog on another thread
+        items = dict(self.items)
+        for item in invoice.items:
+            if item.barcode and (item.barcode in items or len(items) < max_items):
+                items[item.barcode] = item.description
+        self.items = items
+        self.seen += 1
+
+
+class SupplierIndex:
+    """Supplier templates keyed by header fingerprint, with near-duplicate lookup.
+
+    ``path`` (optional) is an append-only JSONL log of template snapshots;
+    the latest snapshot per template wins on load, and the log is compacted
+    when it holds more than twice as many lines as templates. Workers share
+    the log: appends and the load-and-compact on start hold an exclusive
+    ``flock`` on ``<path>.lock``, so a compaction always includes every line
+    appended before it and no append lands in a file about to be replaced.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_distance: int = 10,
+        max_items: int = 30,
+        max_templates: int = 50_000
+    ):
+        self.path = Path(path) if path else None
+        self.max_distance = max_distance
+        self.max_items = max_items
+        self.max_templates = max_templates
+        self.templates: Dict[str, SupplierTemplate] = {}
+        self._fingerprints = HammingIndex()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _load(self) -> None:
+        with self._file_lock():
+            if self.path.exists():
+                self._replay()
+
+    def _replay(self) -> None:
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                lines += 1
+                try:
+                    template = SupplierTemplate.model_validate_json(line)
+                except ValueError:
+                    logger.warning("Skipping unreadable supplier template line")
+                    continue
+                if template.id not in self.templates:
+                    self._fingerprints.add(template.fingerprint, template.id)
+                self.templates[template.id] = template
+        if lines > 2 * len(self.templates):
+            self._compact()
+
+    def _compact(self) -> None:
+        # Only called with the file lock held
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for template in self.templates.values():
+                f.write(template.model_dump_json() + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _append(self, template: SupplierTemplate) -> None:
+        if self.path is None:
+            return
+        with self._file_lock(), open(self.path, "a", encoding="utf-8") as f:
+            f.write(template.model_dump_json() + "\n")
+
+    def _closest(self, fingerprint: int) -> Optional[Tuple[SupplierTemplate, int]]:
+        matches = self._fingerprints.search(fingerprint, self.max_distance)
+        if not matches:
+            return None
+        distance, template_id = matches[0]
+        return self.templates[template_id], distance
+
+    def match(self, fingerprint: Optional[int]) -> Optional[Tuple[SupplierTemplate, int]]:
+        """The closest template within ``max_distance`` and its distance, or None."""
+        if fingerprint is None:
+            return None
+        with self._lock:
+            match = self._closest(fingerprint)
+            if match is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return match
+
+    def learn(self, fingerprint: Optional[int], invoice: InvoiceData, validation: Optional[ValidationReport]) -> None:
+        """Record a validated extraction under its fingerprint; unvalidated results are ignored."""
+        if fingerprint is None or validation is None or not validation.valid:
+            return
+        with self._lock:
+            match = self._closest(fingerprint)
+            if match is not None and match[0].supplier.get("name") == invoice.supplier.name:
+                template = match[0]
+                template.learn(invoice, validation, self.max_items)
+            else:
+                if len(self.templates) >= self.max_templates:
+                    return
+                template = SupplierTemplate(fingerprint=fingerprint, supplier={}, seen=0)
+                template.learn(invoice, validation, self.max_items)
+                self.templates[template.id] = template
+                self._fingerprints.add(fingerprint, template.id)
+            try:
+                self._append(template)
+            except OSError:
+                logger.exception("Failed to persist supplier template")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"templates": len(self.templates), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,133 @@
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from starlette.responses import JSONResponse
+
+# Leading bytes of every accepted format, mapped to the canonical file type
+MAGIC_NUMBERS = (
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"PK\x03\x04", "zip"),
+)
+
+# Extensions that share a canonical type
+EXTENSION_ALIASES = {"jpg": "jpeg"}
+
+CHUNK_SIZE = 64 * 1024
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class UploadRejected(Exception):
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def sniff_file_type(head: bytes) -> Optional[str]:
+    """Identify the document type from its first bytes, or None if it isn't one we accept."""
+    # PDFs may have a few bytes of junk before the header
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+    for magic, file_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return file_type
+    return None
+
+
+async def read_upload_limited(
+    file: UploadFile,
+    max_size: int,
+    allowed_types: Iterable[str],
+    chunk_size: int = CHUNK_SIZE
+) -> Tuple[bytes, str]:
+    """Read an upload chunk by chunk, stopping as soon as it exceeds ``max_size``.
+
+    The first chunk is sniffed, so payloads that aren't one of ``allowed_types``
+    are rejected before anything else is buffered. Returns the content and the
+    sniffed file type.
+    """
+    allowed = {EXTENSION_ALIASES.get(t, t) for t in allowed_types}
+    chunks: List[bytes] = []
+    size = 0
+    file_type = None
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        if file_type is None:
+            file_type = sniff_file_type(chunk)
+            if file_type is None or file_type not in allowed:
+                if allowed == {"zip"}:
+                    raise UploadRejected("File content is not a zip archive")
+                raise UploadRejected("File content is not a supported PDF or image")
+        size += len(chunk)
+        if size > max_size:
+            raise UploadRejected(f"File too large. Maximum size: {max_size} bytes")
+        chunks.append(chunk)
+    if file_type is None:
+        raise UploadRejected("File is empty")
+    return b"".join(chunks), file_type
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized request bodies on upload routes before they are parsed.
+
+    A declared ``Content-Length`` over the limit is refused without reading
+    the body; chunked bodies are counted as they stream in and cut off as
+    soon as they cross it.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int, paths: Iterable[str]):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = set(paths)
+
+    def _reject(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=400,
+            content={"detail": f"File too large. Maximum size: {self.max_body_size - MULTIPART_OVERHEAD} bytes"}
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject()(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._reject()(scope, receive, send)
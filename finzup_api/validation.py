@@ -0,0 +1,106 @@
+"""Arithmetic checks on extracted invoices and the focused re-extraction prompt for failures.
+
+Every item must satisfy ``quantity * unitPriceNis ≈ totalPriceNis`` and the
+item totals must add up to ``totalAmountNis``, either net or with one of the
+accepted VAT rates. Only the fields involved in a failing check are sent back
+to the model, so well-read invoices cost nothing extra.
+"""
+from typing import List, Sequence, Set, Tuple
+
+from .models import InvoiceCorrections, InvoiceData, InvoiceItem, ValidationIssue, ValidationReport
+
+ITEM_FIELDS = ("quantity", "unitPriceNis", "totalPriceNis")
+
+
+def validate_invoice(
+    invoice: InvoiceData,
+    vat_rates: Sequence[float],
+    item_tolerance: float,
+    total_tolerance: float
+) -> ValidationReport:
+    issues: List[ValidationIssue] = []
+    for index, item in enumerate(invoice.items):
+        expected = round(item.quantity * item.unitPriceNis, 2)
+        if abs(expected - item.totalPriceNis) > item_tolerance:
+            issues.append(ValidationIssue(
+                field=f"items[{index}].totalPriceNis",
+                expected=expected,
+                actual=item.totalPriceNis,
+                message=(
+                    f"Item {index + 1} ({item.description}): quantity {item.quantity} x unit price "
+                    f"{item.unitPriceNis} = {expected}, but the item total reads {item.totalPriceNis}"
+                )
+            ))
+
+    items_total = round(sum(item.totalPriceNis for item in invoice.items), 2)
+    vat_rate = None
+    for rate in (0.0, *vat_rates):
+        if abs(items_total * (1 + rate) - invoice.totalAmountNis) <= total_tolerance:
+            vat_rate = rate
+            break
+    if vat_rate is None:
+        gross = ", ".join(f"{round(items_total * (1 + rate), 2)} with {rate:.0%} VAT" for rate in vat_rates)
+        issues.append(ValidationIssue(
+            field="totalAmountNis",
+            expected=items_total,
+            actual=invoice.totalAmountNis,
+            message=(
+                f"The item totals add up to {items_total}" + (f" ({gross})" if gross else "")
+                + f", but the invoice total reads {invoice.totalAmountNis}"
+            )
+        ))
+
+    return ValidationReport(valid=not issues, items_total=items_total, vat_rate=vat_rate, issues=issues)
+
+
+def failing_items(report: ValidationReport) -> Set[int]:
+    return {
+        int(issue.field[len("items["):issue.field.index("]")])
+        for issue in report.issues if issue.field.startswith("items[")
+    }
+
+
+def correction_prompt(report: ValidationReport) -> str:
+    """Ask for the failing fields only; the model returns ``InvoiceCorrections``."""
+    requests = []
+    for index in sorted(failing_items(report)):
+        requests.append(f"- items[{index}]: re-read quantity, unitPriceNis and totalPriceNis")
+    if any(issue.field == "totalAmountNis" for issue in report.issues):
+        requests.append("- totalAmountNis: re-read the invoice total")
+    problems = "\n".join(f"- {issue.message}" for issue in report.issues)
+    return (
+        "These values were extracted from the attached invoice, but they do not add up:\n"
+        f"{problems}\n\n"
+        "Look at the invoice again and return only these fields, exactly as printed:\n"
+        + "\n".join(requests)
+        + "\nItem indexes are zero-based positions in the invoice's item list. "
+        "Leave a field null if it cannot be read."
+    )
+
+
+def apply_corrections(
+    invoice: InvoiceData,
+    report: ValidationReport,
+    corrections: InvoiceCorrections
+) -> Tuple[InvoiceData, List[str]]:
+    """Apply re-read values to the fields that were asked about; anything else is ignored."""
+    corrected = invoice.model_copy(deep=True)
+    changed: List[str] = []
+    allowed_items = failing_items(report)
+    for correction in corrections.items:
+        if correction.index not in allowed_items or correction.index >= len(corrected.items):
+            continue
+        item = corrected.items[correction.index]
+        updates = {
+            name: getattr(correction, name) for name in ITEM_FIELDS
+            if getattr(correction, name) is not None and getattr(correction, name) != getattr(item, name)
+        }
+        if updates:
+            corrected.items[correction.index] = InvoiceItem.model_validate({**item.model_dump(), **updates})
+            changed.extend(f"items[{correction.index}].{name}" for name in updates)
+    total_requested = any(issue.field == "totalAmountNis" for issue in report.issues)
+    if total_requested and corrections.totalAmountNis is not None and corrections.totalAmountNis != invoice.totalAmountNis:
+        corrected.totalAmountNis = corrections.totalAmountNis
+        changed.append("totalAmountNis")
+    return corrected, changed
+
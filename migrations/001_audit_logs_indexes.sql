@@ -0,0 +1,21 @@
+-- Indexes backing GET /api/v1/audit-logs keyset pagination and filters.
+-- Every listing orders by (created_at desc, id desc) and resumes with
+--   created_at < :ts or (created_at = :ts and id < :id)
+-- so each index ends in (created_at desc, id desc) and a page is one range scan.
+-- Run with psql or the Supabase SQL editor; "concurrently" avoids locking writes,
+-- so it cannot run inside a transaction block.
+
+create index concurrently if not exists audit_logs_created_at_id_idx
+    on audit_logs (created_at desc, id desc);
+
+create index concurrently if not exists audit_logs_user_created_at_id_idx
+    on audit_logs (user_id, created_at desc, id desc);
+
+create index concurrently if not exists audit_logs_status_created_at_id_idx
+    on audit_logs (status, created_at desc, id desc);
+
+-- file_name filters are substring matches (ilike '%...%'), which need trigrams
+create extension if not exists pg_trgm;
+
+create index concurrently if not exists audit_logs_file_name_trgm_idx
+    on audit_logs using gin (file_name gin_trgm_ops);
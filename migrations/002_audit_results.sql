@@ -0,0 +1,40 @@
+-- Content-addressed extraction results: each distinct output_data is stored once
+-- in audit_results and audit rows reference it by output_key (finzup_api/results.py).
+-- Deploy the API after this migration; rows written by older workers still carry
+-- output_data inline and are read as they are.
+
+create table if not exists audit_results (
+    key text primary key,         -- sha256 of the result's JSON
+    encoding text not null,       -- 'json', or 'zstd': base64 of the zstd-compressed JSON
+    data text not null,
+    size integer not null,        -- uncompressed bytes
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+alter table audit_logs add column if not exists output_key text references audit_results (key);
+
+-- Move existing results out of audit_logs and drop the file_name/file_size copies in input_data.
+-- These keys hash Postgres' jsonb text rather than the API's canonical JSON, so a result
+-- backfilled here and the same result written later are stored twice; nothing else differs.
+-- On a large table, run the update in id ranges to keep transactions short.
+insert into audit_results (key, encoding, data, size)
+select distinct on (1)
+    encode(sha256(convert_to(output_data::text, 'UTF8')), 'hex'),
+    'json',
+    output_data::text,
+    octet_length(output_data::text)
+from audit_logs
+where output_data is not null
+on conflict (key) do nothing;
+
+update audit_logs
+set output_key = encode(sha256(convert_to(output_data::text, 'UTF8')), 'hex'),
+    output_data = null
+where output_data is not null;
+
+update audit_logs
+set input_data = input_data - 'file_name' - 'file_size'
+where input_data ? 'file_name' or input_data ? 'file_size';
+
+-- The updates leave the old row versions behind; "vacuum full audit_logs" returns the
+-- space to the OS but locks the table, plain vacuum makes it reusable without locking.
@@ -0,0 +1,26 @@
+import os
+import pytest
+
+# Settings are read at import time; provide placeholders so the app can be
+# imported without a real .env (nothing here talks to the network).
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.test")
+os.environ.setdefault("GOOGLE_API_KEY", "test-google-api-key")
+# Learned supplier hints would change prompts between tests; test_suppliers installs its own index
+os.environ.setdefault("TEMPLATES_ENABLED", "false")
+# Tests fire requests far faster than any tenant limit; test_quotas builds its own stores
+os.environ.setdefault("QUOTA_BACKEND", "none")
+# Jobs stay in the test process; test_jobs covers the shared store with a temporary file
+os.environ.setdefault("JOB_STORE_PATH", "")
+
+@pytest.fixture
+def sample_invoice():
+    return {
+        "invoiceNumber": 10088979,
+        "invoiceDate": "2024-02-25",
+        "supplier": {"name": "Supplier", "address": {"street": "Main 1", "city": "Raanana"}},
+        "recipient": {"name": "Recipient", "address": {"street": "Side 2", "city": "Tel Aviv"}},
+        "items": [{"description": "Item", "quantity": 2, "unitPriceNis": 5.0, "totalPriceNis": 10.0}],
+        "totalAmountNis": 10.0
+    }
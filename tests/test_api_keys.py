@@ -0,0 +1,174 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta, UTC
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+from fastapi.testclient import TestClient
+from supabase import create_client
+from finzup_api import db, main, services
+from finzup_api.api_keys import ApiKeyIndex, LastUsedTracker, hash_api_key
+from finzup_api.audit import AuditLogWriter
+from finzup_api.cache import NullCache
+from finzup_api.services import ProcessInvoiceResponse
+
+API_KEY = "fz_test-key"
+
+def user_rows():
+    return [
+        {"id": "user-1", "email": "a@example.com", "is_active": True, "api_key": hash_api_key(API_KEY)},
+        {"id": "user-2", "email": "b@example.com", "is_active": False, "api_key": hash_api_key("fz_disabled")},
+    ]
+
+class CountingLoader:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return list(self.rows)
+
+@pytest.mark.asyncio
+async def test_index_serves_known_keys_from_memory():
+    load = CountingLoader(user_rows())
+    index = ApiKeyIndex(load, miss_refresh_interval=60)
+    for _ in range(5):
+        principal = await index.authenticate(API_KEY)
+        assert principal.user_id == "user-1"
+        assert principal.key_id == hash_api_key(API_KEY)[:16]
+    assert load.calls == 1
+    # Inactive users are not indexed
+    assert await index.authenticate("fz_disabled") is None
+
+@pytest.mark.asyncio
+async def test_unknown_keys_reload_at_most_once_per_interval():
+    load = CountingLoader([])
+    index = ApiKeyIndex(load, miss_refresh_interval=60)
+    results = await asyncio.gather(*(index.authenticate(f"fz_bad-{i}") for i in range(10)))
+    assert results == [None] * 10
+    assert load.calls == 1
+
+    # A key issued elsewhere is found after the next reload
+    load.rows = user_rows()
+    index.miss_refresh_interval = 0
+    assert (await index.authenticate(API_KEY)).user_id == "user-1"
+    assert load.calls == 2
+
+@pytest.mark.asyncio
+async def test_invalidate_drops_revoked_key_immediately():
+    load = CountingLoader(user_rows())
+    index = ApiKeyIndex(load, miss_refresh_interval=60)
+    assert await index.authenticate(API_KEY) is not None
+    load.rows = []
+    index.invalidate(hash_api_key(API_KEY))
+    assert await index.authenticate(API_KEY) is None
+
+@pytest.mark.asyncio
+async def test_last_used_is_coalesced_and_retried():
+    writes = []
+    fail = True
+
+    async def write(batch):
+        if fail:
+            raise ConnectionError("database down")
+        writes.append(batch)
+
+    tracker = LastUsedTracker(write)
+    for _ in range(100):
+        tracker.record("user-1")
+    tracker.record("user-2")
+    await tracker.flush()
+    assert tracker.pending() == 2
+
+    fail = False
+    await tracker.flush()
+    assert len(writes) == 1
+    assert set(writes[0]) == {"user-1", "user-2"}
+    assert tracker.pending() == 0
+
+class UsersHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def _respond(self, rows):
+        payload = json.dumps(rows).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        type(self).requests.append(("GET", parse_qs(urlsplit(self.path).query), None))
+        self._respond(user_rows())
+
+    def do_PATCH(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).requests.append(("PATCH", parse_qs(urlsplit(self.path).query), body))
+        self._respond([])
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_users(monkeypatch):
+    UsersHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UsersHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(db, "_client", create_client(f"http://127.0.0.1:{server.server_port}", db.settings.SUPABASE_KEY))
+    yield UsersHandler.requests
+    server.shutdown()
+    db.shutdown()
+
+@pytest.mark.asyncio
+async def test_db_loads_keys_and_touches_in_one_update(stub_users):
+    rows = await db.list_api_keys()
+    assert [row["id"] for row in rows] == ["user-1", "user-2"]
+    now = datetime.now(UTC)
+    await db.touch_api_keys({"user-1": now - timedelta(seconds=30), "user-2": now})
+    method, query, body = stub_users[-1]
+    assert method == "PATCH"
+    assert query["id"] == ["in.(user-1,user-2)"]
+    assert body == {"api_key_last_used": now.isoformat()}
+    assert len(stub_users) == 2
+
+@pytest.fixture
+def api(monkeypatch, sample_invoice):
+    audit_rows = []
+
+    async def fake_extract(file_content, file_type):
+        return ProcessInvoiceResponse(invoice_data=sample_invoice, usage_metadata={"total_tokens": 7})
+
+    async def fake_insert(logs):
+        audit_rows.extend(logs)
+
+    monkeypatch.setattr(services, "_extract_invoice", fake_extract)
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(main, "audit_writer", AuditLogWriter(fake_insert))
+    monkeypatch.setattr(main, "api_key_index", ApiKeyIndex(CountingLoader(user_rows())))
+    monkeypatch.setattr(main, "api_key_usage", LastUsedTracker(CountingLoader([])))
+    with TestClient(main.app) as client:
+        yield client, audit_rows
+
+def post_invoice(client, headers=None):
+    return client.post(
+        "/api/v1/process-invoice",
+        files={"file": ("invoice.png", b"\x89PNG\r\n\x1a\n" + b"0" * 32, "image/png")},
+        headers=headers or {}
+    )
+
+def test_api_key_flows_into_audit_rows(api):
+    client, audit_rows = api
+    assert post_invoice(client, {"X-API-Key": API_KEY}).status_code == 200
+    assert main.api_key_usage.pending() == 1
+    asyncio.run(main.audit_writer.flush())
+    assert audit_rows[-1]["user_id"] == "user-1"
+    assert audit_rows[-1]["api_key"] == hash_api_key(API_KEY)[:16]
+
+def test_invalid_or_missing_api_key(api, monkeypatch):
+    client, _ = api
+    assert post_invoice(client, {"X-API-Key": "fz_wrong"}).status_code == 401
+    assert post_invoice(client).status_code == 200
+    monkeypatch.setattr(main.settings, "API_KEY_REQUIRED", True)
+    assert post_invoice(client).status_code == 401
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import threading
+import pytest
+from finzup_api.audit import AuditLogWriter
+
+class FlakyInsert:
+    def __init__(self):
+        self.batches = []
+        self.available = True
+
+    async def __call__(self, logs):
+        if not self.available:
+            raise ConnectionError("database unavailable")
+        self.batches.append(list(logs))
+        return logs
+
+@pytest.mark.asyncio
+async def test_flushes_in_batches_by_size():
+    insert = FlakyInsert()
+    writer = AuditLogWriter(insert, max_batch_size=3, flush_interval=60)
+    await writer.start()
+    writer.submit_many([{"n": i} for i in range(3)])
+    await asyncio.sleep(0.05)
+    assert insert.batches == [[{"n": 0}, {"n": 1}, {"n": 2}]]
+    await writer.stop()
+
+@pytest.mark.asyncio
+async def test_flushes_on_interval_and_drains_on_stop():
+    insert = FlakyInsert()
+    writer = AuditLogWriter(insert, max_batch_size=100, flush_interval=0.05)
+    await writer.start()
+    writer.submit({"n": 1})
+    await asyncio.sleep(0.15)
+    assert insert.batches == [[{"n": 1}]]
+
+    writer.submit({"n": 2})
+    await writer.stop()
+    assert insert.batches[-1] == [{"n": 2}]
+    assert writer.stats()["queue_depth"] == 0
+    assert writer.stats()["written"] == 2
+
+@pytest.mark.asyncio
+async def test_stop_keeps_the_batch_being_written():
+    written = []
+    started = asyncio.Event()
+
+    async def slow_insert(logs):
+        started.set()
+        await asyncio.sleep(0.1)
+        written.extend(logs)
+
+    writer = AuditLogWriter(slow_insert, max_batch_size=2, flush_interval=60)
+    await writer.start()
+    writer.submit_many([{"n": i} for i in range(3)])
+    await started.wait()
+    # Shutdown starts while the first batch is in flight
+    await writer.stop()
+    assert written == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+@pytest.mark.asyncio
+async def test_overflow_is_spilled_by_the_flush_task(tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    writer = AuditLogWriter(FlakyInsert(), max_batch_size=100, flush_interval=60, max_queue_size=1, spill_path=str(spill_path))
+    writer.submit({"n": 1})
+    writer.submit({"n": 2})
+    # Nothing touches the disk in submit()
+    assert not spill_path.exists()
+    assert writer.stats()["queue_depth"] == 2
+
+    await writer.flush()
+    assert [json.loads(line) for line in spill_path.read_text().splitlines()] == [{"n": 2}]
+    assert writer.stats()["spilled"] == 1
+
+@pytest.mark.asyncio
+async def test_spills_when_database_is_down_and_replays(tmp_path):
+    insert = FlakyInsert()
+    insert.available = False
+    spill_path = tmp_path / "spill.jsonl"
+    writer = AuditLogWriter(insert, max_batch_size=100, flush_interval=0.05, spill_path=str(spill_path))
+    await writer.start()
+    writer.submit({"n": 1})
+    await writer.flush()
+    assert writer.stats()["spilled"] == 1
+    assert [json.loads(line) for line in spill_path.read_text().splitlines()] == [{"n": 1}]
+
+    # Once the database is back, the next successful flush replays the spill file
+    insert.available = True
+    writer.submit({"n": 2})
+    await asyncio.sleep(0.2)
+    await writer.stop()
+    assert not spill_path.exists()
+    assert [row for batch in insert.batches for row in batch] == [{"n": 2}, {"n": 1}]
+
+@pytest.mark.asyncio
+async def test_workers_share_the_spill_file(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    spill_path = tmp_path / "spill.jsonl"
+    down = FlakyInsert()
+    down.available = False
+    first = AuditLogWriter(down, flush_interval=60, spill_path=str(spill_path))
+    second = AuditLogWriter(FlakyInsert(), flush_interval=60, spill_path=str(spill_path))
+    first.submit({"n": 1})
+    await first.flush()
+
+    # Spilling waits for whoever holds the lock, e.g. a worker taking the file to replay it
+    with open(str(spill_path) + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        first.submit({"n": 2})
+        spiller = threading.Thread(target=asyncio.run, args=(first.flush(),))
+        spiller.start()
+        spiller.join(0.2)
+        assert spiller.is_alive()
+    spiller.join()
+
+    # One worker replays everything spilled; the other finds nothing left
+    await second.replay_spill()
+    await first.replay_spill()
+    assert list(second._buffer) == [{"n": 1}, {"n": 2}]
+    assert not first._buffer
+    assert not spill_path.exists()
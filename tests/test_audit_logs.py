@@ -0,0 +1,131 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+from fastapi.testclient import TestClient
+from supabase import create_client
+from finzup_api import db, main
+from finzup_api.api_keys import ApiKeyIndex, LastUsedTracker
+from finzup_api.auth import create_access_token
+from tests.test_api_keys import API_KEY, CountingLoader, user_rows
+
+ROWS = [
+    {"id": f"00000000-0000-0000-0000-00000000000{i}", "created_at": f"2025-01-0{9 - i}T10:00:00.5+00:00",
+     "file_name": f"invoice-{i}.pdf", "status": "success"}
+    for i in range(3)
+]
+
+class RecordingPostgrestHandler(BaseHTTPRequestHandler):
+    """Stands in for PostgREST: records each query and answers with ``rows`` (``results`` for audit_results)."""
+    rows = []
+    results = []
+    queries = []
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        type(self).queries.append(parse_qs(url.query))
+        rows = type(self).results if url.path.endswith("/audit_results") else type(self).rows
+        payload = json.dumps(rows).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def postgrest(monkeypatch):
+    RecordingPostgrestHandler.rows = list(ROWS)
+    RecordingPostgrestHandler.results = []
+    RecordingPostgrestHandler.queries = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingPostgrestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(db, "_client", create_client(f"http://127.0.0.1:{server.server_port}", db.settings.SUPABASE_KEY))
+    yield RecordingPostgrestHandler
+    server.shutdown()
+    db.shutdown()
+
+@pytest.fixture
+def client(postgrest, monkeypatch):
+    monkeypatch.setattr(main, "api_key_index", ApiKeyIndex(CountingLoader(user_rows())))
+    monkeypatch.setattr(main, "api_key_usage", LastUsedTracker(CountingLoader([])))
+    with TestClient(main.app, headers={"X-API-Key": API_KEY}) as client:
+        yield client
+
+def test_cursor_round_trip():
+    cursor = db.encode_cursor(ROWS[1])
+    assert db.decode_cursor(cursor) == (ROWS[1]["created_at"], ROWS[1]["id"])
+    with pytest.raises(ValueError):
+        db.decode_cursor("not-a-cursor")
+
+def test_lists_summary_columns_with_keyset_order(client, postgrest):
+    response = client.get("/api/v1/audit-logs", params={"limit": 2, "status": "success", "file_name": "inv"})
+    assert response.status_code == 200
+    page = response.json()
+    assert [log["id"] for log in page["items"]] == [ROWS[0]["id"], ROWS[1]["id"]]
+    assert db.decode_cursor(page["next_cursor"]) == (ROWS[1]["created_at"], ROWS[1]["id"])
+
+    query = postgrest.queries[-1]
+    columns = query["select"][0].split(",")
+    assert "input_data" not in columns and "output_data" not in columns
+    assert query["order"] == ["created_at.desc,id.desc"]
+    # One row beyond the page size tells whether there is a next page
+    assert query["limit"] == ["3"]
+    assert query["status"] == ["eq.success"]
+    assert query["file_name"] == ["ilike.*inv*"]
+    # Only the caller's own rows, whatever is asked for
+    assert query["user_id"] == ["eq.user-1"]
+
+def test_next_page_resumes_after_cursor(client, postgrest):
+    cursor = db.encode_cursor(ROWS[1])
+    postgrest.rows = ROWS[2:]
+    page = client.get("/api/v1/audit-logs", params={"limit": 2, "cursor": cursor}).json()
+    assert page["next_cursor"] is None
+
+    created_at, log_id = ROWS[1]["created_at"], ROWS[1]["id"]
+    assert postgrest.queries[-1]["or"] == [
+        f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{log_id}"))'
+    ]
+
+def test_projection_and_validation(client, postgrest):
+    client.get("/api/v1/audit-logs", params={"fields": "file_name,output_data"})
+    # Rows written since migration 002 reference their output_data by key
+    assert postgrest.queries[-1]["select"] == ["id,created_at,file_name,output_data,output_key"]
+
+    assert client.get("/api/v1/audit-logs", params={"fields": "password"}).status_code == 400
+    assert client.get("/api/v1/audit-logs", params={"cursor": "garbage"}).status_code == 400
+
+def test_single_log_detail(client, postgrest):
+    postgrest.rows = [{**ROWS[0], "output_data": {"invoiceNumber": 1}}]
+    response = client.get(f"/api/v1/audit-logs/{ROWS[0]['id']}")
+    assert response.status_code == 200
+    assert response.json()["output_data"] == {"invoiceNumber": 1}
+    assert postgrest.queries[-1]["id"] == [f"eq.{ROWS[0]['id']}"]
+    assert postgrest.queries[-1]["user_id"] == ["eq.user-1"]
+
+    postgrest.rows = []
+    assert client.get(f"/api/v1/audit-logs/{ROWS[0]['id']}").status_code == 404
+
+def test_detail_rehydrates_stored_result(client, postgrest):
+    key = "ab" * 32
+    postgrest.rows = [{**ROWS[0], "output_data": None, "output_key": key}]
+    postgrest.results = [{"key": key, "encoding": "json", "data": '{"invoiceNumber":7}'}]
+    response = client.get(f"/api/v1/audit-logs/{ROWS[0]['id']}")
+    assert response.json()["output_data"] == {"invoiceNumber": 7}
+    assert postgrest.queries[-1]["key"] == [f"in.({key})"]
+
+def test_audit_logs_need_a_caller(client, postgrest):
+    for path in ("/api/v1/audit-logs", f"/api/v1/audit-logs/{ROWS[0]['id']}"):
+        assert client.get(path, headers={"X-API-Key": ""}).status_code == 401
+    assert not postgrest.queries
+
+def test_signed_in_users_see_their_own_logs(client, postgrest):
+    token = create_access_token("a@example.com")
+    # The fake PostgREST answers the user lookup with ROWS too, so the "user" is ROWS[0]
+    response = client.get("/api/v1/audit-logs", headers={"X-API-Key": "", "Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert postgrest.queries[-1]["user_id"] == [f"eq.{ROWS[0]['id']}"]
@@ -0,0 +1,78 @@
+import hashlib
+import threading
+from datetime import timedelta
+import pytest
+from finzup_api import auth, cache
+from finzup_api.cache import MemoryCache
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    calls = []
+    real_decode = auth.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth, "token_cache", MemoryCache(max_entries=2))
+    monkeypatch.setattr(auth.jwt, "decode", counting_decode)
+    return calls
+
+def test_verified_tokens_are_cached(decode_calls):
+    token = auth.create_access_token("user-1")
+    first = auth.verify_token(token)
+    assert first.sub == "user-1"
+    assert auth.verify_token(token) is first
+    assert len(decode_calls) == 1
+
+def test_cache_is_bounded(decode_calls):
+    tokens = [auth.create_access_token(f"user-{i}") for i in range(3)]
+    for token in tokens:
+        auth.verify_token(token)
+    assert len(auth.token_cache) == 2
+    auth.verify_token(tokens[0])
+    assert len(decode_calls) == 4
+
+def test_invalid_tokens_are_not_cached(decode_calls):
+    assert auth.verify_token("not-a-token") is None
+    assert auth.verify_token(auth.create_access_token("user-1") + "x") is None
+    assert len(auth.token_cache) == 0
+
+def test_cached_token_expires_with_the_token(decode_calls, monkeypatch):
+    token = auth.create_access_token("user-1", expires_delta=timedelta(minutes=5))
+    payload = auth.verify_token(token)
+    key = hashlib.sha256(token.encode()).hexdigest()
+    assert auth.token_cache.get(key) is payload
+    monkeypatch.setattr(cache.time, "time", lambda: payload.exp + 1)
+    assert auth.token_cache.get(key) is None
+
+@pytest.mark.asyncio
+async def test_bcrypt_runs_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def fake_hash(password):
+        threads.append(threading.current_thread().name)
+        return "hashed:" + password
+
+    def fake_verify(plain, hashed):
+        threads.append(threading.current_thread().name)
+        return hashed == "hashed:" + plain
+
+    monkeypatch.setattr(auth, "get_password_hash", fake_hash)
+    monkeypatch.setattr(auth, "verify_password", fake_verify)
+    try:
+        hashed = await auth.get_password_hash_async("secret")
+        assert await auth.verify_password_async("secret", hashed)
+        assert not await auth.verify_password_async("wrong", hashed)
+    finally:
+        auth.shutdown()
+    assert len(threads) == 3
+    assert all(name.startswith("bcrypt") for name in threads)
+
+def test_bcrypt_rounds_come_from_settings(monkeypatch):
+    monkeypatch.setattr(auth.settings, "BCRYPT_ROUNDS", 4)
+    auth.get_pwd_context.cache_clear()
+    try:
+        assert auth.get_pwd_context().to_dict()["bcrypt__rounds"] == 4
+    finally:
+        auth.get_pwd_context.cache_clear()
@@ -0,0 +1,130 @@
+import asyncio
+import io
+import zipfile
+import pytest
+from fastapi.testclient import TestClient
+from finzup_api import main, services
+from finzup_api.audit import AuditLogWriter
+from finzup_api.cache import NullCache
+from finzup_api.services import ProcessInvoiceResponse
+
+client = TestClient(main.app)
+
+JPEG = b"\xff\xd8\xff image a"
+BROKEN_PDF = b"%PDF-broken"
+PNG = b"\x89PNG\r\n\x1a\n image c"
+
+@pytest.fixture
+def fake_extraction(monkeypatch, sample_invoice):
+    state = {"in_flight": 0, "max_in_flight": 0, "audit_calls": []}
+
+    async def fake_extract(file_content, file_type):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        if file_content == BROKEN_PDF:
+            return ProcessInvoiceResponse(error="could not read invoice")
+        return ProcessInvoiceResponse(invoice_data=sample_invoice, usage_metadata={"total_tokens": 7})
+
+    async def fake_insert(logs):
+        state["audit_calls"].append(logs)
+        return logs
+
+    monkeypatch.setattr(services, "_extract_invoice", fake_extract)
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    state["audit_writer"] = AuditLogWriter(fake_insert, max_batch_size=100)
+    monkeypatch.setattr(main, "audit_writer", state["audit_writer"])
+    monkeypatch.setattr(main.settings, "BATCH_MAX_CONCURRENCY", 2)
+    return state
+
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def test_batch_returns_per_file_results(fake_extraction):
+    files = [
+        ("files", ("a.jpg", JPEG, "image/jpeg")),
+        ("files", ("b.pdf", BROKEN_PDF, "application/pdf")),
+        ("files", ("notes.txt", b"text", "text/plain")),
+        ("files", ("more.zip", make_zip({"c.png": PNG, "d.jpeg": JPEG}), "application/zip")),
+    ]
+    response = client.post("/api/v1/process-invoice/batch", files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 5
+    assert data["succeeded"] == 3
+    assert data["failed"] == 2
+    assert [r["file_name"] for r in data["results"]] == ["a.jpg", "b.pdf", "notes.txt", "c.png", "d.jpeg"]
+    assert data["results"][1]["error"] == "could not read invoice"
+    assert "File type not allowed" in data["results"][2]["error"]
+
+    # Concurrency is bounded and audit rows go out in one bulk insert
+    assert fake_extraction["max_in_flight"] <= 2
+    asyncio.run(fake_extraction["audit_writer"].flush())
+    assert len(fake_extraction["audit_calls"]) == 1
+    assert len(fake_extraction["audit_calls"][0]) == 4
+
+def test_batch_rejects_too_many_files(fake_extraction, monkeypatch):
+    monkeypatch.setattr(main.settings, "BATCH_MAX_FILES", 1)
+    files = [
+        ("files", ("a.jpg", JPEG, "image/jpeg")),
+        ("files", ("b.jpg", JPEG, "image/jpeg")),
+    ]
+
+    async def read_batch_part(file, max_entries):
+        raise AssertionError("parts are counted before any is read")
+
+    monkeypatch.setattr(main, "read_batch_part", read_batch_part)
+    response = client.post("/api/v1/process-invoice/batch", files=files)
+    assert response.status_code == 400
+
+def test_batch_parts_are_read_with_limits(fake_extraction, monkeypatch):
+    monkeypatch.setattr(main.settings, "MAX_UPLOAD_SIZE", 100)
+    files = [
+        ("files", ("a.jpg", JPEG, "image/jpeg")),
+        ("files", ("big.pdf", b"%PDF-" + b"x" * 200, "application/pdf")),
+        ("files", ("fake.png", b"not an image", "image/png")),
+        ("files", ("fake.zip", b"not a zip", "application/zip")),
+    ]
+    response = client.post("/api/v1/process-invoice/batch", files=files)
+    assert response.status_code == 200
+    errors = [r["error"] for r in response.json()["results"]]
+    assert errors[0] is None
+    assert "File too large" in errors[1]
+    assert "not a supported PDF or image" in errors[2]
+    assert "not a zip archive" in errors[3]
+
+def test_batch_body_size_is_capped(fake_extraction):
+    limit = main.settings.BATCH_MAX_UPLOAD_SIZE + main.MULTIPART_OVERHEAD
+    response = client.post(
+        "/api/v1/process-invoice/batch",
+        content=b"x",
+        headers={"Content-Type": "multipart/form-data; boundary=x", "Content-Length": str(limit + 1)}
+    )
+    assert response.status_code == 400
+    assert "File too large" in response.json()["detail"]
+
+def test_zip_entries_are_checked_like_uploads(fake_extraction):
+    archive = make_zip({"a.png": PNG, "fake.png": b"image c", "empty.pdf": b"", "notes.txt": b"text"})
+    response = client.post("/api/v1/process-invoice/batch", files=[("files", ("scans.zip", archive, "application/zip"))])
+    errors = [r["error"] for r in response.json()["results"]]
+    assert errors[0] is None
+    assert "not a supported PDF or image" in errors[1]
+    assert errors[2] == "File is empty"
+    assert "File type not allowed" in errors[3]
+
+def test_zip_is_rejected_once_its_entries_add_up_past_the_batch_limit(fake_extraction, monkeypatch):
+    monkeypatch.setattr(main.settings, "MAX_UPLOAD_SIZE", 60_000)
+    monkeypatch.setattr(main.settings, "BATCH_MAX_UPLOAD_SIZE", 100_000)
+    # A few hundred bytes compressed, 150 KB unpacked
+    archive = make_zip({f"{i}.pdf": b"%PDF-" + b"0" * 50_000 for i in range(3)})
+    assert len(archive) < 1000
+    response = client.post("/api/v1/process-invoice/batch", files=[("files", ("bomb.zip", archive, "application/zip"))])
+    assert response.status_code == 200
+    [result] = response.json()["results"]
+    assert result["file_name"] == "bomb.zip"
+    assert "too large once unpacked" in result["error"]
@@ -0,0 +1,96 @@
+import io
+import json
+import pytest
+from finzup_api import batch, services
+from finzup_api.cache import NullCache
+from finzup_api.services import ProcessInvoiceResponse
+
+@pytest.fixture
+def archive(tmp_path):
+    (tmp_path / "2024").mkdir()
+    for name in ("a.jpg", "b.pdf", "2024/c.png", "broken.jpeg", "notes.txt"):
+        (tmp_path / name).write_bytes(name.encode())
+    return tmp_path
+
+@pytest.fixture
+def fake_extraction(monkeypatch, sample_invoice):
+    calls = []
+
+    async def fake_extract(file_content, file_type):
+        calls.append(file_content.decode())
+        if file_content == b"broken.jpeg":
+            return ProcessInvoiceResponse(error="could not read invoice")
+        return ProcessInvoiceResponse(invoice_data=sample_invoice, usage_metadata={"total_tokens": 7}, num_pages=1)
+
+    monkeypatch.setattr(services, "_extract_invoice", fake_extract)
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    return calls
+
+def read_output(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_discover_files_walks_directories_and_globs(archive):
+    found = batch.discover_files([str(archive), str(archive / "*.jpg")], {"pdf", "png", "jpg", "jpeg"})
+    assert [p.name for p in found] == ["c.png", "a.jpg", "b.pdf", "broken.jpeg"]
+
+def test_batch_writes_one_record_per_file(archive, fake_extraction, tmp_path):
+    output = tmp_path / "out" / "results.jsonl"
+    assert batch.main([str(archive), "--output", str(output), "--concurrency", "2"]) == 0
+    records = {r["file_name"]: r for r in read_output(output)}
+    assert set(records) == {"a.jpg", "b.pdf", "c.png", "broken.jpeg"}
+    assert records["a.jpg"]["status"] == "success"
+    assert records["a.jpg"]["tokens_used"] == 7
+    assert records["a.jpg"]["output_data"]["invoiceNumber"] == 10088979
+    assert records["broken.jpeg"]["status"] == "error"
+    assert records["broken.jpeg"]["error_message"] == "could not read invoice"
+
+def test_rerun_resumes_from_checkpoint(archive, fake_extraction, tmp_path):
+    output = tmp_path / "results.jsonl"
+    done = batch.build_record(archive / "a.jpg", ProcessInvoiceResponse(error="x"))
+    # A finished record followed by one torn by a kill mid-write
+    output.write_text(json.dumps({**done, "status": "success"}) + "\n" + '{"path": "' + str(archive / "b.pdf"))
+
+    batch.main([str(archive), "--output", str(output)])
+    assert sorted(fake_extraction) == ["2024/c.png", "b.pdf", "broken.jpeg"]
+    assert len(read_output(output)) == 4
+
+    fake_extraction.clear()
+    batch.main([str(archive), "--output", str(output)])
+    assert fake_extraction == []
+
+    batch.main([str(archive), "--output", str(output), "--retry-failed"])
+    assert fake_extraction == ["broken.jpeg"]
+
+def test_unavailable_files_are_retried_without_flag(archive, fake_extraction, tmp_path):
+    output = tmp_path / "results.jsonl"
+    unavailable = ProcessInvoiceResponse(error="busy", retry_after=5)
+    output.write_text(json.dumps(batch.build_record(archive / "a.jpg", unavailable)) + "\n")
+    assert batch.load_checkpoint(output) == set()
+
+def test_progress_line_reports_rate_and_eta():
+    stream = io.StringIO()
+    progress = batch.Progress(total=4, stream=stream, interval=0)
+    progress.update({"status": "success", "tokens_used": 10})
+    progress.update({"status": "error", "tokens_used": 0})
+    line = stream.getvalue().splitlines()[-1]
+    assert line.startswith("[2/4]")
+    assert "1 ok, 1 failed, 10 tokens" in line
+    assert "ETA" in line
+
+def test_parquet_output(archive, fake_extraction, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = tmp_path / "results.jsonl"
+    batch.main([str(archive), "--output", str(output), "--format", "parquet"])
+    table = pq.read_table(tmp_path / "results.parquet")
+    assert table.num_rows == 4
+    assert "path" in table.column_names
+
+def test_parquet_without_pyarrow_exits_with_an_error(archive, fake_extraction, tmp_path, monkeypatch, capsys):
+    def require_pyarrow():
+        raise batch.ExportUnavailable("Parquet export requires pyarrow")
+
+    monkeypatch.setattr(batch, "require_pyarrow", require_pyarrow)
+    output = tmp_path / "results.jsonl"
+    assert batch.main([str(archive), "--output", str(output), "--format", "parquet"]) == 1
+    assert "requires pyarrow" in capsys.readouterr().err
+    assert not output.exists()
@@ -0,0 +1,79 @@
+import pytest
+import threading
+import time
+from finzup_api.cache import MemoryCache, DiskCache, make_cache_key
+from finzup_api import main, services
+from finzup_api.services import ProcessInvoiceResponse
+
+def test_cache_key_depends_on_content_and_parts():
+    assert make_cache_key(b"a", "m1", "p1") == make_cache_key(b"a", "m1", "p1")
+    assert make_cache_key(b"a", "m1", "p1") != make_cache_key(b"b", "m1", "p1")
+    assert make_cache_key(b"a", "m1", "p1") != make_cache_key(b"a", "m2", "p1")
+
+def test_memory_cache_lru_eviction():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}  # "a" becomes most recently used
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.stats()["evictions"] == 1
+
+def test_memory_cache_ttl():
+    cache = MemoryCache(max_entries=10, ttl_seconds=0.05)
+    cache.set("a", {"v": 1})
+    assert cache.get("a") == {"v": 1}
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+def test_disk_cache_survives_restart(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=10)
+    cache.set("a", {"v": 1})
+    reopened = DiskCache(str(tmp_path), max_entries=10)
+    assert len(reopened) == 1
+    assert reopened.get("a") == {"v": 1}
+
+@pytest.mark.asyncio
+async def test_disk_cache_does_its_io_off_the_event_loop(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_entries=10)
+    threads = []
+    for name in ("_get", "_set"):
+        original = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda *args, original=original: threads.append(threading.get_ident()) or original(*args))
+
+    await cache.aset("a", {"v": 1})
+    assert await cache.aget("a") == {"v": 1}
+    assert len(threads) == 2 and threading.get_ident() not in threads
+    # Written through a uniquely named temporary file, which is gone afterwards
+    assert [p.name for p in tmp_path.iterdir()] == ["a.json"]
+
+@pytest.mark.asyncio
+async def test_process_invoice_serves_repeated_uploads_from_cache(monkeypatch, sample_invoice):
+    calls = []
+
+    async def fake_extract(file_content, file_type):
+        calls.append(file_content)
+        return ProcessInvoiceResponse(invoice_data=sample_invoice, usage_metadata={"total_tokens": 42})
+
+    monkeypatch.setattr(services, "_extract_invoice", fake_extract)
+    monkeypatch.setattr(services, "result_cache", MemoryCache(max_entries=10))
+
+    first = await services.process_invoice(b"same bytes", "jpeg", "a.jpeg", 10)
+    second = await services.process_invoice(b"same bytes", "jpeg", "b.jpeg", 10)
+    assert len(calls) == 1
+    assert not first.cached and second.cached
+    assert second.invoice_data == first.invoice_data
+    assert second.usage_metadata == {"total_tokens": 42}
+    assert services.result_cache.stats()["hits"] == 1
+
+    await services.process_invoice(b"same bytes", "jpeg", "c.jpeg", 10, bypass_cache=True)
+    assert len(calls) == 2
+
+def test_cached_results_are_audited_without_tokens(sample_invoice):
+    result = ProcessInvoiceResponse(invoice_data=sample_invoice, usage_metadata={"total_tokens": 42}, cached=True)
+    row = main.build_audit_log("a.jpeg", b"bytes", result)
+    assert row["tokens_used"] == 0
+    assert row["input_data"]["cached_tokens"] == 42
+    fresh = main.build_audit_log("a.jpeg", b"bytes", result.model_copy(update={"cached": False}))
+    assert fresh["tokens_used"] == 42
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from supabase import create_client
+from finzup_api import db
+
+INSERT_DELAY = 0.3
+
+class SlowPostgrestHandler(BaseHTTPRequestHandler):
+    """Stands in for PostgREST: every insert takes INSERT_DELAY seconds."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(INSERT_DELAY)
+        payload = json.dumps([json.loads(body)]).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_supabase(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowPostgrestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = create_client(f"http://127.0.0.1:{server.server_port}", db.settings.SUPABASE_KEY)
+    monkeypatch.setattr(db, "_client", client)
+    yield client
+    server.shutdown()
+    db.shutdown()
+
+@pytest.mark.asyncio
+async def test_audit_writes_do_not_block_event_loop(stub_supabase):
+    ticks = 0
+    stop = asyncio.Event()
+
+    async def ticker():
+        # Stands in for other in-flight requests sharing the event loop
+        nonlocal ticks
+        while not stop.is_set():
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    rows = await asyncio.gather(*(
+        db.create_audit_log({"file_name": f"invoice-{i}.pdf", "status": "success"})
+        for i in range(4)
+    ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+
+    assert [row["file_name"] for row in rows] == [f"invoice-{i}.pdf" for i in range(4)]
+    # Four inserts overlap instead of running back to back
+    assert elapsed < 4 * INSERT_DELAY * 0.75
+    # The loop kept serving other work while the inserts were in flight
+    assert ticks >= int(INSERT_DELAY / 0.01) // 2
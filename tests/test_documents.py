@@ -0,0 +1,138 @@
+import asyncio
+import io
+import time
+import fitz
+import pytest
+from PIL import Image
+from finzup_api import documents, services
+from finzup_api.backends import FakeBackend
+from finzup_api.cache import NullCache
+from finzup_api.documents import ParsedDocument
+from finzup_api.models import InvoiceData
+
+def make_pdf(num_pages: int) -> bytes:
+    doc = fitz.open()
+    for i in range(num_pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Invoice page {i + 1}")
+    doc.set_metadata({"title": "Test invoice"})
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+def make_jpeg(width: int = 64, height: int = 32) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+class RecordingBackend(FakeBackend):
+    def __init__(self, invoice):
+        super().__init__(invoice=invoice)
+        self.messages = []
+
+    async def extract(self, messages):
+        self.messages.append(messages)
+        return await super().extract(messages)
+
+def test_parsed_pdf_document():
+    with ParsedDocument(make_pdf(3), "pdf") as document:
+        assert document.num_pages == 3
+        assert document.metadata["title"] == "Test invoice"
+        assert document.render_page_data().startswith("data:")
+        pdf = document._pdf
+    assert pdf.is_closed
+
+def test_parsed_image_document():
+    with ParsedDocument(make_jpeg(), "jpeg") as document:
+        assert document.num_pages == 1
+        assert document.metadata["width"] == 64
+        assert document.render_page_data().startswith("data:image/jpeg;base64,")
+
+@pytest.mark.asyncio
+async def test_process_invoice_opens_pdf_once(monkeypatch, sample_invoice):
+    content = make_pdf(2)
+    opened = []
+    real_open = fitz.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(kwargs.get("filetype"))
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(documents.fitz, "open", counting_open)
+    monkeypatch.setattr(services, "backend", RecordingBackend(sample_invoice))
+    monkeypatch.setattr(services, "result_cache", NullCache())
+
+    result = await services.process_invoice(content, "pdf", "invoice.pdf", 0)
+    assert result.error is None
+    assert result.num_pages == 2
+    assert result.document_metadata["title"] == "Test invoice"
+    assert opened == ["pdf"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["inline", "thread", "process"])
+async def test_prepare_document_on_render_pool(mode):
+    documents.set_render_pool(documents.create_render_pool(mode, 1))
+    try:
+        await documents.warm_up_render_pool()
+        prepared = await documents.run_prepare_document(make_pdf(2), "pdf")
+    finally:
+        documents.shutdown_render_pool()
+    assert prepared.num_pages == 2
+    assert len(prepared.page_data) == 2
+
+class SlowPageBackend(RecordingBackend):
+    """Returns one item per call, named after the page hint in the prompt."""
+
+    async def extract(self, messages):
+        self.messages.append(messages)
+        await asyncio.sleep(0.1)
+        prompt = messages[0].content[0]
+        invoice = self.invoice.model_copy(deep=True)
+        invoice.items[0].description = prompt.strip().splitlines()[-1]
+        return invoice, self._usage(messages)
+
+@pytest.mark.asyncio
+async def test_multi_page_pdf_extracts_pages_concurrently(monkeypatch, sample_invoice):
+    backend = SlowPageBackend(sample_invoice)
+    monkeypatch.setattr(services, "backend", backend)
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(services.settings, "PDF_PAGE_MODE", "per_page")
+
+    start = time.perf_counter()
+    result = await services.process_invoice(make_pdf(4), "pdf", "invoice.pdf", 0)
+    elapsed = time.perf_counter() - start
+
+    assert result.error is None
+    assert len(backend.messages) == 4
+    assert [item.description for item in result.invoice_data.items] == [
+        f"This image is page {i} of 4 of the invoice." for i in range(1, 5)
+    ]
+    assert elapsed < 4 * 0.1
+
+@pytest.mark.asyncio
+async def test_multi_page_pdf_combined_mode(monkeypatch, sample_invoice):
+    backend = RecordingBackend(sample_invoice)
+    monkeypatch.setattr(services, "backend", backend)
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(services.settings, "PDF_PAGE_MODE", "combined")
+
+    result = await services.process_invoice(make_pdf(3), "pdf", "invoice.pdf", 0)
+    assert result.error is None
+    assert len(backend.messages) == 1
+    images = [part for part in backend.messages[0][0].content if isinstance(part, dict)]
+    assert len(images) == 3
+
+def test_merge_invoice_pages(sample_invoice):
+    first = InvoiceData.model_validate(sample_invoice)
+    second = InvoiceData.model_validate({
+        **sample_invoice,
+        "items": [{"description": "Second", "quantity": 1, "unitPriceNis": 3.0, "totalPriceNis": 3.0}],
+        "totalAmountNis": 13.0,
+        "delivery_company": {"name": "Courier", "phone": "03-0000000"}
+    })
+    merged = services.merge_invoice_pages([first, second])
+    assert [item.description for item in merged.items] == ["Item", "Second"]
+    assert merged.totalAmountNis == 13.0
+    assert merged.delivery_company.name == "Courier"
+    assert merged.invoiceNumber == first.invoiceNumber
+    assert len(first.items) == 1
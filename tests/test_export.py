@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+from fastapi.testclient import TestClient
+from supabase import create_client
+from finzup_api import db, main
+from finzup_api.api_keys import ApiKeyIndex, LastUsedTracker
+from tests.test_api_keys import API_KEY, CountingLoader, user_rows
+
+def make_log(i: int, items: int):
+    return {
+        "id": f"{i:08d}-0000-0000-0000-000000000000",
+        "created_at": f"2025-01-01T10:{59 - i // 60:02d}:{59 - i % 60:02d}+00:00",
+        "file_name": f"invoice-{i}.pdf",
+        "status": "success" if items else "error",
+        "error_message": None if items else "unreadable",
+        "output_data": {
+            "invoiceNumber": 1000 + i,
+            "invoiceDate": "2025-01-01",
+            "supplier": {"name": "ספק"},
+            "recipient": {"name": "Recipient"},
+            "items": [
+                {"description": f"item {n}", "quantity": 1, "unitPriceNis": 2.5, "totalPriceNis": 2.5}
+                for n in range(items)
+            ],
+            "totalAmountNis": 2.5 * items,
+        } if items else None,
+    }
+
+# Newest first, like the (created_at desc, id desc) index order
+LOGS = [make_log(i, items=i % 3) for i in range(25)]
+CURSOR_FILTER = re.compile(r'created_at\.lt\."([^"]+)",and\(created_at\.eq\."[^"]+",id\.lt\."([^"]+)"\)')
+
+class KeysetPostgrestHandler(BaseHTTPRequestHandler):
+    """Serves LOGS honouring limit and the keyset cursor filter, counting requests."""
+    requests = 0
+    user_filters = []
+
+    def do_GET(self):
+        type(self).requests += 1
+        query = parse_qs(urlsplit(self.path).query)
+        type(self).user_filters.append(query.get("user_id"))
+        rows = LOGS
+        if "or" in query:
+            created_at, log_id = CURSOR_FILTER.search(query["or"][0]).groups()
+            rows = [r for r in rows if (r["created_at"], r["id"]) < (created_at, log_id)]
+        rows = rows[:int(query["limit"][0])]
+        payload = json.dumps(rows).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def client(monkeypatch):
+    KeysetPostgrestHandler.requests = 0
+    KeysetPostgrestHandler.user_filters = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeysetPostgrestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(db, "_client", create_client(f"http://127.0.0.1:{server.server_port}", db.settings.SUPABASE_KEY))
+    monkeypatch.setattr(main.settings, "EXPORT_PAGE_SIZE", 10)
+    monkeypatch.setattr(main, "api_key_index", ApiKeyIndex(CountingLoader(user_rows())))
+    monkeypatch.setattr(main, "api_key_usage", LastUsedTracker(CountingLoader([])))
+    with TestClient(main.app, headers={"X-API-Key": API_KEY}) as client:
+        yield client
+    server.shutdown()
+    db.shutdown()
+
+def test_ndjson_export_pages_through_everything(client):
+    response = client.get("/api/v1/audit-logs/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "attachment" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [log["id"] for log in LOGS]
+    # 25 rows in pages of 10
+    assert KeysetPostgrestHandler.requests == 3
+    # Every page is limited to the caller's rows
+    assert KeysetPostgrestHandler.user_filters == [["eq.user-1"]] * 3
+
+def test_csv_export_has_one_row_per_item(client):
+    response = client.get("/api/v1/audit-logs/export", params={"format": "csv"})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+    # Logs without items still get one row so failures show up in the export
+    assert len(rows) == sum(max(1, len((log["output_data"] or {}).get("items", []))) for log in LOGS)
+    first_item = next(row for row in rows if row["item_index"] == "0")
+    assert first_item["supplier_name"] == "ספק"
+    assert first_item["unit_price_nis"] == "2.5"
+
+def test_parquet_export(client):
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = client.get("/api/v1/audit-logs/export", params={"format": "parquet"})
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == sum(max(1, log["output_data"] and len(log["output_data"]["items"]) or 0) for log in LOGS)
+
+def test_unknown_format_is_rejected(client):
+    assert client.get("/api/v1/audit-logs/export", params={"format": "xlsx"}).status_code == 422
+
+def test_export_needs_a_caller(client):
+    response = client.get("/api/v1/audit-logs/export", params={"format": "csv"}, headers={"X-API-Key": ""})
+    assert response.status_code == 401
+    assert KeysetPostgrestHandler.requests == 0
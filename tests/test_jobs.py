@@ -0,0 +1,162 @@
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import pytest
+from fastapi.testclient import TestClient
+from finzup_api import main, services
+from finzup_api.audit import AuditLogWriter
+from finzup_api.cache import NullCache
+from finzup_api.api_keys import ApiKeyIndex, LastUsedTracker, hash_api_key
+from finzup_api.jobs import Job, JobQueue, JobStore, QueueFullError
+from finzup_api.models import JobStatus
+from finzup_api.services import ProcessInvoiceResponse
+from tests.test_api_keys import API_KEY, CountingLoader, user_rows
+from tests.test_documents import make_jpeg
+
+@pytest.fixture
+def client(monkeypatch, sample_invoice):
+    async def fake_extract(file_content, file_type):
+        await asyncio.sleep(0.01)
+        return ProcessInvoiceResponse(invoice_data=sample_invoice, usage_metadata={"total_tokens": 7})
+
+    async def fake_insert(logs):
+        return logs
+
+    monkeypatch.setattr(services, "_extract_invoice", fake_extract)
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(main, "audit_writer", AuditLogWriter(fake_insert))
+    with TestClient(main.app) as client:
+        yield client
+
+def test_submit_and_poll_job(client, sample_invoice):
+    response = client.post(
+        "/api/v1/jobs",
+        files={"file": ("invoice.jpg", make_jpeg(), "image/jpeg")}
+    )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/v1/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.01)
+    assert job["status"] == "succeeded"
+
+    response = client.get(f"/api/v1/jobs/{job_id}/result")
+    assert response.status_code == 200
+    assert response.json()["invoiceNumber"] == sample_invoice["invoiceNumber"]
+
+def test_unknown_job(client):
+    assert client.get("/api/v1/jobs/missing").status_code == 404
+
+def test_jobs_are_only_visible_to_their_submitter(client, monkeypatch):
+    other = {"id": "user-3", "email": "c@example.com", "is_active": True, "api_key": hash_api_key("fz_other")}
+    monkeypatch.setattr(main, "api_key_index", ApiKeyIndex(CountingLoader(user_rows() + [other])))
+    monkeypatch.setattr(main, "api_key_usage", LastUsedTracker(CountingLoader([])))
+    response = client.post(
+        "/api/v1/jobs",
+        files={"file": ("invoice.jpg", make_jpeg(), "image/jpeg")},
+        headers={"X-API-Key": API_KEY}
+    )
+    job_id = response.json()["job_id"]
+    assert main.job_queue.get(job_id).owner == "user-1"
+
+    assert client.get(f"/api/v1/jobs/{job_id}", headers={"X-API-Key": API_KEY}).status_code == 200
+    for headers in ({"X-API-Key": "fz_other"}, {}):
+        assert client.get(f"/api/v1/jobs/{job_id}", headers=headers).status_code == 404
+        assert client.get(f"/api/v1/jobs/{job_id}/result", headers=headers).status_code == 404
+
+@pytest.mark.asyncio
+async def test_queue_applies_backpressure():
+    release = asyncio.Event()
+
+    async def handler(value):
+        await release.wait()
+        return None
+
+    queue = JobQueue(handler, max_size=1, workers=1)
+    await queue.start()
+    running = queue.submit("a", value=1)
+    await asyncio.sleep(0)  # let the worker pick up the first job
+    queued = queue.submit("b", value=2)
+    with pytest.raises(QueueFullError):
+        queue.submit("c", value=3)
+
+    release.set()
+    await queue.stop()
+    assert running.status == JobStatus.succeeded
+    assert queued.status == JobStatus.succeeded
+
+@pytest.mark.asyncio
+async def test_stop_gives_up_on_jobs_after_the_timeout():
+    async def handler(value):
+        await asyncio.sleep(value)
+        return None
+
+    queue = JobQueue(handler, max_size=10, workers=1)
+    await queue.start()
+    quick = queue.submit("quick", value=0)
+    slow = queue.submit("slow", value=60)
+    stopping = asyncio.create_task(queue.stop(timeout=0.2))
+    await asyncio.sleep(0)
+    # New work is refused while the queue drains
+    with pytest.raises(QueueFullError):
+        queue.submit("late", value=0)
+    await stopping
+
+    assert quick.status == JobStatus.succeeded
+    assert slow.status == JobStatus.failed
+    assert "shutting down" in slow.error
+
+@pytest.mark.asyncio
+async def test_jobs_are_visible_to_other_workers_through_the_store(tmp_path, sample_invoice):
+    release = asyncio.Event()
+
+    async def handler(value):
+        await release.wait()
+        return ProcessInvoiceResponse(invoice_data=sample_invoice, usage_metadata={"total_tokens": value})
+
+    path = str(tmp_path / "jobs.sqlite3")
+    # Two worker processes on one host, each with its own queue and connection
+    accepting = JobQueue(handler, store=JobStore(path, ProcessInvoiceResponse))
+    polling = JobQueue(handler, store=JobStore(path, ProcessInvoiceResponse))
+    await accepting.start()
+    job = accepting.submit("a.pdf", owner="user-1", value=7)
+    await accepting.persist(job)
+    seen = await polling.fetch(job.id)
+    assert seen.status in (JobStatus.queued, JobStatus.running)
+    assert seen.owner == "user-1"
+
+    release.set()
+    await accepting.stop()
+    seen = await polling.fetch(job.id)
+    assert seen.status == JobStatus.succeeded
+    assert seen.result.invoice_data.invoiceNumber == sample_invoice["invoiceNumber"]
+    assert await polling.fetch("missing") is None
+
+def test_importing_the_app_opens_no_job_store(tmp_path):
+    # gunicorn imports the app in the master; a connection made there would be shared by every forked worker
+    path = tmp_path / "jobs.sqlite3"
+    probe = "import finzup_api.main as main; print(main.job_queue.store.connected)"
+    env = {**os.environ, "JOB_STORE_PATH": str(path)}
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, env=env).stdout
+    assert output.strip().splitlines()[-1] == "False"
+    assert not path.exists()
+
+def test_store_from_before_job_owners_is_upgraded(tmp_path, sample_invoice):
+    path = tmp_path / "jobs.sqlite3"
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "create table jobs (id text primary key, file_name text, status text, created_at text, started_at text,"
+            " finished_at text, finished_ts real, error text, result text)"
+        )
+    store = JobStore(str(path), ProcessInvoiceResponse)
+    job = Job("a.pdf", {}, owner="user-1")
+    store.save(job)
+    assert store.load(job.id).owner == "user-1"
+    store.close()
@@ -0,0 +1,37 @@
+import asyncio
+import pytest
+from benchmarks import loadtest
+from finzup_api import main, services
+from finzup_api.backends import FakeBackend, FakeBackendError, create_backend
+from tests.test_documents import make_jpeg
+
+@pytest.fixture
+def fake_app(monkeypatch):
+    # use_fake_backend rebinds module globals; let monkeypatch restore them
+    monkeypatch.setattr(services, "backend", services.backend)
+    monkeypatch.setattr(services, "result_cache", services.result_cache)
+    monkeypatch.setattr(main, "audit_writer", main.audit_writer)
+    return loadtest.use_fake_backend
+
+def test_create_fake_backend(monkeypatch):
+    monkeypatch.setattr(services.settings, "LLM_BACKEND", "fake")
+    monkeypatch.setattr(services.settings, "FAKE_SEED", 1)
+    backend = create_backend(services.settings)
+    assert isinstance(backend, FakeBackend)
+    assert backend.latency == services.settings.FAKE_LATENCY_MS / 1000
+
+def test_fake_backend_injects_errors():
+    backend = FakeBackend(error_rate=1.0, error_status=503, seed=0)
+    with pytest.raises(FakeBackendError) as exc_info:
+        asyncio.run(backend.extract([]))
+    assert exc_info.value.status_code == 503
+
+def test_load_test_reports_latency(fake_app):
+    backend = fake_app(latency=0.05, jitter=0.0, error_rate=0.0, seed=0)
+    stats = asyncio.run(loadtest.run_load_test(make_jpeg(), "invoice.jpg", requests=20, concurrency=10))
+
+    assert backend.calls == 20
+    assert stats["statuses"] == {200: 20}
+    assert stats["p50"] <= stats["p95"] <= stats["p99"]
+    # Ten clients overlap their 50 ms model calls instead of queueing behind each other
+    assert stats["elapsed"] < 20 * 0.05
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from finzup_api import main, metrics, services
+from finzup_api.audit import AuditLogWriter
+from finzup_api.backends import FakeBackend
+from finzup_api.cache import NullCache
+from tests.test_documents import make_jpeg
+
+def test_histogram_exposition():
+    registry = metrics.Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5, route="/a")
+    counter = registry.counter("hits_total", "Hits", ("route",))
+    counter.inc(route='/b"')
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+    assert 'latency_seconds_sum{route="/a"} 5.55' in lines
+    assert 'hits_total{route="/b\\""} 1' in lines
+    assert "# TYPE hits_total counter" in lines
+
+def test_server_timing_header_lists_stages():
+    async def endpoint(request):
+        with metrics.stage("model_call"):
+            await asyncio.sleep(0.01)
+        return PlainTextResponse("ok")
+
+    app = Starlette(
+        routes=[Route("/items/{item_id}", endpoint)],
+        middleware=[Middleware(metrics.MetricsMiddleware, server_timing=True)]
+    )
+    before = metrics.http_requests.value(method="GET", route="/items/{item_id}", status=200)
+    with TestClient(app) as client:
+        response = client.get("/items/42")
+
+    entries = dict(entry.split(";dur=") for entry in response.headers["Server-Timing"].split(", "))
+    assert float(entries["model_call"]) >= 10
+    assert float(entries["total"]) >= float(entries["model_call"])
+    # Labelled by route template, not the concrete path
+    assert metrics.http_requests.value(method="GET", route="/items/{item_id}", status=200) == before + 1
+
+def test_metrics_endpoint_reports_stages_and_tokens(monkeypatch):
+    async def fake_insert(logs):
+        return logs
+
+    monkeypatch.setattr(services, "backend", FakeBackend())
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(main, "audit_writer", AuditLogWriter(fake_insert))
+    tokens_before = metrics.llm_tokens.value(model="fake", type="input")
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/v1/process-invoice",
+            files={"file": ("invoice.jpg", make_jpeg(), "image/jpeg")}
+        )
+        assert response.status_code == 200
+        body = client.get("/metrics").text
+
+    assert metrics.llm_tokens.value(model="fake", type="input") > tokens_before
+    for stage in ("upload_read", "cache_lookup", "prepare_document", "model_call", "validation"):
+        assert f'finzup_stage_duration_seconds_count{{stage="{stage}"}}' in body
+    assert 'finzup_http_requests_total{method="POST",route="/api/v1/process-invoice",status="200"}' in body
+    assert "finzup_job_queue_depth" in body
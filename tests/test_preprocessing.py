@@ -0,0 +1,61 @@
+import base64
+import io
+from PIL import Image, ImageDraw
+from finzup_api.documents import prepare_document
+from finzup_api.preprocessing import ImageOptions, crop_margins, normalize_image
+from tests.test_documents import make_pdf
+
+def make_photo(width: int, height: int, orientation: int = 1) -> bytes:
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((width // 4, height // 4, width * 3 // 4, height * 3 // 4), fill="black")
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", exif=exif)
+    return buffer.getvalue()
+
+def decode(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+def test_downscales_to_max_dimension():
+    options = ImageOptions(max_dimension=1000, autocrop=False)
+    data, mime_type = normalize_image(decode(make_photo(4000, 3000)), options)
+    assert mime_type == "image/jpeg"
+    assert decode(data).size == (1000, 750)
+
+def test_applies_exif_orientation():
+    # Orientation 6: stored landscape, displayed rotated 90 degrees
+    options = ImageOptions(max_dimension=5000, autocrop=False)
+    data, _ = normalize_image(decode(make_photo(400, 200, orientation=6)), options)
+    assert decode(data).size == (200, 400)
+
+def test_grayscale():
+    options = ImageOptions(grayscale=True, autocrop=False)
+    data, _ = normalize_image(decode(make_photo(400, 200)), options)
+    assert decode(data).mode == "L"
+
+def test_webp_output():
+    options = ImageOptions(output_format="webp", autocrop=False)
+    data, mime_type = normalize_image(decode(make_photo(400, 200)), options)
+    assert mime_type == "image/webp"
+    assert decode(data).format == "WEBP"
+
+def test_crops_uniform_margins():
+    cropped = crop_margins(decode(make_photo(400, 200)), threshold=24)
+    # Content is the centre rectangle plus a small safety margin
+    assert 200 <= cropped.width < 220
+    assert 100 <= cropped.height < 120
+
+def test_prepare_document_records_bytes_sent():
+    content = make_photo(4000, 3000)
+    prepared = prepare_document(content, "jpeg", ImageOptions(max_dimension=1024))
+    header, payload = prepared.page_data[0].split(",", 1)
+    assert header == "data:image/jpeg;base64"
+    assert prepared.preprocessing["original_bytes"] == len(content)
+    assert prepared.preprocessing["sent_bytes"] == len(base64.b64decode(payload))
+    assert prepared.preprocessing["sent_bytes"] < len(content)
+
+def test_pdf_pages_are_encoded_as_images():
+    prepared = prepare_document(make_pdf(1), "pdf", ImageOptions())
+    assert prepared.page_data[0].startswith("data:image/jpeg;base64,")
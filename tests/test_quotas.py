@@ -0,0 +1,191 @@
+import asyncio
+import os
+import subprocess
+import sys
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from finzup_api import main, quotas
+from finzup_api.api_keys import ApiKeyIndex, hash_api_key
+from finzup_api.auth import create_access_token
+from finzup_api.quotas import MemoryQuotaStore, QuotaExceeded, QuotaMiddleware
+
+async def model_endpoint(request):
+    await quotas.charge_usage({"input_tokens": 700, "output_tokens": 300, "total_tokens": 1000})
+    return PlainTextResponse("ok")
+
+async def read_endpoint(request):
+    return PlainTextResponse("ok")
+
+async def load_keys():
+    return [{"id": f"user-{key}", "api_key": hash_api_key(key)} for key in ("fz_a", "fz_b")]
+
+def quota_client(store):
+    app = Starlette(
+        routes=[
+            Route("/api/v1/process-invoice", model_endpoint, methods=["POST"]),
+            Route("/api/v1/jobs/1", read_endpoint),
+            Route("/health", read_endpoint),
+        ],
+        middleware=[Middleware(
+            QuotaMiddleware, store=store, paths=["/api/v1"], budget_paths=["/api/v1/process-invoice", "/api/v1/jobs"],
+            authenticate=ApiKeyIndex(load_keys).authenticate
+        )]
+    )
+    return TestClient(app)
+
+def test_rate_limit_answers_429_with_retry_after():
+    store = MemoryQuotaStore(0.5, 2, 0)
+    with quota_client(store) as client:
+        assert client.get("/api/v1/jobs/1").status_code == 200
+        assert client.get("/api/v1/jobs/1").status_code == 200
+        response = client.get("/api/v1/jobs/1")
+        # Paths outside the API are never limited
+        assert client.get("/health").status_code == 200
+
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    assert response.headers["Retry-After"] == "2"
+    assert store.stats()["rejected"] == {"rate": 1, "tokens": 0}
+
+def test_rejections_carry_cors_headers():
+    # The app's own middleware order, with a limit the second request hits
+    probe = (
+        "from fastapi.testclient import TestClient; import finzup_api.main as main; "
+        "client = TestClient(main.app, headers={'Origin': 'https://app.example.com'}); "
+        "client.get('/api/v1/jobs/x'); response = client.get('/api/v1/jobs/x'); "
+        "print(response.status_code, response.headers.get('retry-after'), response.headers.get('access-control-allow-origin'))"
+    )
+    env = {**os.environ, "QUOTA_BACKEND": "memory", "QUOTA_REQUESTS_PER_SECOND": "0.001", "QUOTA_BURST": "1"}
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, env=env).stdout
+    status, retry_after, allow_origin = output.strip().splitlines()[-1].split()
+    assert status == "429"
+    assert int(retry_after) > 0
+    assert allow_origin != "None"
+
+def test_tenants_are_limited_separately():
+    store = MemoryQuotaStore(0.001, 1, 0)
+    with quota_client(store) as client:
+        assert client.get("/api/v1/jobs/1", headers={"X-API-Key": "fz_a"}).status_code == 200
+        assert client.get("/api/v1/jobs/1", headers={"X-API-Key": "fz_a"}).status_code == 429
+        assert client.get("/api/v1/jobs/1", headers={"X-API-Key": "fz_b"}).status_code == 200
+    assert len(store) == 2
+
+def test_unknown_keys_share_the_address_tenant():
+    store = MemoryQuotaStore(0.001, 1, 0)
+    with quota_client(store) as client:
+        assert client.get("/api/v1/jobs/1", headers={"X-API-Key": "fz_made-up-1"}).status_code == 200
+        # A fresh made-up key doesn't get a fresh bucket
+        assert client.get("/api/v1/jobs/1", headers={"X-API-Key": "fz_made-up-2"}).status_code == 429
+        assert client.get("/api/v1/jobs/1").status_code == 429
+    assert len(store) == 1
+
+def test_token_budget_is_charged_from_usage_and_only_guards_model_routes():
+    store = MemoryQuotaStore(0, 1, 2500)
+    with quota_client(store) as client:
+        for _ in range(3):
+            assert client.post("/api/v1/process-invoice").status_code == 200
+        response = client.post("/api/v1/process-invoice")
+        # Polling a job does not need budget
+        assert client.get("/api/v1/jobs/1").status_code == 200
+
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Model token budget exhausted"}
+    assert int(response.headers["Retry-After"]) > 0
+    assert store.tokens_charged == 3000
+
+def test_budget_retry_after_waits_for_the_previous_window_to_slide_out():
+    window = 3600
+    # 1000 carried over, 600 this window, budget 1200: usage drops to 1200 once 40% of the window has passed
+    assert quotas.window_usage(1000, 600, 1800, window) == 1100
+    assert quotas.budget_retry_after(1000, 600, 1200, 900, window) == pytest.approx(1440 - 900)
+    # Over budget within this window alone: next window, plus the decay of what it carries over
+    assert quotas.budget_retry_after(0, 2400, 1200, 600, window) == pytest.approx(3000 + 1800)
+
+@pytest.mark.asyncio
+async def test_memory_store_rolls_windows_and_evicts_idle_tenants(monkeypatch):
+    now = [7200.0]
+    monkeypatch.setattr(quotas.time, "time", lambda: now[0])
+    store = MemoryQuotaStore(0, 1, 1000, window=3600, max_tenants=2)
+
+    await store.charge("a", 1000)
+    with pytest.raises(QuotaExceeded):
+        await store.admit("a")
+    now[0] += 3600 + 1800
+    # Half of the previous window still counts
+    await store.admit("a")
+    await store.charge("a", 500)
+    with pytest.raises(QuotaExceeded):
+        await store.admit("a")
+
+    await store.admit("b")
+    await store.admit("c")
+    assert len(store) == 2
+    await store.admit("a")
+
+@pytest.mark.asyncio
+async def test_resolve_tenant():
+    authenticate = ApiKeyIndex(load_keys).authenticate
+    scope = {"type": "http", "headers": [], "client": ("10.0.0.1", 5000)}
+    assert await quotas.resolve_tenant(scope, authenticate) == "ip:10.0.0.1"
+
+    token = create_access_token("ada@example.com")
+    scope["headers"] = [(b"authorization", f"Bearer {token}".encode())]
+    assert await quotas.resolve_tenant(scope, authenticate) == "user:ada@example.com"
+
+    scope["headers"].append((b"x-api-key", b"fz_unknown"))
+    assert await quotas.resolve_tenant(scope, authenticate) == "user:ada@example.com"
+
+    scope["headers"][-1] = (b"x-api-key", b"fz_a")
+    assert await quotas.resolve_tenant(scope, authenticate) == "key:" + hash_api_key("fz_a")[:16]
+    # Without a lookup, keys aren't trusted at all
+    assert await quotas.resolve_tenant(scope) == "user:ada@example.com"
+
+def test_store_errors_let_requests_through():
+    class BrokenStore(MemoryQuotaStore):
+        async def _admit(self, tenant, check_budget, now):
+            raise ConnectionError("redis down")
+
+    with quota_client(BrokenStore(1, 1, 1000)) as client:
+        assert client.post("/api/v1/process-invoice").status_code == 200
+
+@pytest.mark.asyncio
+async def test_jobs_charge_the_submitting_tenant(monkeypatch):
+    store = MemoryQuotaStore(0, 1, 10_000)
+
+    async def fake_process_invoice(*args, **kwargs):
+        await quotas.charge_usage({"total_tokens": 1234})
+        return "result"
+
+    monkeypatch.setattr(main, "process_invoice", fake_process_invoice)
+    monkeypatch.setattr(main.audit_writer, "submit", lambda row: None)
+    monkeypatch.setattr(main, "build_audit_log", lambda *args: None)
+    # Runs outside any request, as a job worker does
+    await asyncio.create_task(main.run_invoice_job(b"x", "pdf", "a.pdf", quota=(store, "key:abc")))
+    assert store.tokens_charged == 1234
+    assert store._tenants["key:abc"].current == 1234
+
+@pytest.mark.asyncio
+async def test_redis_store_shares_state(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr("redis.asyncio.from_url", lambda url: fakeredis.FakeAsyncRedis(server=server))
+    first = quotas.RedisQuotaStore("redis://fake", 0.001, 2, 1000)
+    second = quotas.RedisQuotaStore("redis://fake", 0.001, 2, 1000)
+
+    await first.admit("t")
+    await second.admit("t")
+    with pytest.raises(QuotaExceeded) as rate:
+        await first.admit("t", check_budget=False)
+    assert rate.value.reason == "rate"
+
+    await second.charge("u", 1500)
+    with pytest.raises(QuotaExceeded) as tokens:
+        await first.admit("u")
+    assert tokens.value.reason == "tokens"
+    assert tokens.value.retry_after > 0
+    await first.close()
+    await second.close()
@@ -0,0 +1,180 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from finzup_api import main, services
+from finzup_api.audit import AuditLogWriter
+from finzup_api.backends import FakeBackend, FakeBackendError
+from finzup_api.cache import NullCache
+from finzup_api.resilience import (
+    BackendUnavailable, CallLimiter, CircuitBreaker, CircuitOpenError, ResilientBackend
+)
+from tests.test_documents import make_jpeg
+
+class FlakyBackend(FakeBackend):
+    """Fails the first ``failures`` calls with ``status``, then succeeds."""
+
+    def __init__(self, failures, status=429, latency=0.0):
+        super().__init__(latency=latency)
+        self.failures = failures
+        self.status = status
+
+    async def extract(self, messages):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.calls <= self.failures:
+            raise FakeBackendError(f"HTTP {self.status}", self.status)
+        return self.invoice.model_copy(deep=True), self._usage(messages)
+
+def make_resilient(backend, max_retries=3, failure_threshold=100, reset_timeout=30.0, timeout=5.0, max_concurrency=8):
+    return ResilientBackend(
+        backend,
+        CallLimiter(max_concurrency=max_concurrency, tokens_per_minute=0, estimated_tokens=0),
+        CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout),
+        timeout=timeout,
+        max_retries=max_retries,
+        base_delay=0.001,
+        max_delay=0.01
+    )
+
+def test_retries_transient_errors():
+    inner = FlakyBackend(failures=2)
+    backend = make_resilient(inner)
+    invoice, usage = asyncio.run(backend.extract([]))
+    assert inner.calls == 3
+    assert backend.retries == 2
+    assert usage["fake"]["total_tokens"] > 0
+
+def test_gives_up_with_retry_after():
+    inner = FlakyBackend(failures=10)
+    backend = make_resilient(inner, max_retries=2)
+    with pytest.raises(BackendUnavailable) as exc_info:
+        asyncio.run(backend.extract([]))
+    assert inner.calls == 3
+    assert exc_info.value.retry_after >= 1
+
+def test_does_not_retry_client_errors():
+    inner = FlakyBackend(failures=1, status=400)
+    backend = make_resilient(inner)
+    with pytest.raises(FakeBackendError):
+        asyncio.run(backend.extract([]))
+    assert inner.calls == 1
+    assert backend.breaker.failures == 0
+
+def test_timeouts_are_retried():
+    inner = FakeBackend(latency=0.2)
+    backend = make_resilient(inner, max_retries=1, timeout=0.01)
+    with pytest.raises(BackendUnavailable):
+        asyncio.run(backend.extract([]))
+    assert inner.calls == 2
+
+def test_circuit_opens_and_fails_fast():
+    inner = FlakyBackend(failures=3)
+    backend = make_resilient(inner, max_retries=0, failure_threshold=3, reset_timeout=0.1)
+    for _ in range(3):
+        with pytest.raises(BackendUnavailable):
+            asyncio.run(backend.extract([]))
+    assert backend.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(backend.extract([]))
+    assert inner.calls == 3
+
+    # After the reset timeout a trial call goes through and closes the circuit
+    time.sleep(0.1)
+    asyncio.run(backend.extract([]))
+    assert backend.breaker.state == "closed"
+
+def test_limits_calls_in_flight():
+    inner = FakeBackend(latency=0.02)
+    in_flight = peak = 0
+    original = inner.extract
+
+    async def tracking_extract(messages):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await original(messages)
+        finally:
+            in_flight -= 1
+
+    inner.extract = tracking_extract
+    backend = make_resilient(inner, max_concurrency=3)
+
+    async def run():
+        await asyncio.gather(*(backend.extract([]) for _ in range(10)))
+
+    asyncio.run(run())
+    assert peak == 3
+
+def test_token_budget_tracks_actual_usage():
+    limiter = CallLimiter(max_concurrency=4, tokens_per_minute=1000, estimated_tokens=600, window=0.2)
+
+    async def run():
+        first = await limiter.acquire()
+        assert limiter.tokens_in_window() == 600
+        # The estimate is replaced by the real spend once the call returns
+        limiter.release(first, 100)
+        assert limiter.tokens_in_window() == 100
+        second = await limiter.acquire()
+        limiter.release(second, 900)
+        # 1000 tokens spent: the next call waits for the window to roll over
+        start = time.perf_counter()
+        third = await limiter.acquire()
+        limiter.release(third, 0)
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) >= 0.15
+
+def test_cancelled_waiter_passes_its_wakeup_on():
+    limiter = CallLimiter(max_concurrency=1, tokens_per_minute=0, estimated_tokens=0)
+
+    async def run():
+        held = await limiter.acquire()
+        first = asyncio.create_task(limiter.acquire())
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["waiting"] == 2
+        # Wake the first waiter, then cancel it before it gets to run
+        limiter.release(held, 0)
+        first.cancel()
+        reservation = await asyncio.wait_for(second, 1)
+        limiter.release(reservation, 0)
+        return limiter.stats()
+
+    stats = asyncio.run(run())
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0
+
+def test_unavailable_backend_returns_503(monkeypatch):
+    async def fake_insert(logs):
+        return logs
+
+    backend = make_resilient(FlakyBackend(failures=100), max_retries=0)
+    monkeypatch.setattr(services, "backend", backend)
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(main, "audit_writer", AuditLogWriter(fake_insert))
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/v1/process-invoice",
+            files={"file": ("invoice.jpg", make_jpeg(), "image/jpeg")}
+        )
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+def test_gemini_client_leaves_retries_to_the_resilient_backend(monkeypatch):
+    from finzup_api.backends import GeminiBackend
+    captured = {}
+
+    class Model:
+        def with_structured_output(self, schema):
+            return self
+
+    def init_chat_model(**kwargs):
+        captured.update(kwargs)
+        return Model()
+
+    monkeypatch.setattr("langchain.chat_models.init_chat_model", init_chat_model)
+    GeminiBackend(main.settings).runnable
+    assert captured["max_retries"] == 0
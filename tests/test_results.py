@@ -0,0 +1,109 @@
+import pytest
+from finzup_api import results
+from finzup_api.results import ResultStore
+
+INVOICE = {"invoiceNumber": 10088979, "supplier": {"name": "ספק בע\"מ"}, "items": [{"description": "חלב", "quantity": 2}]}
+
+class FakeTable:
+    """In-memory ``audit_results``; upserts ignore keys already present, like the real one."""
+
+    def __init__(self):
+        self.rows = {}
+        self.saves = 0
+        self.loads = 0
+
+    async def save(self, rows):
+        self.saves += 1
+        for row in rows:
+            self.rows.setdefault(row["key"], row)
+
+    async def load(self, keys):
+        self.loads += 1
+        return [self.rows[key] for key in keys if key in self.rows]
+
+def make_row(i, output):
+    return {"file_name": f"invoice-{i}.pdf", "status": "success", "output_data": output}
+
+def test_key_ignores_dict_order():
+    reordered = {"items": INVOICE["items"], "supplier": INVOICE["supplier"], "invoiceNumber": 10088979}
+    assert results.result_key(results.canonical_json(INVOICE)) == results.result_key(results.canonical_json(reordered))
+
+@pytest.mark.asyncio
+async def test_duplicate_results_are_stored_once():
+    table = FakeTable()
+    store = ResultStore(table.save, table.load)
+    rows = [make_row(0, INVOICE), make_row(1, dict(INVOICE)), make_row(2, None)]
+
+    written = await store.externalize(rows)
+    assert len(table.rows) == 1
+    assert written[0]["output_key"] == written[1]["output_key"]
+    assert written[0]["output_data"] is None
+    assert written[2]["output_key"] is None
+    # The caller's rows still carry their results, for spilling a failed batch
+    assert rows[0]["output_data"] == INVOICE
+
+    # Seen before in this process: no upsert at all
+    await store.externalize([make_row(3, INVOICE)])
+    assert table.saves == 1
+    assert store.stats()["stored"] == 1 and store.stats()["deduplicated"] == 2
+
+@pytest.mark.asyncio
+async def test_rehydrate_fetches_each_result_once():
+    table = FakeTable()
+    store = ResultStore(table.save, table.load, cache_size=10)
+    other = {**INVOICE, "invoiceNumber": 1}
+    written = await store.externalize([make_row(0, INVOICE), make_row(1, other), make_row(2, INVOICE)])
+
+    page = await store.rehydrate([dict(row) for row in written])
+    assert [row["output_data"] for row in page] == [INVOICE, other, INVOICE]
+    assert table.loads == 1
+    await store.rehydrate([dict(row) for row in written])
+    assert table.loads == 1
+    assert store.stats()["cache_hits"] == 2
+
+@pytest.mark.asyncio
+async def test_rows_from_before_the_migration_are_left_alone():
+    table = FakeTable()
+    store = ResultStore(table.save, table.load)
+    rows = [{"id": "1", "output_data": INVOICE}, {"id": "2", "output_data": None, "output_key": "f" * 64}]
+    page = await store.rehydrate(rows)
+    assert page[0]["output_data"] == INVOICE
+    assert page[1]["output_data"] is None
+    assert store.stats()["missing"] == 1
+
+@pytest.mark.asyncio
+async def test_zstd_results_round_trip():
+    pytest.importorskip("zstandard")
+    table = FakeTable()
+    store = ResultStore(table.save, table.load, compression="zstd", cache_size=0)
+    big = {**INVOICE, "items": INVOICE["items"] * 50}
+    written = await store.externalize([make_row(0, big)])
+
+    stored = table.rows[written[0]["output_key"]]
+    assert stored["encoding"] == "zstd"
+    assert len(stored["data"]) < stored["size"] / 4
+    assert (await store.rehydrate(written))[0]["output_data"] == big
+    # A store reading with compression off still decodes what was written compressed
+    assert (await ResultStore(table.save, table.load).rehydrate([dict(written[0], output_data=None)]))[0]["output_data"] == big
+
+def test_unknown_compression_is_rejected():
+    with pytest.raises(ValueError):
+        ResultStore(None, None, compression="lz4")
+
+@pytest.mark.asyncio
+async def test_audit_rows_reference_results_stored_first(monkeypatch):
+    calls = []
+
+    async def store_results(rows):
+        calls.append(("audit_results", rows))
+
+    async def create_audit_logs(rows):
+        calls.append(("audit_logs", rows))
+        return rows
+
+    monkeypatch.setattr(results, "result_store", ResultStore(store_results, None))
+    monkeypatch.setattr(results.db, "create_audit_logs", create_audit_logs)
+    await results.insert_audit_logs([make_row(0, INVOICE)])
+
+    assert [table for table, _ in calls] == ["audit_results", "audit_logs"]
+    assert calls[1][1][0]["output_key"] == calls[0][1][0]["key"]
@@ -0,0 +1,33 @@
+import sys
+from finzup_api import server
+
+def test_workers_default_to_usable_cpus(monkeypatch):
+    monkeypatch.setattr(server.settings, "WEB_CONCURRENCY", None)
+    assert server.default_workers() == server.usable_cpus() >= 1
+    monkeypatch.setattr(server.settings, "WEB_CONCURRENCY", 3)
+    assert server.parse_args([]).workers == 3
+
+def test_gunicorn_forks_workers_from_a_preloaded_master():
+    args = server.parse_args(["--workers", "4", "--port", "9000", "--graceful-timeout", "12.5"])
+    options = server.gunicorn_options(args)
+    assert options["bind"] == "0.0.0.0:9000"
+    assert options["workers"] == 4
+    assert options["preload_app"] is True
+    # Requests, then jobs, then the final flushes must all fit before gunicorn kills the worker
+    assert options["graceful_timeout"] == 25 + server.SHUTDOWN_FLUSH_SECONDS
+
+def test_preload_skips_missing_modules():
+    assert server.preload(["json", "finzup_no_such_module"]) == ["json"]
+    assert "json" in sys.modules
+
+def test_several_workers_need_a_shared_job_store(monkeypatch):
+    monkeypatch.setattr(server.settings, "JOB_STORE_PATH", "")
+    # main() publishes the graceful timeout; restored after the test
+    monkeypatch.setattr(server.settings, "GRACEFUL_SHUTDOWN_SECONDS", server.settings.GRACEFUL_SHUTDOWN_SECONDS)
+    monkeypatch.setenv("GRACEFUL_SHUTDOWN_SECONDS", str(server.settings.GRACEFUL_SHUTDOWN_SECONDS))
+    started = []
+    monkeypatch.setattr(server, "run_uvicorn", started.append)
+    monkeypatch.setattr(server, "run_gunicorn", started.append)
+    assert server.main(["--workers", "2"]) == 2
+    assert server.main(["--workers", "1"]) == 0
+    assert len(started) == 1
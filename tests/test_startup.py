@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from finzup_api import services
+from finzup_api.backends import GeminiBackend
+
+# Heavy client libraries are only loaded when a request (or the lifespan) needs them
+LAZY_MODULES = ["supabase", "langchain_google_genai", "passlib.handlers.bcrypt"]
+
+def test_importing_the_app_does_not_build_clients():
+    probe = (
+        "import sys; import finzup_api.main; "
+        f"print([m for m in {LAZY_MODULES!r} if m in sys.modules])"
+    )
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    assert output.strip().splitlines()[-1] == "[]"
+
+def test_structured_runnable_is_built_once():
+    backend = GeminiBackend(services.settings)
+    assert backend._runnable is None
+    backend.warm_up()
+    runnable = backend.runnable
+    assert runnable is not None
+    assert backend.runnable is runnable
@@ -0,0 +1,86 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from finzup_api import main, services
+from finzup_api.audit import AuditLogWriter
+from finzup_api.backends import FakeBackend
+from finzup_api.cache import NullCache
+from finzup_api.streaming import PartialInvoiceTracker, format_sse
+from tests.test_documents import make_jpeg, make_pdf
+from tests.test_resilience import make_resilient
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_insert(logs):
+        return logs
+
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(main, "audit_writer", AuditLogWriter(fake_insert))
+    with TestClient(main.app) as client:
+        yield client
+
+def stream(client, content=None, name="invoice.jpg"):
+    response = client.post(
+        "/api/v1/process-invoice/stream",
+        files={"file": (name, content or make_jpeg(), "application/octet-stream")}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return parse_sse(response.text)
+
+def test_format_sse():
+    assert format_sse("item", {"a": "שלום"}) == 'event: item\ndata: {"a": "שלום"}\n\n'.encode("utf-8")
+
+def test_tracker_emits_header_then_complete_items():
+    tracker = PartialInvoiceTracker()
+    assert tracker.update({"invoiceNumber": 1}) == []
+    assert tracker.update({"invoiceNumber": 12, "items": [{"description": "a"}]}) == [
+        ("header", {"invoiceNumber": 12})
+    ]
+    assert tracker.update({"invoiceNumber": 12, "items": [{"description": "a"}, {"desc": "b"}]}) == [
+        ("item", {"index": 0, "item": {"description": "a"}})
+    ]
+    final = {"invoiceNumber": 12, "items": [{"description": "a"}, {"description": "b"}], "totalAmountNis": 3}
+    assert tracker.update(final, final=True) == [("item", {"index": 1, "item": {"description": "b"}})]
+
+def test_streams_progress_then_result(client, monkeypatch):
+    backend = FakeBackend(latency=0.03)
+    monkeypatch.setattr(services, "backend", backend)
+
+    events = stream(client)
+    names = [name for name, _ in events]
+    assert names == [
+        "accepted", "document_parsed", "pages_rendered", "model_started", "header", "item", "item",
+        "validation", "result"
+    ]
+    header = events[4][1]
+    assert header["invoiceNumber"] == backend.invoice.invoiceNumber
+    assert "items" not in header
+    assert [data["index"] for name, data in events if name == "item"] == [0, 1]
+    assert events[-2][1]["valid"]
+    result = events[-1][1]
+    assert result["invoice_data"]["totalAmountNis"] == backend.invoice.totalAmountNis
+    assert result["usage_metadata"]["fake"]["total_tokens"] > 0
+
+def test_multi_page_documents_stream_one_combined_call(client, monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(services, "backend", backend)
+
+    events = dict(stream(client, make_pdf(3), "invoice.pdf"))
+    assert events["pages_rendered"]["pages"] == 3
+    assert backend.calls == 1
+
+def test_unavailable_backend_streams_error(client, monkeypatch):
+    monkeypatch.setattr(services, "backend", make_resilient(FakeBackend(error_rate=1.0), max_retries=1))
+
+    name, data = stream(client)[-1]
+    assert name == "error"
+    assert data["status_code"] == 503
+    assert data["retry_after"] >= 1
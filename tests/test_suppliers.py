@@ -0,0 +1,136 @@
+import io
+import random
+import threading
+
+import pytest
+from PIL import Image, ImageDraw
+
+from finzup_api import services
+from finzup_api.cache import NullCache
+from finzup_api.documents import prepare_document
+from finzup_api.models import InvoiceData
+from finzup_api.suppliers import HammingIndex, SupplierIndex, dhash, hamming
+from finzup_api.validation import validate_invoice
+from tests.test_documents import RecordingBackend
+from tests.test_validation import MisreadingBackend
+
+def make_invoice_page(layout: int, line_items: int = 5, quality: int = 90) -> bytes:
+    """A white page with a supplier-specific header block and varying item rows below it."""
+    rng = random.Random(layout)
+    image = Image.new("RGB", (600, 800), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(20, 500), rng.randrange(20, 160)
+        draw.rectangle((x, y, x + rng.randrange(30, 90), y + rng.randrange(10, 40)), fill=(rng.randrange(160), 0, 0))
+    for row in range(line_items):
+        draw.rectangle((40, 260 + row * 30, 40 + 60 * (row % 7 + 1), 270 + row * 30), fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+def fingerprint(content: bytes) -> int:
+    return dhash(Image.open(io.BytesIO(content)))
+
+def test_hamming_index_matches_linear_scan():
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(2000)]
+    fingerprints = HammingIndex()
+    for i, value in enumerate(values):
+        fingerprints.add(value, i)
+    assert len(fingerprints) == len(values)
+    for _ in range(50):
+        query = rng.choice(values) ^ (1 << rng.randrange(64)) if rng.random() < 0.5 else rng.getrandbits(64)
+        expected = sorted((hamming(query, value), i) for i, value in enumerate(values) if hamming(query, value) <= 12)
+        assert sorted(fingerprints.search(query, 12)) == expected
+
+def test_same_layout_matches_despite_different_items():
+    first = fingerprint(make_invoice_page(1, line_items=3))
+    # Another invoice from the same supplier: other items, lower scan quality
+    second = fingerprint(make_invoice_page(1, line_items=9, quality=40))
+    other = fingerprint(make_invoice_page(2, line_items=3))
+    assert hamming(first, second) <= 10
+    assert hamming(first, other) > 10
+
+def test_pdf_and_image_pages_are_fingerprinted():
+    document = prepare_document(make_invoice_page(1), "jpeg", header_fraction=0.25)
+    assert document.fingerprint is not None
+    assert prepare_document(make_invoice_page(1), "jpeg").fingerprint is None
+
+def test_index_learns_only_from_valid_invoices(tmp_path, sample_invoice):
+    index = SupplierIndex(str(tmp_path / "templates.jsonl"))
+    invoice = InvoiceData.model_validate(sample_invoice)
+    broken = invoice.model_copy(update={"totalAmountNis": 999.0})
+    index.learn(1234, broken, validate_invoice(broken, [0.18], 0.05, 1.0))
+    assert len(index) == 0
+
+    index.learn(1234, invoice, validate_invoice(invoice, [0.18], 0.05, 1.0))
+    index.learn(1234 ^ 0b101, invoice, validate_invoice(invoice, [0.18], 0.05, 1.0))
+    assert len(index) == 1
+    template, distance = index.match(1234 ^ 0b1)
+    assert distance == 1
+    assert template.seen == 2
+    assert template.supplier["name"] == "Supplier"
+    assert index.match(~1234 & (2 ** 64 - 1)) is None
+
+    # The log is replayed on start; later snapshots replace earlier ones
+    reloaded = SupplierIndex(str(tmp_path / "templates.jsonl"))
+    assert len(reloaded) == 1
+    assert reloaded.match(1234)[0].seen == 2
+
+def test_workers_share_the_template_log(tmp_path, sample_invoice):
+    fcntl = pytest.importorskip("fcntl")
+    path = tmp_path / "templates.jsonl"
+    invoice = InvoiceData.model_validate(sample_invoice)
+    validation = validate_invoice(invoice, [0.18], 0.05, 1.0)
+    first, second = SupplierIndex(str(path)), SupplierIndex(str(path))
+    for _ in range(4):
+        first.learn(1234, invoice, validation)
+    second.learn(~1234 & (2 ** 64 - 1), invoice, validation)
+
+    # A worker starting up compacts the log under the lock, keeping what every worker appended
+    third = SupplierIndex(str(path))
+    assert len(third) == 2
+    assert len(path.read_text().splitlines()) == 2
+
+    # Appends wait for whoever holds the lock, e.g. a worker compacting
+    with open(str(path) + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        writer = threading.Thread(target=first.learn, args=(1234, invoice, validation))
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+    writer.join()
+    assert len(path.read_text().splitlines()) == 3
+
+@pytest.mark.asyncio
+async def test_known_supplier_hint_is_added_to_the_prompt(monkeypatch):
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(services, "supplier_index", SupplierIndex())
+    backend = RecordingBackend(invoice=None)
+    monkeypatch.setattr(services, "backend", backend)
+
+    first = make_invoice_page(3, line_items=2)
+    result = await services.process_invoice(first, "jpeg", "first.jpeg", len(first))
+    assert result.validation.valid
+    assert result.supplier_template is None
+    assert "known supplier" not in backend.messages[0][0].content[0]
+    assert len(services.supplier_index) == 1
+
+    second = make_invoice_page(3, line_items=8)
+    result = await services.process_invoice(second, "jpeg", "second.jpeg", len(second))
+    prompt = backend.messages[1][0].content[0]
+    assert result.supplier_template == next(iter(services.supplier_index.templates))
+    assert "known supplier" in prompt
+    assert "7290119371105" in prompt
+    assert services.supplier_index.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_unvalidated_extraction_is_not_learned(monkeypatch):
+    monkeypatch.setattr(services, "result_cache", NullCache())
+    monkeypatch.setattr(services, "supplier_index", SupplierIndex())
+    monkeypatch.setattr(services.settings, "VALIDATION_REEXTRACT", False)
+    monkeypatch.setattr(services, "backend", MisreadingBackend())
+    content = make_invoice_page(4)
+    result = await services.process_invoice(content, "jpeg", "invoice.jpeg", len(content))
+    assert not result.validation.valid
+    assert len(services.supplier_index) == 0
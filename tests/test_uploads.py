@@ -0,0 +1,127 @@
+import asyncio
+import tempfile
+import tracemalloc
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from finzup_api import main
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from finzup_api.uploads import UploadRejected, UploadSizeLimitMiddleware, read_upload_limited, sniff_file_type
+from tests.test_documents import make_jpeg, make_pdf
+
+client = TestClient(main.app)
+
+def make_upload(content: bytes, file_name: str = "invoice.pdf") -> UploadFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=1024)
+    spool.write(content)
+    spool.seek(0)
+    return UploadFile(spool, filename=file_name)
+
+def test_sniff_file_type():
+    assert sniff_file_type(make_pdf(1)[:64]) == "pdf"
+    assert sniff_file_type(make_jpeg()[:64]) == "jpeg"
+    assert sniff_file_type(b"\x89PNG\r\n\x1a\n....") == "png"
+    assert sniff_file_type(b"MZ\x90\x00 not a document") is None
+
+@pytest.mark.asyncio
+async def test_read_upload_returns_content_and_sniffed_type():
+    content = make_pdf(1)
+    data, file_type = await read_upload_limited(make_upload(content), len(content), {"pdf"})
+    assert data == content
+    assert file_type == "pdf"
+
+@pytest.mark.asyncio
+async def test_read_upload_rejects_wrong_magic_before_buffering():
+    upload = make_upload(b"PK\x03\x04" + b"\x00" * 1_000_000)
+    with pytest.raises(UploadRejected, match="not a supported"):
+        await read_upload_limited(upload, 10_000_000, {"pdf", "jpeg"})
+    # Only the first chunk was read
+    assert upload.file.tell() <= 64 * 1024
+
+@pytest.mark.asyncio
+async def test_peak_memory_bounded_under_concurrent_oversized_uploads():
+    max_size = 1024 * 1024
+    upload_size = 20 * max_size
+    uploads = []
+    for _ in range(8):
+        upload = make_upload(b"%PDF-1.7\n")
+        upload.file.seek(upload_size - 1)
+        upload.file.write(b"\n")
+        upload.file.seek(0)
+        uploads.append(upload)
+
+    tracemalloc.start()
+    results = await asyncio.gather(
+        *(read_upload_limited(u, max_size, {"pdf"}) for u in uploads),
+        return_exceptions=True
+    )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert all(isinstance(r, UploadRejected) for r in results)
+    # Each reader holds at most the limit plus one chunk, never the whole 20 MiB upload
+    assert peak < len(uploads) * (max_size + 2 * 64 * 1024) * 1.5
+    assert peak < upload_size
+
+def make_limited_app(calls):
+    async def upload(request):
+        calls.append(len(await request.body()))
+        return JSONResponse({"ok": True})
+
+    return Starlette(
+        routes=[Route("/upload", upload, methods=["POST"])],
+        middleware=[Middleware(UploadSizeLimitMiddleware, max_body_size=100, paths=["/upload"])]
+    )
+
+def test_middleware_rejects_declared_length_without_reading_body():
+    calls = []
+    response = TestClient(make_limited_app(calls)).post("/upload", content=b"x" * 1000)
+    assert response.status_code == 400
+    assert calls == []
+
+def test_middleware_cuts_off_chunked_body():
+    calls = []
+
+    def body():
+        for _ in range(100):
+            yield b"x" * 50
+
+    response = TestClient(make_limited_app(calls)).post("/upload", content=body())
+    assert response.status_code == 400
+    assert calls == []
+
+def test_endpoint_rejects_oversized_upload(monkeypatch):
+    monkeypatch.setattr(main.settings, "MAX_UPLOAD_SIZE", 1024)
+    body = b"%PDF-" + b"0" * (main.settings.MAX_UPLOAD_SIZE * 100)
+    response = client.post(
+        "/api/v1/process-invoice",
+        files={"file": ("invoice.pdf", body, "application/pdf")}
+    )
+    assert response.status_code == 400
+    assert "File too large" in response.json()["detail"]
+
+def test_size_rejection_carries_cors_headers():
+    limit = main.settings.MAX_UPLOAD_SIZE + main.MULTIPART_OVERHEAD
+    response = client.post(
+        "/api/v1/process-invoice",
+        content=b"x",
+        headers={
+            "Origin": "https://app.example.com",
+            "Content-Type": "multipart/form-data; boundary=x",
+            "Content-Length": str(limit + 1),
+        }
+    )
+    assert response.status_code == 400
+    assert "File too large" in response.json()["detail"]
+    assert "access-control-allow-origin" in response.headers
+
+def test_endpoint_rejects_content_that_is_not_a_document():
+    response = client.post(
+        "/api/v1/process-invoice",
+        files={"file": ("invoice.pdf", b"<html>not a pdf</html>", "application/pdf")}
+    )
+    assert response.status_code == 400
+    assert "not a supported" in response.json()["detail"]
@@ -0,0 +1,124 @@
+import pytest
+from fastapi.testclient import TestClient
+from finzup_api import main, services
+from finzup_api.backends import FAKE_INVOICE, FakeBackend
+from finzup_api.cache import NullCache
+from finzup_api.models import InvoiceCorrections, InvoiceData, ItemCorrection
+from finzup_api.validation import apply_corrections, correction_prompt, validate_invoice
+from tests.test_documents import make_jpeg
+
+VAT_RATES = [0.18, 0.17]
+
+def make_invoice(items, total):
+    return InvoiceData.model_validate({
+        **FAKE_INVOICE,
+        "items": [
+            {"description": f"item {i}", "quantity": q, "unitPriceNis": u, "totalPriceNis": t}
+            for i, (q, u, t) in enumerate(items)
+        ],
+        "totalAmountNis": total
+    })
+
+def validate(invoice):
+    return validate_invoice(invoice, VAT_RATES, item_tolerance=0.05, total_tolerance=1.0)
+
+@pytest.mark.parametrize("total, vat_rate", [(592.0, 0.0), (698.56, 0.18), (692.64, 0.17)])
+def test_totals_match_net_or_with_vat(total, vat_rate):
+    report = validate(make_invoice([(10, 34.2, 342.0), (2, 125.0, 250.0)], total))
+    assert report.valid
+    assert report.items_total == 592.0
+    assert report.vat_rate == vat_rate
+
+def test_mismatches_are_reported_per_field():
+    report = validate(make_invoice([(10, 3.42, 34.2), (2, 12.5, 52.0)], 150.0))
+    assert not report.valid
+    assert [issue.field for issue in report.issues] == ["items[1].totalPriceNis", "totalAmountNis"]
+    assert report.issues[0].expected == 25.0
+
+    prompt = correction_prompt(report)
+    assert "items[1]" in prompt
+    assert "items[0]" not in prompt
+    assert "totalAmountNis" in prompt
+
+def test_corrections_only_touch_requested_fields():
+    invoice = make_invoice([(10, 3.42, 34.2), (2, 12.5, 52.0)], 59.2)
+    report = validate(invoice)
+    corrections = InvoiceCorrections(
+        items=[
+            ItemCorrection(index=0, quantity=99),
+            ItemCorrection(index=1, totalPriceNis=25.0),
+        ],
+        totalAmountNis=59.2
+    )
+    corrected, changed = apply_corrections(invoice, report, corrections)
+    # Item 0 was not asked about, and the re-read total is unchanged
+    assert changed == ["items[1].totalPriceNis"]
+    assert corrected.items[0].quantity == 10
+    assert validate(corrected).valid
+    assert invoice.items[1].totalPriceNis == 52.0
+
+class MisreadingBackend(FakeBackend):
+    """First pass misreads one item total; the focused re-read gets it right."""
+
+    def __init__(self, misread: bool = True):
+        super().__init__()
+        self.misread = misread
+        self.correction_messages = []
+
+    async def extract(self, messages):
+        invoice, usage = await super().extract(messages)
+        if self.misread:
+            invoice.items[1].totalPriceNis = 52.0
+        return invoice, usage
+
+    async def extract_corrections(self, messages):
+        self.correction_messages.append(messages)
+        return await super().extract_corrections(messages)
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setattr(services, "result_cache", NullCache())
+
+@pytest.mark.asyncio
+async def test_failing_invoice_is_corrected_with_one_focused_call(monkeypatch, no_cache):
+    backend = MisreadingBackend()
+    monkeypatch.setattr(services, "backend", backend)
+    content = make_jpeg()
+    result = await services.process_invoice(content, "jpeg", "invoice.jpeg", len(content))
+
+    assert result.invoice_data.items[1].totalPriceNis == 25.0
+    assert result.validation.valid
+    assert result.validation.reextracted
+    assert result.validation.corrected_fields == ["items[1].totalPriceNis"]
+    assert backend.calls == 2
+    prompt = backend.correction_messages[0][0].content[0]
+    assert "items[1]" in prompt and "items[0]" not in prompt
+
+def test_validation_outcome_header(monkeypatch, no_cache):
+    monkeypatch.setattr(services, "backend", MisreadingBackend())
+    client = TestClient(main.app)
+    response = client.post("/api/v1/process-invoice", files={"file": ("invoice.jpeg", make_jpeg(), "image/jpeg")})
+    assert response.status_code == 200
+    assert response.headers["X-Invoice-Validation"] == "corrected"
+    assert response.json()["items"][1]["totalPriceNis"] == 25.0
+
+@pytest.mark.asyncio
+async def test_valid_invoice_costs_no_extra_call(monkeypatch, no_cache):
+    backend = MisreadingBackend(misread=False)
+    monkeypatch.setattr(services, "backend", backend)
+    content = make_jpeg()
+    result = await services.process_invoice(content, "jpeg", "invoice.jpeg", len(content))
+    assert result.validation.valid
+    assert not result.validation.reextracted
+    assert backend.calls == 1
+
+@pytest.mark.asyncio
+async def test_reextraction_can_be_disabled(monkeypatch, no_cache):
+    backend = MisreadingBackend()
+    monkeypatch.setattr(services, "backend", backend)
+    monkeypatch.setattr(services.settings, "VALIDATION_REEXTRACT", False)
+    content = make_jpeg()
+    result = await services.process_invoice(content, "jpeg", "invoice.jpeg", len(content))
+    assert not result.validation.valid
+    assert result.invoice_data.items[1].totalPriceNis == 52.0
+    assert backend.calls == 1